@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import PrevisaoSnapshot
 
-# Register your models here.
+class PrevisaoSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('gerado_em', 'total_vendas', 'ultima_venda_id', 'duracao_ms')
+    readonly_fields = ('gerado_em', 'hash_entrada', 'total_vendas', 'ultima_venda_id', 'desde', 'dados', 'duracao_ms')
+
+admin.site.register(PrevisaoSnapshot, PrevisaoSnapshotAdmin)
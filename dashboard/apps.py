@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
+
+from projetoIntegrador1.agendamento import processo_servidor
 
 
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    def ready(self):
+        if not settings.PREVISOES_AGENDADOR or not processo_servidor():
+            return
+
+        from dashboard.snapshots import iniciar_agendador
+        iniciar_agendador()
@@ -0,0 +1,169 @@
+"""Exportações CSV em streaming de vendas, recargas, estoque e reservas.
+
+As linhas são lidas em lotes de `TAMANHO_LOTE`, paginados pela ordenação
+(data, id), e escritas na resposta lote a lote, sem carregar o resultado
+inteiro em memória. Cada lote é uma consulta própria ao banco de relatórios,
+então nenhuma conexão ou cursor fica aberto entre um envio e outro.
+
+`linhas_csv` serve ao WSGI; sob ASGI, `alinhas_csv` busca cada lote numa
+thread (`sync_to_async`) e o servidor envia as linhas conforme são geradas.
+"""
+import csv
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, Q
+from django.utils.timezone import localtime
+
+from movimentacao.models import MovimentacaoEstoque, Recarga, ReservaProduto, Venda
+from projetoIntegrador1.roteamento import banco_relatorios
+
+# Linhas buscadas do banco por vez
+TAMANHO_LOTE = 2000
+
+# Cabeçalho -> campo de `values_list`
+Exportacao = namedtuple('Exportacao', ['queryset', 'campo_data', 'por_caixa', 'colunas'])
+
+EXPORTACOES = {
+    'vendas': Exportacao(
+        lambda: Venda.objects.order_by('data', 'id'),
+        'data',
+        True,
+        (
+            ('id', 'id'),
+            ('data', 'data'),
+            ('ficha', 'ficha__numero'),
+            ('caixa', 'caixa__nome'),
+            ('produto', 'produto__nome'),
+            ('categoria', 'categoria'),
+            ('quantidade', 'quantidade'),
+            ('valor_unitario', 'valor_unitario'),
+            ('valor_total', 'valor_total'),
+        ),
+    ),
+    'recargas': Exportacao(
+        lambda: Recarga.objects.order_by('data', 'id'),
+        'data',
+        True,
+        (
+            ('id', 'id'),
+            ('data', 'data'),
+            ('ficha', 'ficha__numero'),
+            ('caixa', 'caixa__nome'),
+            ('produto', 'produto__nome'),
+            ('valor', 'valor'),
+            ('observacoes', 'observacoes'),
+        ),
+    ),
+    'movimentacoes-estoque': Exportacao(
+        lambda: MovimentacaoEstoque.objects.order_by('data', 'id'),
+        'data',
+        True,
+        (
+            ('id', 'id'),
+            ('data', 'data'),
+            ('caixa', 'caixa__nome'),
+            ('produto', 'produto__nome'),
+            ('tipo', 'tipo'),
+            ('quantidade', 'quantidade'),
+        ),
+    ),
+    'reservas': Exportacao(
+        lambda: ReservaProduto.objects.order_by('data_reserva', 'id'),
+        'data_reserva',
+        False,
+        (
+            ('id', 'id'),
+            ('data_reserva', 'data_reserva'),
+            ('data_confirmacao', 'data_confirmacao'),
+            ('status', 'status'),
+            ('nome_completo', 'nome_completo'),
+            ('produto', 'produto__nome'),
+            ('quantidade', 'quantidade'),
+            ('ficha', 'ficha__numero'),
+            ('qr_code', 'qr_code_reserva__codigo'),
+        ),
+    ),
+}
+
+
+class _Eco:
+    """Pseudo-arquivo: `csv.writer` devolve a linha formatada em vez de gravá-la."""
+
+    def write(self, valor):
+        return valor
+
+
+def _formatar(valor, excel):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return localtime(valor).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(valor, Decimal) and excel:
+        return str(valor).replace('.', ',')
+    return valor
+
+
+def _ler_lote(exportacao, queryset, apos):
+    """Próximo lote de linhas, após a chave (data, id) `apos`."""
+    campo = exportacao.campo_data
+    if apos is not None:
+        data, pk = apos
+        if data is None:
+            queryset = queryset.filter(
+                Q(**{f'{campo}__isnull': True, 'id__gt': pk}) | Q(**{f'{campo}__isnull': False})
+            )
+        else:
+            queryset = queryset.filter(Q(**{f'{campo}__gt': data}) | Q(**{campo: data, 'id__gt': pk}))
+    campos = [campo for _, campo in exportacao.colunas]
+    with banco_relatorios():
+        return list(
+            queryset.order_by(F(campo).asc(nulls_first=True), 'id')
+            .values_list(campo, 'id', *campos)[:TAMANHO_LOTE]
+        )
+
+
+def _cabecalho(exportacao, escritor, excel):
+    if excel:
+        yield '\ufeff'
+    yield escritor.writerow([cabecalho for cabecalho, _ in exportacao.colunas])
+
+
+def _linhas(lote, escritor, excel):
+    # As duas primeiras colunas são a chave de paginação
+    return ''.join(escritor.writerow([_formatar(valor, excel) for valor in linha[2:]]) for linha in lote)
+
+
+def linhas_csv(exportacao, queryset, excel=False):
+    """Gera o CSV lote a lote.
+
+    `excel=True` usa `;`, vírgula decimal e BOM UTF-8, como o Excel em
+    português espera ao abrir o arquivo.
+    """
+    escritor = csv.writer(_Eco(), delimiter=';' if excel else ',')
+    yield from _cabecalho(exportacao, escritor, excel)
+    apos = None
+    while True:
+        lote = _ler_lote(exportacao, queryset, apos)
+        if lote:
+            yield _linhas(lote, escritor, excel)
+        if len(lote) < TAMANHO_LOTE:
+            return
+        apos = lote[-1][:2]
+
+
+async def alinhas_csv(exportacao, queryset, excel=False):
+    """Versão assíncrona de `linhas_csv`, para `StreamingHttpResponse` sob ASGI."""
+    escritor = csv.writer(_Eco(), delimiter=';' if excel else ',')
+    for parte in _cabecalho(exportacao, escritor, excel):
+        yield parte
+    apos = None
+    while True:
+        lote = await sync_to_async(_ler_lote)(exportacao, queryset, apos)
+        if lote:
+            yield _linhas(lote, escritor, excel)
+        if len(lote) < TAMANHO_LOTE:
+            return
+        apos = lote[-1][:2]
@@ -0,0 +1,92 @@
+"""Filtros de período, caixa e categoria compartilhados pelos relatórios."""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import localtime
+
+from movimentacao.models import Venda
+
+
+def _parse_limite(valor, fim=False):
+    """Converte data (AAAA-MM-DD) ou data/hora ISO em datetime com timezone.
+
+    Para datas simples, `fim=True` retorna o início do dia seguinte, de modo
+    que o limite final seja inclusivo para o dia informado.
+    """
+    data_hora = parse_datetime(valor)
+    if data_hora:
+        if timezone.is_naive(data_hora):
+            data_hora = timezone.make_aware(data_hora)
+        return data_hora
+
+    data = parse_date(valor)
+    if not data:
+        raise ValueError(valor)
+    if fim:
+        data += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def resolver_periodo(params):
+    """Retorna (desde, ate) a partir dos parâmetros da requisição.
+
+    Sem parâmetros, usa os últimos `DASHBOARD_JANELA_DIAS` dias até a data da
+    venda mais recente, cobrindo o evento ativo sem varrer o histórico todo.
+    """
+    desde = params.get('desde')
+    ate = params.get('ate')
+
+    desde = _parse_limite(desde) if desde else None
+    ate = _parse_limite(ate, fim=True) if ate else None
+
+    if desde is None:
+        referencia = ate
+        if referencia is None:
+            ultima_venda = Venda.objects.aggregate(ultima=Max('data'))['ultima']
+            referencia = ultima_venda or timezone.now()
+            dia_final = localtime(referencia).date() + timedelta(days=1)
+            referencia = timezone.make_aware(datetime.combine(dia_final, time.min))
+        desde = referencia - timedelta(days=settings.DASHBOARD_JANELA_DIAS)
+
+    return desde, ate
+
+
+def filtrar_vendas(queryset, params):
+    """Aplica período, caixa e categoria ao queryset de vendas."""
+    desde, ate = resolver_periodo(params)
+    queryset = queryset.filter(data__gte=desde)
+    if ate:
+        queryset = queryset.filter(data__lt=ate)
+
+    caixa = params.get('caixa')
+    if caixa:
+        queryset = queryset.filter(caixa_id=int(caixa))
+
+    categoria = params.get('categoria')
+    if categoria:
+        queryset = queryset.filter(categoria=categoria)
+
+    return queryset, desde, ate
+
+
+def filtrar_periodo(queryset, params, campo='data', por_caixa=True):
+    """Aplica `desde`/`ate` ao campo de data informado e, opcionalmente, `caixa`.
+
+    Diferente de `filtrar_vendas`, não há janela padrão: sem parâmetros o
+    queryset inteiro é mantido (usado pelas exportações completas).
+    """
+    desde = params.get('desde')
+    ate = params.get('ate')
+    if desde:
+        queryset = queryset.filter(**{f'{campo}__gte': _parse_limite(desde)})
+    if ate:
+        queryset = queryset.filter(**{f'{campo}__lt': _parse_limite(ate, fim=True)})
+
+    caixa = params.get('caixa')
+    if por_caixa and caixa:
+        queryset = queryset.filter(caixa_id=int(caixa))
+
+    return queryset
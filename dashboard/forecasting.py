@@ -0,0 +1,147 @@
+"""Motor de previsão vetorizado (NumPy) usado por dashboard.predictions.
+
+As vendas são carregadas uma única vez em formato colunar (dia local, hora
+local, produto, quantidade e valor) e todas as séries são montadas com
+operações de array, sem iterar venda a venda em Python.
+"""
+import numpy as np
+
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils.timezone import get_current_timezone
+
+# Peso da observação mais recente na suavização exponencial
+ALPHA_PADRAO = 0.5
+# Limites do fator sazonal por dia da semana, evitando extrapolações bruscas
+SAZONALIDADE_MIN = 0.5
+SAZONALIDADE_MAX = 2.0
+
+
+def dia_para_indice(data):
+    """Converte `date` em dias desde 1970-01-01."""
+    return int(np.datetime64(data, 'D').astype(np.int64))
+
+
+def dia_da_semana(indices):
+    """Dia da semana (segunda=0) para índices de dia; 1970-01-01 foi quinta."""
+    return (np.asarray(indices) + 3) % 7
+
+
+class SerieVendas:
+    """Vendas em colunas: um array NumPy por atributo."""
+
+    def __init__(self, dias, horas, produtos, quantidades, totais):
+        self.dias = np.asarray(dias, dtype=np.int64)
+        self.horas = np.asarray(horas, dtype=np.int64)
+        self.produtos = np.asarray(produtos, dtype=np.int64)
+        self.quantidades = np.asarray(quantidades, dtype=np.float64)
+        self.totais = np.asarray(totais, dtype=np.float64)
+
+    @classmethod
+    def vazia(cls):
+        return cls([], [], [], [], [])
+
+    @classmethod
+    def from_queryset(cls, vendas):
+        """Carrega as vendas com uma única consulta `values_list`.
+
+        Dia e hora são calculados pelo banco no fuso horário atual.
+        """
+        tz = get_current_timezone()
+        linhas = list(
+            vendas.order_by()
+            .annotate(
+                dia_local=TruncDate('data', tzinfo=tz),
+                hora_local=ExtractHour('data', tzinfo=tz),
+            )
+            .filter(dia_local__isnull=False)
+            .values_list('dia_local', 'hora_local', 'produto_id', 'quantidade', 'valor_total')
+        )
+        if not linhas:
+            return cls.vazia()
+
+        dias, horas, produtos, quantidades, totais = zip(*linhas)
+        return cls(
+            np.array(dias, dtype='datetime64[D]').astype(np.int64),
+            horas,
+            [produto or 0 for produto in produtos],
+            [quantidade or 0 for quantidade in quantidades],
+            [float(total or 0) for total in totais],
+        )
+
+    def __len__(self):
+        return len(self.dias)
+
+    def filtrar(self, mascara):
+        return SerieVendas(
+            self.dias[mascara],
+            self.horas[mascara],
+            self.produtos[mascara],
+            self.quantidades[mascara],
+            self.totais[mascara],
+        )
+
+    def contagem_por_hora(self):
+        return np.bincount(self.horas, minlength=24)[:24]
+
+    def matriz_diaria(self, valores=None):
+        """Soma `valores` (padrão: quantidades) por produto e por dia.
+
+        Retorna (produto_ids, dias, matriz) com matriz de forma
+        (len(produto_ids), len(dias)), contendo apenas dias com vendas.
+        """
+        if valores is None:
+            valores = self.quantidades
+        produto_ids, linha = np.unique(self.produtos, return_inverse=True)
+        dias, coluna = np.unique(self.dias, return_inverse=True)
+        matriz = np.zeros((len(produto_ids), len(dias)))
+        np.add.at(matriz, (linha, coluna), valores)
+        return produto_ids, dias, matriz
+
+
+def suavizacao_exponencial(matriz, alpha=ALPHA_PADRAO):
+    """Nível final da suavização exponencial simples para cada linha.
+
+    A iteração é feita sobre as colunas (dias); todas as séries (linhas)
+    são atualizadas de uma vez.
+    """
+    matriz = np.atleast_2d(np.asarray(matriz, dtype=np.float64))
+    if matriz.shape[1] == 0:
+        return np.zeros(matriz.shape[0])
+
+    nivel = matriz[:, 0].copy()
+    for coluna in range(1, matriz.shape[1]):
+        nivel = alpha * matriz[:, coluna] + (1 - alpha) * nivel
+    return nivel
+
+
+def sazonalidade_semanal(matriz, dias):
+    """Fator multiplicativo por dia da semana para cada linha da matriz.
+
+    O fator é a média do dia da semana dividida pela média geral da linha.
+    Dias da semana sem observação ficam com fator 1.
+    """
+    matriz = np.atleast_2d(np.asarray(matriz, dtype=np.float64))
+    fatores = np.ones((matriz.shape[0], 7))
+    if matriz.shape[1] == 0:
+        return fatores
+
+    semana = dia_da_semana(dias)
+    soma = np.zeros((matriz.shape[0], 7))
+    np.add.at(soma.T, semana, matriz.T)
+    ocorrencias = np.bincount(semana, minlength=7)
+    media_geral = matriz.mean(axis=1, keepdims=True)
+
+    com_dados = (ocorrencias > 0) & (media_geral > 0)
+    media_semana = np.divide(soma, ocorrencias, out=np.zeros_like(soma), where=ocorrencias > 0)
+    np.divide(media_semana, media_geral, out=fatores, where=com_dados)
+    return np.clip(fatores, SAZONALIDADE_MIN, SAZONALIDADE_MAX)
+
+
+def prever(matriz, dias, futuros, alpha=ALPHA_PADRAO):
+    """Previsão por linha para cada dia em `futuros` (nível x sazonalidade).
+
+    Retorna matriz de forma (linhas, len(futuros)).
+    """
+    nivel = suavizacao_exponencial(matriz, alpha)
+    fatores = sazonalidade_semanal(matriz, dias)
+    return nivel[:, None] * fatores[:, dia_da_semana(futuros)]
@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from dashboard.snapshots import TRAVA_AGENDADOR, executar_ciclo
+from projetoIntegrador1.agendamento import obter_trava_processo
+
+
+class Command(BaseCommand):
+    help = "Recalcula as previsões do dashboard e grava um PrevisaoSnapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--forcar",
+            action="store_true",
+            help="Gera um novo snapshot mesmo sem alterações nos dados.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Continua executando e atualiza os snapshots periodicamente.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=int,
+            default=settings.PREVISOES_INTERVALO_SEGUNDOS,
+            help="Idade máxima, em segundos, do último snapshot.",
+        )
+        parser.add_argument(
+            "--novas-vendas",
+            type=int,
+            default=settings.PREVISOES_NOVAS_VENDAS,
+            help="Quantidade de vendas novas que antecipa a atualização.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["loop"]:
+            # Execução avulsa: sempre recalcula (ou reaproveita se nada mudou)
+            self._executar(0, options["novas_vendas"], options["forcar"])
+            return
+
+        if not obter_trava_processo(TRAVA_AGENDADOR):
+            raise CommandError("Já existe um agendador de previsões rodando nesta máquina.")
+
+        self.stdout.write("Atualizando previsões periodicamente (Ctrl+C para sair)...")
+        forcar = options["forcar"]
+        try:
+            while True:
+                self._executar(options["intervalo"], options["novas_vendas"], forcar)
+                forcar = False
+                close_old_connections()
+                time.sleep(5)
+        except KeyboardInterrupt:
+            pass
+
+    def _executar(self, intervalo, novas_vendas, forcar):
+        snapshot = executar_ciclo(intervalo=intervalo, novas_vendas=novas_vendas, forcar=forcar)
+        if snapshot:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Snapshot {snapshot.pk} gerado com {snapshot.total_vendas} vendas "
+                    f"em {snapshot.duracao_ms} ms."
+                )
+            )
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrevisaoSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gerado_em', models.DateTimeField(auto_now_add=True)),
+                ('hash_entrada', models.CharField(help_text='Hash dos dados usados no cálculo', max_length=64)),
+                ('total_vendas', models.PositiveIntegerField(default=0)),
+                ('ultima_venda_id', models.BigIntegerField(blank=True, help_text='Maior id de venda considerado', null=True)),
+                ('desde', models.DateTimeField(blank=True, null=True)),
+                ('dados', models.JSONField(default=dict)),
+                ('duracao_ms', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Snapshots de previsões',
+                'ordering': ['-gerado_em'],
+                'get_latest_by': 'gerado_em',
+                'indexes': [models.Index(fields=['gerado_em'], name='dashboard_p_gerado__22a44d_idx')],
+            },
+        ),
+    ]
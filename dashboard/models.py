@@ -1,3 +1,23 @@
 from django.db import models
 
-# Create your models here.
+
+class PrevisaoSnapshot(models.Model):
+    """Previsões do dashboard pré-calculadas fora do ciclo da requisição"""
+    gerado_em = models.DateTimeField(auto_now_add=True)
+    hash_entrada = models.CharField(max_length=64, help_text="Hash dos dados usados no cálculo")
+    total_vendas = models.PositiveIntegerField(default=0)
+    ultima_venda_id = models.BigIntegerField(null=True, blank=True, help_text="Maior id de venda considerado")
+    desde = models.DateTimeField(null=True, blank=True)
+    dados = models.JSONField(default=dict)
+    duracao_ms = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-gerado_em']
+        get_latest_by = 'gerado_em'
+        verbose_name_plural = "Snapshots de previsões"
+        indexes = [
+            models.Index(fields=['gerado_em']),
+        ]
+
+    def __str__(self):
+        return f"Previsões de {self.gerado_em:%d/%m/%Y %H:%M:%S} ({self.total_vendas} vendas)"
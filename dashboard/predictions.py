@@ -1,9 +1,20 @@
-from collections import defaultdict
-from statistics import pstdev
-
-from django.db.models import Count
-from django.utils.timezone import localtime, now, timedelta
-
+from datetime import datetime, time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, DateField, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, ExtractHour, Greatest, TruncDate
+from django.utils.timezone import (
+    get_current_timezone,
+    localdate,
+    localtime,
+    make_aware,
+    now,
+    timedelta,
+)
+
+from dashboard.forecasting import dia_da_semana, dia_para_indice, prever, sazonalidade_semanal
 from movimentacao.models import Produto, ReservaProduto
 
 
@@ -11,60 +22,76 @@ def _hour_key(hour):
     return f"{hour:02d}h-{(hour + 1) % 24:02d}h"
 
 
-def _weighted_average(values):
-    if not values:
-        return 0
-
-    weights = list(range(1, len(values) + 1))
-    weighted_total = sum(value * weight for value, weight in zip(values, weights))
-    return weighted_total / sum(weights)
-
-
 def _confidence(sample_size, variability):
     base = min(0.95, 0.35 + sample_size * 0.06)
     penalty = min(0.35, variability * 0.08)
     return round(max(0.2, base - penalty), 2)
 
 
+def build_hourly_sales(vendas):
+    """Conta vendas por hora local do dia com uma única consulta agrupada."""
+    vendas_por_horario = {_hour_key(hour): 0 for hour in range(24)}
+    linhas = (
+        vendas.order_by()
+        .annotate(hora=ExtractHour('data', tzinfo=get_current_timezone()))
+        .values('hora')
+        .annotate(total=Count('id'))
+    )
+    for linha in linhas:
+        if linha["hora"] is not None:
+            vendas_por_horario[_hour_key(linha["hora"])] = linha["total"]
+    return vendas_por_horario
+
+
 def build_daily_sales(vendas):
-    vendas_por_dia = defaultdict(lambda: {"total": 0, "receita": 0})
-    for venda in vendas:
-        data_venda = localtime(venda.data).date()
-        vendas_por_dia[data_venda]["total"] += 1
-        vendas_por_dia[data_venda]["receita"] += float(venda.valor_total or 0)
-    return sorted(vendas_por_dia.items())
+    """Retorna [(data, {"total", "receita"})] por dia local, ordenado por data."""
+    linhas = (
+        vendas.order_by()
+        .annotate(dia=TruncDate('data', tzinfo=get_current_timezone()))
+        .values('dia')
+        .annotate(total=Count('id'), receita=Sum('valor_total'))
+        .order_by('dia')
+    )
+    return [
+        (linha["dia"], {"total": linha["total"], "receita": float(linha["receita"] or 0)})
+        for linha in linhas
+        if linha["dia"] is not None
+    ]
 
 
 def predict_hourly_demand(vendas_por_horario, vendas, horizon=4):
-    hourly_counts = [vendas_por_horario[_hour_key(hour)] for hour in range(24)]
-    non_zero_hours = [value for value in hourly_counts if value > 0]
-    overall_average = sum(hourly_counts) / 24 if hourly_counts else 0
-    active_average = sum(non_zero_hours) / len(non_zero_hours) if non_zero_hours else 0
-    variability = pstdev(non_zero_hours) if len(non_zero_hours) > 1 else 0
-    sample_size = len(vendas)
-    confidence = _confidence(sample_size, variability)
-
-    predictions = {}
-    current_hour = now().hour
-
-    for offset in range(1, horizon + 1):
-        hour = (current_hour + offset) % 24
-        key = _hour_key(hour)
-        previous_hours = [
-            hourly_counts[(hour - 3) % 24],
-            hourly_counts[(hour - 2) % 24],
-            hourly_counts[(hour - 1) % 24],
-        ]
-        recency_signal = _weighted_average(previous_hours)
-        same_hour_signal = hourly_counts[hour]
-        baseline = active_average if active_average > 0 else overall_average
-        prediction = (
-            recency_signal * 0.45 +
-            same_hour_signal * 0.35 +
-            baseline * 0.20
-        )
-        predictions[key] = round(max(0, prediction), 1)
+    """Prevê vendas das próximas `horizon` horas.
+
+    `vendas` é uma `SerieVendas`; o perfil por hora é ajustado pelo fator
+    sazonal do dia da semana atual.
+    """
+    hourly_counts = np.array([vendas_por_horario[_hour_key(hour)] for hour in range(24)], dtype=np.float64)
+    non_zero_hours = hourly_counts[hourly_counts > 0]
+    overall_average = hourly_counts.mean()
+    active_average = non_zero_hours.mean() if non_zero_hours.size else 0
+    variability = non_zero_hours.std() if non_zero_hours.size > 1 else 0
+    confidence = _confidence(len(vendas), variability)
+
+    hours = (localtime(now()).hour + np.arange(1, horizon + 1)) % 24
+    previous_hours = hourly_counts[(hours[:, None] - np.array([3, 2, 1])) % 24]
+    recency_signal = previous_hours @ np.array([1, 2, 3]) / 6
+    same_hour_signal = hourly_counts[hours]
+    baseline = active_average if active_average > 0 else overall_average
+    prediction = (
+        recency_signal * 0.45 +
+        same_hour_signal * 0.35 +
+        baseline * 0.20
+    )
 
+    if len(vendas):
+        dias, contagem = np.unique(vendas.dias, return_counts=True)
+        hoje = dia_para_indice(localdate())
+        prediction = prediction * sazonalidade_semanal(contagem, dias)[0, dia_da_semana(hoje)]
+
+    predictions = {
+        _hour_key(int(hour)): round(max(0.0, float(value)), 1)
+        for hour, value in zip(hours, prediction)
+    }
     return predictions, confidence
 
 
@@ -89,62 +116,79 @@ def calculate_growth(dias_ordenados):
 
 
 def predict_revenue(dias_ordenados, horizon_days=3):
+    """Receita prevista para os próximos `horizon_days` dias.
+
+    Usa suavização exponencial da receita diária com sazonalidade por dia da
+    semana, projetada a partir do último dia com vendas.
+    """
     if not dias_ordenados:
         return 0, 0
 
     recent_days = dias_ordenados[-min(7, len(dias_ordenados)):]
-    receitas = [day[1]["receita"] for day in recent_days]
-    base = _weighted_average(receitas)
-    confidence = _confidence(len(receitas), pstdev(receitas) / base if base else 0)
+    dias = np.array([dia_para_indice(day[0]) for day in dias_ordenados])
+    receitas = np.array([day[1]["receita"] for day in dias_ordenados])
+    futuros = dias[-1] + np.arange(1, horizon_days + 1)
+    previsao = prever(receitas, dias, futuros)[0]
 
-    return round(base * horizon_days, 2), confidence
+    receitas_recentes = receitas[-len(recent_days):]
+    base = receitas_recentes.mean()
+    confidence = _confidence(len(recent_days), receitas_recentes.std() / base if base else 0)
+
+    return round(float(previsao.sum()), 2), confidence
 
 
 def predict_stock_needs(vendas, days_window=7, safety_days=3):
-    if not vendas:
+    """Sugestões de reposição e risco de ruptura para todos os produtos vendidos.
+
+    `vendas` é uma `SerieVendas`. A demanda diária de cada produto é prevista
+    para os próximos `safety_days` dias a partir dos dias com vendas na janela.
+    """
+    if not len(vendas):
         return [], []
 
-    cutoff = now().date() - timedelta(days=days_window - 1)
-    vendas_recentes = [
-        venda for venda in vendas
-        if localtime(venda.data).date() >= cutoff
-    ]
-    vendas_por_produto = defaultdict(lambda: {"quantidade": 0, "dias": set()})
+    cutoff = dia_para_indice(localdate() - timedelta(days=days_window - 1))
+    vendas_recentes = vendas.filtrar(vendas.dias >= cutoff)
+    if not len(vendas_recentes):
+        return [], []
+
+    produto_ids, dias, matriz = vendas_recentes.matriz_diaria()
+    futuros = dia_para_indice(localdate()) + np.arange(1, safety_days + 1)
+    medias_diarias = prever(matriz, dias, futuros).mean(axis=1)
+    dias_com_vendas = np.maximum(1, np.count_nonzero(matriz, axis=1))
 
-    for venda in vendas_recentes:
-        produto = venda.movimentacao.produto
-        vendas_por_produto[produto.id]["quantidade"] += venda.movimentacao.quantidade
-        vendas_por_produto[produto.id]["dias"].add(localtime(venda.data).date())
+    produtos = {
+        produto_id: (nome, estoque)
+        for produto_id, nome, estoque in Produto.objects.filter(
+            id__in=produto_ids.tolist()
+        ).values_list('id', 'nome', 'estoque')
+    }
 
     produtos_estoque_previsao = []
     produtos_risco = []
 
-    produtos = Produto.objects.in_bulk(vendas_por_produto.keys())
-    for produto_id, dados in vendas_por_produto.items():
-        produto = produtos.get(produto_id)
-        if not produto:
+    for produto_id, media_diaria, dias_produto in zip(produto_ids.tolist(), medias_diarias.tolist(), dias_com_vendas.tolist()):
+        if produto_id not in produtos:
             continue
+        nome, estoque = produtos[produto_id]
 
-        dias_com_vendas = max(1, len(dados["dias"]))
-        media_diaria = dados["quantidade"] / dias_com_vendas
-        margem_seguranca = 1.25 if dias_com_vendas < days_window else 1.15
+        margem_seguranca = 1.25 if dias_produto < days_window else 1.15
         estoque_recomendado = round(media_diaria * safety_days * margem_seguranca, 1)
-        dias_restantes = produto.estoque / media_diaria if media_diaria > 0 else 999
-        confidence = _confidence(dias_com_vendas, 0)
+        dias_restantes = estoque / media_diaria if media_diaria > 0 else 999
+        confidence = _confidence(dias_produto, 0)
 
         produtos_estoque_previsao.append({
-            "produto": produto.nome,
-            "estoque_atual": produto.estoque,
+            "produto": nome,
+            "estoque_atual": estoque,
             "estoque_recomendado": estoque_recomendado,
             "media_diaria": round(media_diaria, 1),
-            "necessita_reposicao": produto.estoque < estoque_recomendado,
+            "necessita_reposicao": estoque < estoque_recomendado,
             "confianca": confidence,
         })
 
         if 0 < dias_restantes < safety_days:
             produtos_risco.append({
-                "produto": produto.nome,
-                "estoque_atual": produto.estoque,
+                "produto": nome,
+                "estoque_atual": estoque,
                 "dias_restantes": round(dias_restantes, 1),
                 "demanda_media": round(media_diaria, 1),
                 "confianca": confidence,
@@ -158,16 +202,112 @@ def predict_stock_needs(vendas, days_window=7, safety_days=3):
     )
     produtos_risco.sort(key=lambda produto: produto["dias_restantes"])
 
-    return produtos_estoque_previsao[:10], produtos_risco[:5]
+    return produtos_estoque_previsao, produtos_risco
+
+
+def stock_needs_queryset(days_window=7, safety_days=3):
+    """Produtos do catálogo anotados com a necessidade de estoque.
+
+    Uma única consulta agrupada soma a quantidade vendida e conta os dias
+    distintos com venda nos últimos `days_window` dias, calculando média
+    diária, estoque recomendado e déficit no próprio banco.
+    """
+    tz = get_current_timezone()
+    inicio = localdate() - timedelta(days=days_window - 1)
+    filtro = Q(vendas__data__gte=make_aware(datetime.combine(inicio, time.min), tz))
 
+    return (
+        Produto.objects.annotate(
+            quantidade_vendida=Coalesce(Sum('vendas__quantidade', filter=filtro), 0),
+            dias_com_vendas=Count(TruncDate('vendas__data', tzinfo=tz), filter=filtro, distinct=True),
+        )
+        .annotate(
+            media_diaria=Cast('quantidade_vendida', FloatField()) / Greatest('dias_com_vendas', 1),
+            margem_seguranca=Case(
+                When(dias_com_vendas__lt=days_window, then=Value(1.25)),
+                default=Value(1.15),
+                output_field=FloatField(),
+            ),
+        )
+        .annotate(
+            estoque_recomendado=F('media_diaria') * safety_days * F('margem_seguranca'),
+        )
+        .annotate(
+            deficit=F('estoque_recomendado') - F('estoque'),
+        )
+        .order_by('-deficit', 'nome')
+    )
 
-def build_reservation_insights():
-    total_reservas = ReservaProduto.objects.count()
-    total_finalizadas = ReservaProduto.objects.filter(status='finalizada').count()
-    total_pendentes = ReservaProduto.objects.filter(status='pendente', ficha__isnull=True).count()
 
+def stock_need_row(produto, safety_days=3):
+    media_diaria = produto.media_diaria or 0
+    dias_restantes = produto.estoque / media_diaria if media_diaria > 0 else None
     return {
-        "total_pendentes": total_pendentes,
+        "produto_id": produto.id,
+        "produto": produto.nome,
+        "categoria": produto.categoria,
+        "estoque_atual": produto.estoque,
+        "quantidade_vendida": produto.quantidade_vendida,
+        "dias_com_vendas": produto.dias_com_vendas,
+        "media_diaria": round(media_diaria, 1),
+        "estoque_recomendado": round(produto.estoque_recomendado, 1),
+        "necessita_reposicao": produto.estoque < round(produto.estoque_recomendado, 1),
+        "dias_restantes": round(dias_restantes, 1) if dias_restantes is not None else None,
+        "em_risco": dias_restantes is not None and 0 < dias_restantes < safety_days,
+        "confianca": _confidence(max(1, produto.dias_com_vendas), 0),
+    }
+
+
+def _reservation_trend(dias=7):
+    hoje = localdate()
+    inicio = hoje - timedelta(days=dias - 1)
+    tz = get_current_timezone()
+    inicio_dt = make_aware(datetime.combine(inicio, time.min), tz)
+
+    linhas = (
+        ReservaProduto.objects.order_by()
+        .filter(
+            Q(status='pendente', data_reserva__gte=inicio_dt) |
+            Q(status='finalizada', data_confirmacao__gte=inicio_dt)
+        )
+        .annotate(
+            dia=Case(
+                When(status='pendente', then=TruncDate('data_reserva', tzinfo=tz)),
+                default=TruncDate('data_confirmacao', tzinfo=tz),
+                output_field=DateField(),
+            )
+        )
+        .values('dia')
+        .annotate(
+            pendentes=Count('id', filter=Q(status='pendente')),
+            finalizadas=Count('id', filter=Q(status='finalizada')),
+        )
+    )
+    por_dia = {linha["dia"]: linha for linha in linhas}
+
+    tendencia = []
+    for i in range(dias - 1, -1, -1):
+        dia = hoje - timedelta(days=i)
+        linha = por_dia.get(dia, {})
+        tendencia.append({
+            "data": dia.strftime("%d/%m"),
+            "pendentes": linha.get("pendentes", 0),
+            "finalizadas": linha.get("finalizadas", 0),
+        })
+    return tendencia
+
+
+def _build_reservation_insights():
+    totais = ReservaProduto.objects.aggregate(
+        total=Count('id'),
+        finalizadas=Count('id', filter=Q(status='finalizada')),
+        pendentes=Count('id', filter=Q(status='pendente', ficha__isnull=True)),
+    )
+    total_reservas = totais["total"]
+    total_finalizadas = totais["finalizadas"]
+
+    return {
+        "total_pendentes": totais["pendentes"],
         "total_finalizadas": total_finalizadas,
         "taxa_conversao": round((total_finalizadas / max(total_reservas, 1)) * 100, 2) if total_reservas else 0,
         "produtos_mais_reservados": [
@@ -179,18 +319,23 @@ def build_reservation_insights():
             .annotate(total=Count('id'))
             .order_by('-total')[:5]
         ],
-        "tendencia_7dias": [
-            {
-                "data": (now() - timedelta(days=i)).strftime("%d/%m"),
-                "pendentes": ReservaProduto.objects.filter(
-                    status='pendente',
-                    data_reserva__date=(now() - timedelta(days=i)).date()
-                ).count(),
-                "finalizadas": ReservaProduto.objects.filter(
-                    status='finalizada',
-                    data_confirmacao__date=(now() - timedelta(days=i)).date()
-                ).count()
-            }
-            for i in range(6, -1, -1)
-        ]
+        "tendencia_7dias": _reservation_trend(),
     }
+
+
+def build_reservation_insights(cache_timeout=None):
+    """Resumo das reservas, guardado em cache por `cache_timeout` segundos.
+
+    Por padrão usa `DASHBOARD_CACHE_SEGUNDOS`; com 0 o cache é ignorado.
+    """
+    if cache_timeout is None:
+        cache_timeout = settings.DASHBOARD_CACHE_SEGUNDOS
+    if not cache_timeout:
+        return _build_reservation_insights()
+
+    chave = f"dashboard:reservas:{localdate().isoformat()}"
+    insights = cache.get(chave)
+    if insights is None:
+        insights = _build_reservation_insights()
+        cache.set(chave, insights, cache_timeout)
+    return insights
@@ -0,0 +1,192 @@
+"""Pré-cálculo das previsões do dashboard em `PrevisaoSnapshot`.
+
+As previsões são recalculadas pelo comando `gerar_previsoes` ou pelo
+agendador em processo (`PREVISOES_AGENDADOR`), e o dashboard lê o snapshot
+mais recente em vez de calcular tudo a cada requisição. O cálculo na
+requisição só acontece enquanto não existe nenhum snapshot; um snapshot mais
+velho que `PREVISOES_MAX_IDADE_SEGUNDOS` continua sendo servido enquanto uma
+thread gera o próximo.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max, Sum
+from django.utils.timezone import localtime, now, timedelta
+
+from dashboard.filtros import filtrar_vendas
+from dashboard.forecasting import SerieVendas
+from dashboard.models import PrevisaoSnapshot
+from dashboard.predictions import (
+    build_daily_sales,
+    build_hourly_sales,
+    predict_hourly_demand,
+    predict_revenue,
+    predict_stock_needs,
+)
+from movimentacao.models import Produto, Venda
+from projetoIntegrador1.agendamento import iniciar_thread_periodica, obter_trava_processo
+from projetoIntegrador1.roteamento import banco_principal
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de snapshots mantidos na tabela
+SNAPSHOTS_MANTIDOS = 10
+
+# Uma geração por vez no processo (agendador, comando e dashboard)
+_geracao_lock = threading.Lock()
+
+
+def calcular_previsoes(vendas):
+    """Calcula as previsões do dashboard para o queryset de vendas informado."""
+    vendas_por_horario = build_hourly_sales(vendas)
+    serie_vendas = SerieVendas.from_queryset(vendas)
+    dias_ordenados = build_daily_sales(vendas)
+
+    predicao_demanda, confianca_demanda = predict_hourly_demand(vendas_por_horario, serie_vendas)
+    predicao_receita, confianca_receita = predict_revenue(dias_ordenados)
+    produtos_estoque_previsao, produtos_risco = predict_stock_needs(serie_vendas)
+
+    return {
+        "predicaoDemanda": predicao_demanda,
+        "predicaoReceita3Dias": predicao_receita,
+        "produtosEstoquePrevisao": produtos_estoque_previsao,
+        "produtosRiscoEstoque": produtos_risco,
+        "confiancaPredicoes": {
+            "demanda": float(confianca_demanda),
+            "receita": float(confianca_receita),
+        },
+    }
+
+
+def _resumo_entrada(vendas):
+    """Resumo barato dos dados de entrada e seu hash."""
+    resumo = vendas.aggregate(
+        total=Count('id'),
+        ultima=Max('id'),
+        receita=Sum('valor_total'),
+        quantidade=Sum('quantidade'),
+    )
+    estoque = Produto.objects.aggregate(total=Sum('estoque'))['total']
+    # A previsão por hora depende da hora local atual
+    hora = localtime(now()).strftime('%Y-%m-%d %H')
+    conteudo = json.dumps([resumo, estoque, hora], default=str, sort_keys=True)
+    return resumo, hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def gerar_snapshot(forcar=False):
+    """Recalcula as previsões, reaproveitando o último snapshot se nada mudou."""
+    # Caminho de escrita: lê do banco principal mesmo dentro de uma view de relatório
+    with _geracao_lock, banco_principal():
+        return _gerar_snapshot(forcar)
+
+
+def _gerar_snapshot(forcar):
+    vendas, desde, _ = filtrar_vendas(Venda.objects.all(), {})
+    resumo, hash_entrada = _resumo_entrada(vendas)
+
+    ultimo = PrevisaoSnapshot.objects.first()
+    if not forcar and ultimo and ultimo.hash_entrada == hash_entrada:
+        ultimo.gerado_em = now()
+        PrevisaoSnapshot.objects.filter(pk=ultimo.pk).update(gerado_em=ultimo.gerado_em)
+        return ultimo
+
+    inicio = time.perf_counter()
+    dados = calcular_previsoes(vendas)
+    snapshot = PrevisaoSnapshot.objects.create(
+        hash_entrada=hash_entrada,
+        total_vendas=resumo['total'],
+        ultima_venda_id=resumo['ultima'],
+        desde=desde,
+        dados=dados,
+        duracao_ms=int((time.perf_counter() - inicio) * 1000),
+    )
+
+    antigos = PrevisaoSnapshot.objects.values_list('pk', flat=True)[SNAPSHOTS_MANTIDOS:]
+    PrevisaoSnapshot.objects.filter(pk__in=list(antigos)).delete()
+    return snapshot
+
+
+def _atualizar_em_segundo_plano():
+    """Gera um snapshot numa thread, a menos que outra geração esteja em andamento."""
+    if not _geracao_lock.acquire(blocking=False):
+        return None
+
+    def atualizar():
+        try:
+            with banco_principal():
+                _gerar_snapshot(False)
+        except Exception:
+            logger.exception("Falha ao atualizar as previsões do dashboard")
+        finally:
+            _geracao_lock.release()
+            close_old_connections()
+
+    thread = threading.Thread(target=atualizar, name='previsoes-atualizacao', daemon=True)
+    thread.start()
+    return thread
+
+
+def snapshot_dashboard(max_idade=None):
+    """Snapshot mais recente; calcula na hora apenas se ainda não houver nenhum.
+
+    Se ele tiver mais de `max_idade` segundos, é servido assim mesmo e a
+    atualização segue em segundo plano.
+    """
+    if max_idade is None:
+        max_idade = settings.PREVISOES_MAX_IDADE_SEGUNDOS
+    snapshot = PrevisaoSnapshot.objects.first()
+    if snapshot is None:
+        return gerar_snapshot()
+    if snapshot.gerado_em < now() - timedelta(seconds=max_idade):
+        _atualizar_em_segundo_plano()
+    return snapshot
+
+
+def precisa_atualizar(intervalo=None, novas_vendas=None):
+    """Indica se o intervalo expirou ou se entraram `novas_vendas` vendas."""
+    if intervalo is None:
+        intervalo = settings.PREVISOES_INTERVALO_SEGUNDOS
+    if novas_vendas is None:
+        novas_vendas = settings.PREVISOES_NOVAS_VENDAS
+
+    ultimo = PrevisaoSnapshot.objects.first()
+    if not ultimo:
+        return True
+    if ultimo.gerado_em <= now() - timedelta(seconds=intervalo):
+        return True
+    return Venda.objects.filter(id__gt=ultimo.ultima_venda_id or 0).count() >= novas_vendas
+
+
+def executar_ciclo(intervalo=None, novas_vendas=None, forcar=False):
+    """Gera um novo snapshot se necessário. Retorna o snapshot gerado ou None."""
+    if forcar or precisa_atualizar(intervalo, novas_vendas):
+        return gerar_snapshot(forcar=forcar)
+    return None
+
+
+# Trava entre processos: um único agendador de previsões por máquina
+TRAVA_AGENDADOR = 'previsoes-agendador'
+
+_agendador = None
+_agendador_lock = threading.Lock()
+
+
+def iniciar_agendador(verificacao=5):
+    """Inicia a thread que mantém os snapshots em dia.
+
+    Só um processo da máquina a executa; os demais workers (ou um
+    `gerar_previsoes --loop` em andamento) ficam com a trava negada.
+    """
+    global _agendador
+    with _agendador_lock:
+        if _agendador is None:
+            if not obter_trava_processo(TRAVA_AGENDADOR):
+                logger.info("Agendador de previsões já roda em outro processo")
+                return None
+            _agendador = iniciar_thread_periodica('previsoes-agendador', executar_ciclo, verificacao)
+    return _agendador
@@ -1,8 +1,25 @@
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
 
-from movimentacao.models import Caixa, Ficha, MovimentacaoEstoque, Produto, Venda
+from dashboard.exportacoes import EXPORTACOES, alinhas_csv
+from dashboard.forecasting import SerieVendas, prever, suavizacao_exponencial
+from dashboard.models import PrevisaoSnapshot
+from dashboard.predictions import build_daily_sales, build_hourly_sales, build_reservation_insights, predict_stock_needs
+from dashboard.snapshots import TRAVA_AGENDADOR, _geracao_lock, gerar_snapshot, iniciar_agendador
+from movimentacao.autenticacao import gerar_token_caixa
+from movimentacao.models import Caixa, Ficha, MovimentacaoEstoque, Produto, ReservaProduto, Venda
+from projetoIntegrador1 import agendamento
+from projetoIntegrador1.agendamento import processo_servidor
 
 
 class TestDashboardData(TestCase):
@@ -73,3 +90,392 @@ class TestDashboardData(TestCase):
         self.assertGreater(data["predicaoReceita3Dias"], 0)
         self.assertGreater(len(data["produtosEstoquePrevisao"]), 0)
         self.assertIn("confianca", data["produtosEstoquePrevisao"][0])
+
+    def test_dashboard_scopes_sales_by_period_and_caixa(self):
+        caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        outro_caixa = Caixa.objects.create(nome="Caixa Bebidas", usuario="bebidas", senha="123")
+        produto = Produto.objects.create(
+            caixa=caixa,
+            nome="Pastel",
+            medida="UN",
+            preco=Decimal("5.00"),
+        )
+        MovimentacaoEstoque.objects.create(
+            caixa=caixa,
+            produto=produto,
+            quantidade=10,
+            tipo="E",
+        )
+        ficha = Ficha.objects.create(numero=1, saldo=Decimal("100.00"))
+        antiga = self.criar_venda(produto, ficha, caixa)
+        self.criar_venda(produto, ficha, caixa)
+        self.criar_venda(produto, ficha, outro_caixa)
+        Venda.objects.filter(pk=antiga.pk).update(data=timezone.now() - timedelta(days=30))
+
+        response = self.client.get("/dashboard/data/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["totalVendas"], 2)
+
+        response = self.client.get("/dashboard/data/", {"caixa": caixa.id})
+        self.assertEqual(response.json()["totalVendas"], 1)
+
+        desde = (timezone.localdate() - timedelta(days=60)).isoformat()
+        response = self.client.get("/dashboard/data/", {"desde": desde})
+        self.assertEqual(response.json()["totalVendas"], 3)
+
+    def test_dashboard_rejects_invalid_period(self):
+        response = self.client.get("/dashboard/data/", {"desde": "ontem"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_hourly_and_daily_series_use_local_timezone(self):
+        caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        produto = Produto.objects.create(
+            caixa=caixa,
+            nome="Pastel",
+            medida="UN",
+            preco=Decimal("5.00"),
+        )
+        MovimentacaoEstoque.objects.create(
+            caixa=caixa,
+            produto=produto,
+            quantidade=10,
+            tipo="E",
+        )
+        ficha = Ficha.objects.create(numero=1, saldo=Decimal("100.00"))
+        venda = self.criar_venda(produto, ficha, caixa, quantidade=2)
+        # 01:30 UTC corresponde a 22:30 do dia anterior em America/Sao_Paulo
+        Venda.objects.filter(pk=venda.pk).update(
+            data=datetime(2026, 6, 11, 1, 30, tzinfo=dt_timezone.utc)
+        )
+
+        por_horario = build_hourly_sales(Venda.objects.all())
+        self.assertEqual(len(por_horario), 24)
+        self.assertEqual(por_horario["22h-23h"], 1)
+        self.assertEqual(sum(por_horario.values()), 1)
+
+        por_dia = build_daily_sales(Venda.objects.all())
+        self.assertEqual(por_dia, [(date(2026, 6, 10), {"total": 1, "receita": 10.0})])
+
+
+class TestReservationInsights(TestCase):
+    def setUp(self):
+        cache.clear()
+        caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        self.produto = Produto.objects.create(
+            caixa=caixa,
+            nome="Bolo",
+            medida="UN",
+            preco=Decimal("6.00"),
+        )
+
+    def criar_reserva(self, cpf, status, data_confirmacao=None):
+        return ReservaProduto.objects.create(
+            produto=self.produto,
+            quantidade=1,
+            nome_completo="Maria Silva",
+            cpf=cpf,
+            status=status,
+            data_confirmacao=data_confirmacao,
+        )
+
+    def test_insights_use_grouped_queries(self):
+        self.criar_reserva("11111111111", "pendente")
+        self.criar_reserva("22222222222", "pendente")
+        self.criar_reserva("33333333333", "finalizada", data_confirmacao=timezone.now())
+        self.criar_reserva("44444444444", "cancelada")
+
+        with self.assertNumQueries(3):
+            insights = build_reservation_insights(cache_timeout=0)
+
+        self.assertEqual(insights["total_pendentes"], 2)
+        self.assertEqual(insights["total_finalizadas"], 1)
+        self.assertEqual(insights["taxa_conversao"], 25.0)
+        self.assertEqual(len(insights["tendencia_7dias"]), 7)
+        hoje = insights["tendencia_7dias"][-1]
+        self.assertEqual(hoje["data"], timezone.localdate().strftime("%d/%m"))
+        self.assertEqual(hoje["pendentes"], 2)
+        self.assertEqual(hoje["finalizadas"], 1)
+
+    def test_insights_are_cached(self):
+        self.criar_reserva("11111111111", "pendente")
+        build_reservation_insights(cache_timeout=60)
+
+        with self.assertNumQueries(0):
+            insights = build_reservation_insights(cache_timeout=60)
+
+        self.assertEqual(insights["total_pendentes"], 1)
+
+
+class TestForecastingEngine(TestCase):
+    def test_exponential_smoothing_runs_per_row(self):
+        niveis = suavizacao_exponencial([[2, 4, 6], [10, 10, 10]], alpha=0.5)
+
+        self.assertEqual(niveis.tolist(), [4.5, 10.0])
+
+    def test_forecast_applies_weekday_seasonality(self):
+        # 2026-06-01 é segunda-feira; as segundas vendem o dobro
+        inicio = date(2026, 6, 1)
+        dias = [(inicio + timedelta(days=i)) for i in range(14)]
+        indices = [int((dia - date(1970, 1, 1)).days) for dia in dias]
+        valores = [[20 if dia.weekday() == 0 else 10 for dia in dias]]
+
+        previsao = prever(valores, indices, [indices[-1] + 1, indices[-1] + 2], alpha=0.3)
+
+        # 15/06 (segunda) deve superar 16/06 (terça)
+        self.assertGreater(previsao[0, 0], previsao[0, 1])
+
+    def test_stock_needs_cover_every_product(self):
+        caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        ficha = Ficha.objects.create(numero=1, saldo=Decimal("1000.00"))
+        for i in range(12):
+            produto = Produto.objects.create(
+                caixa=caixa,
+                nome=f"Produto {i}",
+                medida="UN",
+                preco=Decimal("1.00"),
+            )
+            MovimentacaoEstoque.objects.create(caixa=caixa, produto=produto, quantidade=5, tipo="E")
+            movimentacao = MovimentacaoEstoque.objects.create(caixa=caixa, produto=produto, quantidade=1, tipo="S")
+            Venda.objects.create(movimentacao=movimentacao, ficha=ficha)
+
+        serie = SerieVendas.from_queryset(Venda.objects.all())
+        self.assertEqual(len(serie), 12)
+
+        previsao, _ = predict_stock_needs(serie)
+        self.assertEqual(len(previsao), 12)
+
+
+class TestPrevisaoSnapshot(TestCase):
+    def setUp(self):
+        caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        self.caixa = caixa
+        self.produto = Produto.objects.create(
+            caixa=caixa,
+            nome="Pastel",
+            medida="UN",
+            preco=Decimal("5.00"),
+        )
+        MovimentacaoEstoque.objects.create(caixa=caixa, produto=self.produto, quantidade=10, tipo="E")
+        self.ficha = Ficha.objects.create(numero=1, saldo=Decimal("100.00"))
+
+    def vender(self):
+        movimentacao = MovimentacaoEstoque.objects.create(
+            caixa=self.caixa,
+            produto=self.produto,
+            quantidade=1,
+            tipo="S",
+        )
+        return Venda.objects.create(movimentacao=movimentacao, ficha=self.ficha)
+
+    def test_snapshot_is_reused_until_inputs_change(self):
+        venda = self.vender()
+        primeiro = gerar_snapshot()
+        self.assertEqual(primeiro.total_vendas, 1)
+        self.assertEqual(primeiro.ultima_venda_id, venda.id)
+
+        self.assertEqual(gerar_snapshot().pk, primeiro.pk)
+
+        self.vender()
+        segundo = gerar_snapshot()
+        self.assertNotEqual(segundo.pk, primeiro.pk)
+        self.assertEqual(segundo.total_vendas, 2)
+
+    def test_dashboard_reads_latest_snapshot(self):
+        self.vender()
+        call_command("gerar_previsoes", stdout=StringIO())
+        snapshot = PrevisaoSnapshot.objects.get()
+
+        response = self.client.get("/dashboard/data/")
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["predicaoDemanda"], snapshot.dados["predicaoDemanda"])
+        self.assertEqual(PrevisaoSnapshot.objects.count(), 1)
+
+    def test_stale_snapshot_is_served_while_refreshing_in_background(self):
+        antigo = gerar_snapshot()
+        PrevisaoSnapshot.objects.filter(pk=antigo.pk).update(gerado_em=timezone.now() - timedelta(hours=1))
+        self.vender()
+
+        with mock.patch("dashboard.snapshots.threading.Thread") as thread:
+            response = self.client.get("/dashboard/data/")
+            # Com uma geração em andamento, não dispara outra
+            self.client.get("/dashboard/data/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["predicaoDemanda"], antigo.dados["predicaoDemanda"])
+        self.assertEqual(thread.call_count, 1)
+        self.assertEqual(PrevisaoSnapshot.objects.count(), 1)
+
+        with mock.patch("dashboard.snapshots.close_old_connections"):
+            thread.call_args.kwargs["target"]()
+        self.assertEqual(PrevisaoSnapshot.objects.first().total_vendas, 1)
+        self.assertTrue(_geracao_lock.acquire(blocking=False))
+        _geracao_lock.release()
+
+
+class TestAgendadorPrevisoes(SimpleTestCase):
+    def test_scheduler_only_runs_in_server_processes(self):
+        casos = [
+            (["manage.py", "migrate"], {}, False),
+            (["manage.py", "test"], {}, False),
+            (["/venv/bin/django-admin", "migrate"], {}, False),
+            (["/venv/lib/site-packages/django/__main__.py", "test"], {}, False),
+            (["manage.py", "runserver"], {}, False),
+            (["manage.py", "runserver"], {"RUN_MAIN": "true"}, True),
+            (["manage.py", "runserver", "--noreload"], {}, True),
+            (["uwsgi"], {}, True),
+        ]
+        for argv, ambiente, esperado in casos:
+            with self.subTest(argv=argv, ambiente=ambiente):
+                with mock.patch.object(sys, "argv", argv), mock.patch.dict(os.environ, ambiente):
+                    if not ambiente:
+                        os.environ.pop("RUN_MAIN", None)
+                    self.assertIs(processo_servidor(), esperado)
+
+    @skipUnless(agendamento.fcntl, "travas entre processos exigem fcntl")
+    def test_scheduler_runs_in_a_single_process(self):
+        # Outro processo (aqui, outro descritor) já segura a trava do agendador
+        with open(agendamento._caminho_trava(TRAVA_AGENDADOR), "a") as arquivo:
+            agendamento.fcntl.flock(arquivo, agendamento.fcntl.LOCK_EX | agendamento.fcntl.LOCK_NB)
+            with mock.patch("dashboard.snapshots.iniciar_thread_periodica") as iniciar:
+                self.assertIsNone(iniciar_agendador())
+            iniciar.assert_not_called()
+
+
+class TestEstoquePrevisao(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        self.ficha = Ficha.objects.create(numero=1, saldo=Decimal("1000.00"))
+
+    def criar_produto(self, nome, estoque, vendidos):
+        produto = Produto.objects.create(
+            caixa=self.caixa,
+            nome=nome,
+            medida="UN",
+            preco=Decimal("1.00"),
+        )
+        MovimentacaoEstoque.objects.create(caixa=self.caixa, produto=produto, quantidade=estoque + vendidos, tipo="E")
+        if vendidos:
+            movimentacao = MovimentacaoEstoque.objects.create(
+                caixa=self.caixa,
+                produto=produto,
+                quantidade=vendidos,
+                tipo="S",
+            )
+            Venda.objects.create(movimentacao=movimentacao, ficha=self.ficha)
+        return produto
+
+    def test_stock_needs_cover_catalog_with_pagination(self):
+        self.criar_produto("Pastel", estoque=2, vendidos=10)
+        self.criar_produto("Suco", estoque=100, vendidos=1)
+        self.criar_produto("Canjica", estoque=5, vendidos=0)
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/dashboard/estoque-previsao/", {"page_size": 2})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(len(data["results"]), 2)
+        primeiro = data["results"][0]
+        self.assertEqual(primeiro["produto"], "Pastel")
+        self.assertEqual(primeiro["quantidade_vendida"], 10)
+        self.assertEqual(primeiro["dias_com_vendas"], 1)
+        self.assertEqual(primeiro["estoque_recomendado"], 37.5)
+        self.assertTrue(primeiro["necessita_reposicao"])
+        self.assertTrue(primeiro["em_risco"])
+
+        response = self.client.get("/dashboard/estoque-previsao/", {"apenas_reposicao": "true"})
+        self.assertEqual([item["produto"] for item in response.json()["results"]], ["Pastel"])
+
+    def test_stock_needs_rejects_invalid_window(self):
+        response = self.client.get("/dashboard/estoque-previsao/", {"janela": "abc"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestExportacoes(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        self.outro_caixa = Caixa.objects.create(nome="Caixa 2", usuario="caixa2", senha="123")
+        self.ficha = Ficha.objects.create(numero=7, saldo=Decimal("100.00"))
+        self.produto = Produto.objects.create(
+            caixa=self.caixa,
+            nome="Pastel",
+            medida="UN",
+            preco=Decimal("8.50"),
+            categoria="Salgado",
+        )
+        MovimentacaoEstoque.objects.create(caixa=self.caixa, produto=self.produto, quantidade=10, tipo="E")
+        for caixa in (self.caixa, self.outro_caixa):
+            movimentacao = MovimentacaoEstoque.objects.create(
+                caixa=caixa,
+                produto=self.produto,
+                quantidade=2,
+                tipo="S",
+            )
+            Venda.objects.create(movimentacao=movimentacao, ficha=self.ficha)
+        token, _ = gerar_token_caixa(self.caixa)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Caixa {token}"
+
+    def ler_csv(self, response):
+        return b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+
+    def test_sales_export_streams_csv_filtered_by_caixa(self):
+        response = self.client.get("/dashboard/exportar/vendas/", {"caixa": self.caixa.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        linhas = self.ler_csv(response)
+        self.assertEqual(
+            linhas[0],
+            "id,data,ficha,caixa,produto,categoria,quantidade,valor_unitario,valor_total",
+        )
+        self.assertEqual(len(linhas), 2)
+        self.assertTrue(linhas[1].endswith(",7,Caixa Principal,Pastel,Salgado,2,8.50,17.00"))
+
+    def test_excel_format_uses_semicolon_and_decimal_comma(self):
+        response = self.client.get("/dashboard/exportar/vendas/", {"formato": "excel"})
+
+        conteudo = b"".join(response.streaming_content).decode("utf-8")
+        self.assertTrue(conteudo.startswith("\ufeffid;data;"))
+        self.assertIn(";8,50;17,00", conteudo)
+
+    def test_export_filters_period_and_rejects_unknown_resource(self):
+        amanha = (timezone.localdate() + timedelta(days=1)).isoformat()
+        response = self.client.get("/dashboard/exportar/movimentacoes-estoque/", {"desde": amanha})
+        self.assertEqual(len(self.ler_csv(response)), 1)
+
+        response = self.client.get("/dashboard/exportar/movimentacoes-estoque/")
+        self.assertEqual(len(self.ler_csv(response)), 4)
+
+        response = self.client.get("/dashboard/exportar/fichas/")
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get("/dashboard/exportar/vendas/", {"desde": "ontem"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_requires_cashier_token(self):
+        del self.client.defaults["HTTP_AUTHORIZATION"]
+
+        response = self.client.get("/dashboard/exportar/vendas/")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_export_reads_in_batches_in_order(self):
+        esperado = self.ler_csv(self.client.get("/dashboard/exportar/movimentacoes-estoque/"))
+
+        with mock.patch("dashboard.exportacoes.TAMANHO_LOTE", 1):
+            response = self.client.get("/dashboard/exportar/movimentacoes-estoque/")
+            self.assertEqual(self.ler_csv(response), esperado)
+
+            async def ler_async():
+                return [parte async for parte in alinhas_csv(
+                    EXPORTACOES["movimentacoes-estoque"], MovimentacaoEstoque.objects.all()
+                )]
+
+            partes = async_to_sync(ler_async)()
+        self.assertEqual("".join(partes).splitlines(), esperado)
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import dashboard_data
+from .views import dashboard_data, estoque_previsao, exportar
 
 urlpatterns = [
     path('data/', dashboard_data, name='dashboard-data'),
+    path('estoque-previsao/', estoque_previsao, name='estoque-previsao'),
+    path('exportar/<str:recurso>/', exportar, name='exportar'),
 ]
\ No newline at end of file
@@ -1,48 +1,53 @@
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django.utils.timezone import localtime
+from dashboard.exportacoes import EXPORTACOES, alinhas_csv, linhas_csv
+from dashboard.filtros import filtrar_periodo, filtrar_vendas
 from dashboard.predictions import (
     build_daily_sales,
+    build_hourly_sales,
     build_reservation_insights,
     calculate_growth,
-    predict_hourly_demand,
-    predict_revenue,
-    predict_stock_needs,
+    stock_need_row,
+    stock_needs_queryset,
 )
+from dashboard.snapshots import calcular_previsoes, snapshot_dashboard
+from movimentacao.autenticacao import CaixaTokenAuthentication
 from movimentacao.models import Venda
+from projetoIntegrador1.roteamento import leitura_relatorios
+
 
 @api_view(['GET'])
+@leitura_relatorios
 def dashboard_data(request):
-    # Verificar se há vendas antes de processar
-    vendas = Venda.objects.select_related(
-        'movimentacao__produto',
-        'movimentacao__caixa',
-        'ficha'
-    )
-    vendas_list_for_prediction = list(vendas)
+    try:
+        vendas, desde, ate = filtrar_vendas(
+            Venda.objects.select_related('produto', 'caixa', 'ficha'),
+            request.query_params,
+        )
+    except ValueError:
+        return Response(
+            {"detail": "Parâmetros inválidos. Use datas no formato AAAA-MM-DD e caixa numérico."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     total_vendas = vendas.count()
     receita = vendas.aggregate(total=Sum('valor_total'))['total'] or 0
     clientes_ativos = vendas.values('ficha').distinct().count()
 
-    # Inicializa vendas por horário (sempre retorna dicionário com 24 horas)
-    vendas_por_horario = {f"{h:02d}h-{(h+1)%24:02d}h": 0 for h in range(24)}
-
-    # Processa vendas por horário apenas se houver vendas
-    if vendas_list_for_prediction:
-        for v in vendas_list_for_prediction:
-            try:
-                hora = localtime(v.data).hour
-                chave = f"{hora:02d}h-{(hora+1)%24:02d}h"
-                vendas_por_horario[chave] += 1
-            except (AttributeError, TypeError):
-                # Se houver erro ao acessar data, continua
-                continue
+    # Vendas por horário (sempre retorna dicionário com 24 horas)
+    vendas_por_horario = build_hourly_sales(vendas)
 
     vendas_por_categoria = (
-        vendas.values('movimentacao__produto__categoria')
-        .annotate(total=Sum('movimentacao__quantidade'))
+        vendas.values('categoria')
+        .annotate(total=Sum('quantidade'))
         .order_by('-total')
     )
 
@@ -52,29 +57,29 @@ def dashboard_data(request):
     if vendas_por_categoria_list:
         categoria_formatada = [
             {
-                "name": cat['movimentacao__produto__categoria'].capitalize() if cat['movimentacao__produto__categoria'] else 'Sem categoria',
+                "name": cat['categoria'].capitalize() if cat['categoria'] else 'Sem categoria',
                 "value": cat["total"]
             }
             for cat in vendas_por_categoria_list
         ]
 
     top_produtos = (
-        vendas.values('movimentacao__produto__nome')
-        .annotate(vendidos=Sum('movimentacao__quantidade')) 
+        vendas.values('produto__nome')
+        .annotate(vendidos=Sum('quantidade')) 
         .order_by('-vendidos')[:10]
     )
     top_produtos_formatado = [
-        {"nome": p["movimentacao__produto__nome"], "vendidos": p["vendidos"]}
+        {"nome": p["produto__nome"], "vendidos": p["vendidos"]}
         for p in top_produtos
     ]
 
     # Lista de vendas detalhadas (só processa se houver vendas)
     vendas_list = []
-    if vendas_list_for_prediction:
-        for v in vendas_list_for_prediction:
-            caixa = v.movimentacao.caixa
+    if total_vendas:
+        for v in vendas:
+            caixa = v.caixa
             ficha = v.ficha
-            produto = v.movimentacao.produto
+            produto = v.produto
             data_venda = localtime(v.data)
             vendas_list.append({
                 "id": str(v.id),
@@ -90,26 +95,28 @@ def dashboard_data(request):
                 "produto_id": produto.id if produto else None,
                 "produto": produto.nome if produto else "N/A",
                 "produto_nome": produto.nome if produto else "N/A",
-                "produto_categoria": (produto.categoria or "Sem categoria") if produto else "Sem categoria",
+                "produto_categoria": v.categoria or "Sem categoria",
                 "produto_preco": float(v.valor_unitario or produto.preco) if produto else 0,
-                "categoria": (produto.categoria or "Sem categoria") if produto else "Sem categoria",
-                "quantidade": v.movimentacao.quantidade,
+                "categoria": v.categoria or "Sem categoria",
+                "quantidade": v.quantidade,
                 "valorTotal": float(v.valor_total),
             })
     
-    predicao_demanda, confianca_demanda = predict_hourly_demand(
-        vendas_por_horario,
-        vendas_list_for_prediction,
-    )
-    dias_ordenados = build_daily_sales(vendas_list_for_prediction)
+    # Previsões: sem filtros usa o snapshot pré-calculado (ver gerar_previsoes)
+    if any(request.query_params.get(param) for param in ('desde', 'ate', 'caixa', 'categoria')):
+        previsoes = calcular_previsoes(vendas)
+        previsoes_geradas_em = timezone.now()
+    else:
+        snapshot = snapshot_dashboard()
+        previsoes = snapshot.dados
+        previsoes_geradas_em = snapshot.gerado_em
+
+    dias_ordenados = build_daily_sales(vendas)
     crescimento = calculate_growth(dias_ordenados)
-    produtos_estoque_previsao, produtos_risco = predict_stock_needs(vendas_list_for_prediction)
     
     # 4. Ticket médio
     ticket_medio = float(receita) / total_vendas if total_vendas > 0 else 0
     
-    predicao_receita_3dias, confianca_receita = predict_revenue(dias_ordenados)
-    
     # 7. Horários de pico (identificação simples)
     horarios_ordenados = sorted(vendas_por_horario.items(), key=lambda x: x[1], reverse=True)
     horarios_pico = [{"horario": h[0], "vendas": h[1]} for h in horarios_ordenados[:3]]
@@ -127,6 +134,10 @@ def dashboard_data(request):
         tendencia_receita = []
         
     return Response({
+        "periodo": {
+            "desde": desde,
+            "ate": ate,
+        },
         "totalVendas": total_vendas,
         "receita": receita,
         "clientesAtivos": clientes_ativos,
@@ -137,19 +148,106 @@ def dashboard_data(request):
         "topProdutos": top_produtos_formatado,
         "vendasDetalhadas": vendas_list,
         # Predições ML
-        "predicaoDemanda": predicao_demanda,
-        "predicaoReceita3Dias": predicao_receita_3dias,
-        "produtosEstoquePrevisao": produtos_estoque_previsao[:10],  # Top 10
-        "produtosRiscoEstoque": produtos_risco[:5],  # Top 5 mais críticos
+        "predicaoDemanda": previsoes["predicaoDemanda"],
+        "predicaoReceita3Dias": previsoes["predicaoReceita3Dias"],
+        "produtosEstoquePrevisao": previsoes["produtosEstoquePrevisao"][:10],  # Top 10
+        "produtosRiscoEstoque": previsoes["produtosRiscoEstoque"][:5],  # Top 5 mais críticos
         "horariosPico": horarios_pico,
         "tendenciaVendas": {
             "dias": tendencia_dias,
             "vendas": tendencia_vendas,
             "receita": tendencia_receita,
         },
-        "confiancaPredicoes": {
-            "demanda": confianca_demanda,
-            "receita": confianca_receita,
-        },
+        "confiancaPredicoes": previsoes["confiancaPredicoes"],
+        "previsoesGeradasEm": previsoes_geradas_em,
         "reservas": build_reservation_insights()
     })
+
+
+class EstoquePrevisaoPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+@api_view(['GET'])
+@leitura_relatorios
+def estoque_previsao(request):
+    """Necessidade de reposição de todo o catálogo, paginada.
+
+    Parâmetros: `janela` (dias, padrão 7), `seguranca` (dias de cobertura,
+    padrão 3), `categoria`, `caixa` e `apenas_reposicao=true`.
+    """
+    try:
+        janela = int(request.query_params.get('janela', 7))
+        seguranca = int(request.query_params.get('seguranca', 3))
+        caixa = request.query_params.get('caixa')
+        caixa = int(caixa) if caixa else None
+    except ValueError:
+        return Response(
+            {"detail": "Parâmetros janela, seguranca e caixa devem ser números inteiros."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if janela < 1 or seguranca < 1:
+        return Response(
+            {"detail": "Parâmetros janela e seguranca devem ser maiores que zero."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    produtos = stock_needs_queryset(days_window=janela, safety_days=seguranca)
+    categoria = request.query_params.get('categoria')
+    if categoria:
+        produtos = produtos.filter(categoria=categoria)
+    if caixa:
+        produtos = produtos.filter(caixa_id=caixa)
+    if request.query_params.get('apenas_reposicao', '').lower() in ('true', '1', 't'):
+        produtos = produtos.filter(deficit__gt=0)
+
+    paginator = EstoquePrevisaoPagination()
+    pagina = paginator.paginate_queryset(produtos, request)
+    return paginator.get_paginated_response([
+        stock_need_row(produto, safety_days=seguranca)
+        for produto in pagina
+    ])
+
+
+@api_view(['GET'])
+@authentication_classes([CaixaTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def exportar(request, recurso):
+    """Exporta vendas, recargas, movimentações de estoque ou reservas em CSV.
+
+    Exige o token de caixa (`Authorization: Caixa <token>`). Parâmetros:
+    `desde`, `ate` (AAAA-MM-DD ou data/hora ISO), `caixa` (exceto reservas) e
+    `formato=excel` para CSV com `;` e vírgula decimal.
+    """
+    exportacao = EXPORTACOES.get(recurso)
+    if exportacao is None:
+        return Response(
+            {"detail": f"Exportação desconhecida. Opções: {', '.join(EXPORTACOES)}."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        queryset = filtrar_periodo(
+            exportacao.queryset(),
+            request.query_params,
+            campo=exportacao.campo_data,
+            por_caixa=exportacao.por_caixa,
+        )
+    except ValueError:
+        return Response(
+            {"detail": "Parâmetros inválidos. Use datas no formato AAAA-MM-DD e caixa numérico."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    excel = request.query_params.get('formato') == 'excel'
+    # Sob ASGI um iterador síncrono seria consumido inteiro antes do envio
+    gerar_linhas = alinhas_csv if isinstance(request._request, ASGIRequest) else linhas_csv
+    response = StreamingHttpResponse(
+        gerar_linhas(exportacao, queryset, excel=excel),
+        content_type='text/csv; charset=utf-8',
+    )
+    nome = f"{recurso}-{localtime(timezone.now()):%Y%m%d-%H%M}.csv"
+    response['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return response
@@ -63,7 +63,7 @@ admin.site.register(MovimentacaoEstoque, MovimentacaoEstoqueAdmin)
 
 class VendaAdmin(admin.ModelAdmin):
     list_display = ('caixa', 'produto', 'quantidade', 'preco_total', 'numero_ficha', 'data')
-    list_filter = ('movimentacao__caixa',)
+    list_filter = ('caixa', 'categoria')
     readonly_fields = ('valor_unitario', 'valor_total')
 
     def numero_ficha(self, obj):
@@ -0,0 +1,67 @@
+"""Regras de alerta de ruptura de estoque por produto.
+
+As regras são avaliadas de forma incremental a cada redução de estoque
+(em `MovimentacaoEstoque.save`/`delete`): o alerta só é emitido quando o
+estoque cruza o limite, comparando o valor anterior com o novo.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .eventos import TOPICO_ALERTA_ESTOQUE, publicar_apos_commit
+
+
+def taxa_venda_diaria(produto, janela_dias=None):
+    """Média de unidades vendidas por dia com vendas nos últimos `janela_dias`."""
+    if janela_dias is None:
+        janela_dias = settings.ALERTA_ESTOQUE_JANELA_DIAS
+    inicio = timezone.localdate() - timedelta(days=janela_dias - 1)
+    resumo = produto.vendas.filter(
+        data__gte=timezone.make_aware(datetime.combine(inicio, time.min))
+    ).aggregate(
+        quantidade=Sum('quantidade'),
+        dias=Count(TruncDate('data', tzinfo=timezone.get_current_timezone()), distinct=True),
+    )
+    if not resumo['quantidade']:
+        return 0
+    return resumo['quantidade'] / max(1, resumo['dias'])
+
+
+def avaliar_alertas_estoque(produto, estoque_anterior, estoque_atual):
+    """Publica alertas quando o estoque cruza o mínimo ou a cobertura mínima."""
+    if estoque_atual >= estoque_anterior:
+        return []
+
+    alertas = []
+    base = {
+        'produto_id': produto.id,
+        'produto': produto.nome,
+        'caixa_id': produto.caixa_id,
+        'estoque': estoque_atual,
+    }
+
+    limite = produto.estoque_minimo
+    if limite and estoque_atual <= limite < estoque_anterior:
+        alertas.append({**base, 'regra': 'estoque_minimo', 'limite': limite})
+
+    dias_minimos = produto.dias_cobertura_minimo
+    if dias_minimos:
+        taxa = taxa_venda_diaria(produto)
+        if taxa > 0:
+            cobertura_anterior = estoque_anterior / taxa
+            cobertura_atual = estoque_atual / taxa
+            if cobertura_atual < dias_minimos <= cobertura_anterior:
+                alertas.append({
+                    **base,
+                    'regra': 'dias_cobertura',
+                    'limite': dias_minimos,
+                    'dias_cobertura': round(cobertura_atual, 1),
+                    'taxa_diaria': round(taxa, 1),
+                })
+
+    for alerta in alertas:
+        publicar_apos_commit(TOPICO_ALERTA_ESTOQUE, alerta)
+    return alertas
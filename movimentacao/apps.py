@@ -1,5 +1,25 @@
 from django.apps import AppConfig
+from django.conf import settings
+
+from projetoIntegrador1.agendamento import processo_servidor
+
 
 class ProdutosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movimentacao'
+
+    def ready(self):
+        from movimentacao.autenticacao import conectar_sinais as conectar_sinais_autenticacao
+        conectar_sinais_autenticacao()
+        from movimentacao.qrcodes import conectar_sinais as conectar_sinais_qr_codes
+        conectar_sinais_qr_codes()
+
+        if settings.RESERVAS_PUBLICAS_ESTATICAS:
+            from movimentacao.publicacao import conectar_sinais, iniciar_publicador
+            conectar_sinais()
+            if processo_servidor():
+                iniciar_publicador()
+
+        if settings.RESERVAS_EXPIRACAO_AGENDADOR and processo_servidor():
+            from movimentacao.expiracao import iniciar_agendador
+            iniciar_agendador()
@@ -0,0 +1,180 @@
+"""Tokens de sessão dos caixas.
+
+O login do caixa devolve um token assinado (HMAC via `django.core.signing`)
+com o id do caixa, um id de sessão e o instante de emissão. A assinatura e a
+validade (`CAIXA_TOKEN_VALIDADE_SEGUNDOS`) são verificadas sem ir ao banco.
+
+A revogação (um token específico ou todos os tokens de um caixa emitidos até
+certo instante) é gravada em `RevogacaoTokenCaixa` e lida pelo cache: o
+estado de revogação de cada caixa fica em cache por
+`CAIXA_REVOGACOES_CACHE_SEGUNDOS` e é apagado a cada revogação. Só a primeira
+requisição de um caixa depois disso consulta o banco. Com um cache
+compartilhado (ex.: Redis) a revogação vale na hora em todos os processos;
+com o cache local padrão, os outros processos a enxergam quando a entrada
+expira.
+"""
+import secrets
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .models import Caixa, RevogacaoTokenCaixa
+
+SALT_TOKEN_CAIXA = 'movimentacao.caixa.token'
+PREFIXO_AUTORIZACAO = 'Caixa'
+
+
+def _instante(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def _chave_revogacoes(caixa_id):
+    return f'caixa:token:revogacoes:{caixa_id}'
+
+
+def gerar_token_caixa(caixa):
+    """Emite um token assinado para o caixa. Retorna (token, expira_em_timestamp)."""
+    emitido_em = round(time.time(), 3)
+    token = signing.dumps(
+        {'caixa': caixa.pk, 'sessao': secrets.token_urlsafe(12), 'emitido': emitido_em},
+        salt=SALT_TOKEN_CAIXA,
+        compress=True,
+    )
+    return token, emitido_em + settings.CAIXA_TOKEN_VALIDADE_SEGUNDOS
+
+
+def _revogacoes(caixa_id):
+    """(sessões revogadas, emitidos_ate) do caixa, ou None se ele não existe."""
+    chave = _chave_revogacoes(caixa_id)
+    revogacoes = cache.get(chave)
+    if revogacoes is None:
+        # Uma consulta: sem linhas, o caixa não existe; (None, None), sem revogações
+        linhas = list(
+            Caixa.objects.filter(pk=caixa_id)
+            .values_list('revogacoes_token__sessao', 'revogacoes_token__emitidos_ate')
+        )
+        revogacoes = (
+            frozenset(sessao for sessao, _ in linhas if sessao),
+            max((ate.timestamp() for _, ate in linhas if ate), default=None),
+        ) if linhas else False
+        cache.set(chave, revogacoes, settings.CAIXA_REVOGACOES_CACHE_SEGUNDOS)
+    return revogacoes or None
+
+
+def ler_token_caixa(token):
+    """Valida assinatura, validade e revogação. Levanta `signing.BadSignature`.
+
+    Um token de caixa excluído também é recusado.
+    """
+    dados = signing.loads(
+        token,
+        salt=SALT_TOKEN_CAIXA,
+        max_age=settings.CAIXA_TOKEN_VALIDADE_SEGUNDOS,
+    )
+    revogacoes = _revogacoes(dados['caixa'])
+    if revogacoes is None:
+        raise signing.BadSignature('Caixa inexistente.')
+    sessoes, emitidos_ate = revogacoes
+    if dados['sessao'] in sessoes or (emitidos_ate is not None and dados['emitido'] <= emitidos_ate):
+        raise signing.BadSignature('Token revogado.')
+    return dados
+
+
+def limpar_cache_revogacoes(caixa_id):
+    cache.delete(_chave_revogacoes(caixa_id))
+
+
+def _caixa_alterado(instance, **kwargs):
+    # Caixa excluído ou criado (com id reaproveitado) não herda o estado em cache
+    limpar_cache_revogacoes(instance.pk)
+
+
+def conectar_sinais():
+    uid = 'movimentacao.autenticacao'
+    post_save.connect(_caixa_alterado, sender=Caixa, dispatch_uid=f'{uid}.caixa.save')
+    post_delete.connect(_caixa_alterado, sender=Caixa, dispatch_uid=f'{uid}.caixa.delete')
+
+
+def _apagar_revogacoes_vencidas():
+    RevogacaoTokenCaixa.objects.filter(expira_em__lt=timezone.now()).delete()
+
+
+def revogar_token_caixa(dados):
+    """Revoga a sessão de um token já lido por `ler_token_caixa`."""
+    expira_em = _instante(dados['emitido'] + settings.CAIXA_TOKEN_VALIDADE_SEGUNDOS)
+    if expira_em > timezone.now():
+        _apagar_revogacoes_vencidas()
+        RevogacaoTokenCaixa.objects.bulk_create(
+            [RevogacaoTokenCaixa(caixa_id=dados['caixa'], sessao=dados['sessao'], expira_em=expira_em)],
+            ignore_conflicts=True,
+        )
+        limpar_cache_revogacoes(dados['caixa'])
+
+
+def revogar_tokens_caixa(caixa_id):
+    """Revoga todos os tokens do caixa emitidos até agora (ex.: troca de senha)."""
+    agora = _instante(round(time.time(), 3))
+    _apagar_revogacoes_vencidas()
+    RevogacaoTokenCaixa.objects.update_or_create(
+        caixa_id=caixa_id,
+        sessao='',
+        defaults={
+            'emitidos_ate': agora,
+            'expira_em': agora + timedelta(seconds=settings.CAIXA_TOKEN_VALIDADE_SEGUNDOS),
+        },
+    )
+    limpar_cache_revogacoes(caixa_id)
+
+
+class CaixaAutenticado:
+    """Usuário de `request.user` para requisições autenticadas por token de caixa.
+
+    Só carrega o `Caixa` do banco quando `caixa` é acessado.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, caixa_id, sessao):
+        self.id = self.pk = caixa_id
+        self.sessao = sessao
+
+    @cached_property
+    def caixa(self):
+        return Caixa.objects.get(pk=self.id)
+
+    def __str__(self):
+        return f'Caixa {self.id}'
+
+
+class CaixaTokenAuthentication(BaseAuthentication):
+    """Autenticação DRF pelo cabeçalho `Authorization: Caixa <token>`."""
+
+    def authenticate(self, request):
+        partes = get_authorization_header(request).split()
+        if not partes or partes[0].lower() != PREFIXO_AUTORIZACAO.lower().encode():
+            return None
+        if len(partes) != 2:
+            raise exceptions.AuthenticationFailed('Cabeçalho de autorização inválido.')
+
+        try:
+            dados = ler_token_caixa(partes[1].decode())
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Sessão do caixa expirada.')
+        except (signing.BadSignature, UnicodeDecodeError, KeyError, TypeError):
+            raise exceptions.AuthenticationFailed('Token de caixa inválido.')
+
+        return CaixaAutenticado(dados['caixa'], dados['sessao']), dados
+
+    def authenticate_header(self, request):
+        return PREFIXO_AUTORIZACAO
@@ -0,0 +1,236 @@
+"""Conversão de reservas em vendas, em lote.
+
+Equivale a criar, para cada reserva, a `MovimentacaoEstoque` de saída e a
+`Venda` correspondente, mas com poucas consultas: os produtos e as fichas
+envolvidos são bloqueados uma única vez (em ordem de id), estoque e saldo
+são validados antes de qualquer escrita, e movimentações, vendas, estoques,
+saldos e reservas são gravados com operações em lote.
+
+Como as operações em lote não passam por `save()`, os eventos do stream
+(estoque, venda, saldo e reserva) e os alertas de estoque são emitidos aqui.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+
+from projetoIntegrador1.metricas import medir_secao
+
+from .alertas import avaliar_alertas_estoque
+from .eventos import (
+    TOPICO_ESTOQUE,
+    TOPICO_RESERVA,
+    TOPICO_SALDO,
+    TOPICO_VENDA,
+    dados_estoque,
+    dados_reserva,
+    dados_saldo,
+    dados_venda,
+    publicar_apos_commit,
+)
+from .models import Ficha, MovimentacaoEstoque, Produto, ReservaProduto, Venda
+
+
+def _inserir(modelo, objetos):
+    """`bulk_create` garantindo que os objetos voltem com pk."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        return modelo.objects.bulk_create(objetos, batch_size=500)
+    # Bancos sem RETURNING em inserções múltiplas: uma inserção por objeto
+    return [modelo.objects.bulk_create([objeto])[0] for objeto in objetos]
+
+
+def converter_reservas_em_vendas(reservas, ficha=None, caixa=None, status='finalizada', parcial=False):
+    """Converte reservas pendentes em vendas.
+
+    `ficha` vincula todas as reservas a essa ficha (que o chamador já deve
+    ter criado ou bloqueado); sem ela, cada reserva usa a própria ficha.
+    `caixa` registra as movimentações nesse caixa; sem ele, usa o caixa do
+    produto.
+
+    Sem `parcial`, levanta `ValidationError` sem gravar nada se faltar
+    estoque ou saldo para qualquer reserva. Com `parcial=True`, as reservas
+    são atendidas em ordem e as que não couberem ficam em `rejeitadas`.
+    Retorna um resumo da conversão.
+    """
+    reservas = list(reservas)
+    resumo = {
+        'reservas': 0,
+        'itens': 0,
+        'valor_total': Decimal('0.00'),
+        'vendas': [],
+        'convertidas': [],
+        'rejeitadas': [],
+    }
+    if not reservas:
+        return resumo
+
+    with medir_secao('conversao_reservas') as secao, transaction.atomic():
+        produtos = {
+            produto.pk: produto
+            for produto in Produto.objects.select_for_update()
+            .filter(pk__in={reserva.produto_id for reserva in reservas})
+            .order_by('pk')
+        }
+        if ficha is not None:
+            fichas = {ficha.pk: ficha}
+        else:
+            fichas = {
+                f.pk: f
+                for f in Ficha.objects.select_for_update()
+                .filter(pk__in={reserva.ficha_id for reserva in reservas if reserva.ficha_id})
+                .order_by('pk')
+            }
+        secao.bloqueado()
+
+        def ficha_da(reserva):
+            return ficha if ficha is not None else fichas.get(reserva.ficha_id)
+
+        # Validação completa antes de qualquer escrita, reservando estoque e
+        # saldo reserva a reserva
+        estoque_livre = {pk: produto.estoque for pk, produto in produtos.items()}
+        saldo_livre = {pk: f.saldo for pk, f in fichas.items()}
+        aceitas = []
+        quantidade_por_produto = Counter()
+        valor_por_ficha = defaultdict(Decimal)
+        for reserva in reservas:
+            produto = produtos[reserva.produto_id]
+            ficha_reserva = ficha_da(reserva)
+            valor = produto.preco * reserva.quantidade
+            if ficha_reserva is None:
+                erro = "Reserva sem ficha vinculada."
+            elif estoque_livre[produto.pk] < reserva.quantidade:
+                erro = (
+                    f"Estoque insuficiente para {produto.nome}. "
+                    f"Disponível: {estoque_livre[produto.pk]}, Necessário: {reserva.quantidade}."
+                )
+            elif saldo_livre[ficha_reserva.pk] < valor:
+                erro = (
+                    f"Saldo insuficiente na ficha {ficha_reserva.numero}. "
+                    f"Disponível: R$ {saldo_livre[ficha_reserva.pk]:.2f}, Necessário: R$ {valor:.2f}."
+                )
+            else:
+                erro = None
+
+            if erro:
+                if not parcial:
+                    raise ValidationError(erro)
+                resumo['rejeitadas'].append((reserva, erro))
+                continue
+
+            estoque_livre[produto.pk] -= reserva.quantidade
+            saldo_livre[ficha_reserva.pk] -= valor
+            quantidade_por_produto[produto.pk] += reserva.quantidade
+            valor_por_ficha[ficha_reserva.pk] += valor
+            aceitas.append(reserva)
+
+        reservas = aceitas
+        if not reservas:
+            return resumo
+
+        movimentacoes = _inserir(MovimentacaoEstoque, [
+            MovimentacaoEstoque(
+                caixa=caixa or produtos[reserva.produto_id].caixa,
+                produto=produtos[reserva.produto_id],
+                quantidade=reserva.quantidade,
+                tipo='S',
+            )
+            for reserva in reservas
+        ])
+
+        # Estoque: um único UPDATE para todos os produtos
+        estoques_anteriores = {pk: produto.estoque for pk, produto in produtos.items()}
+        Produto.objects.filter(pk__in=quantidade_por_produto).update(estoque=Case(
+            *[
+                When(pk=produto_id, then=Value(estoques_anteriores[produto_id] - quantidade))
+                for produto_id, quantidade in quantidade_por_produto.items()
+            ],
+            output_field=IntegerField(),
+        ))
+
+        vendas = _inserir(Venda, [
+            Venda(
+                movimentacao=movimentacao,
+                ficha=ficha_da(reserva),
+                valor_unitario=movimentacao.produto.preco,
+                valor_total=movimentacao.produto.preco * movimentacao.quantidade,
+                produto=movimentacao.produto,
+                caixa=movimentacao.caixa,
+                quantidade=movimentacao.quantidade,
+                data=movimentacao.data,
+                categoria=movimentacao.produto.categoria or '',
+            )
+            for reserva, movimentacao in zip(reservas, movimentacoes)
+        ])
+
+        saldos_anteriores = {pk: f.saldo for pk, f in fichas.items()}
+        for ficha_id, valor in valor_por_ficha.items():
+            fichas[ficha_id].saldo -= valor
+        Ficha.objects.bulk_update([fichas[pk] for pk in valor_por_ficha], ['saldo'])
+
+        agora = timezone.now()
+        atualizacao = {'status': status, 'data_confirmacao': agora}
+        if ficha is not None:
+            atualizacao['ficha'] = ficha
+        ReservaProduto.objects.filter(pk__in=[reserva.pk for reserva in reservas]).update(**atualizacao)
+
+        # Eventos e alertas que os save() individuais emitiriam
+        for produto_id in quantidade_por_produto:
+            produto = produtos[produto_id]
+            produto.estoque = estoques_anteriores[produto_id] - quantidade_por_produto[produto_id]
+            publicar_apos_commit(TOPICO_ESTOQUE, dados_estoque(
+                produto_id=produto.pk,
+                produto=produto.nome,
+                caixa_id=produto.caixa_id,
+                estoque=produto.estoque,
+            ))
+            avaliar_alertas_estoque(produto, estoques_anteriores[produto_id], produto.estoque)
+
+        for venda in vendas:
+            publicar_apos_commit(TOPICO_VENDA, dados_venda(
+                venda_id=venda.pk,
+                ficha_id=venda.ficha_id,
+                produto_id=venda.produto_id,
+                caixa_id=venda.caixa_id,
+                quantidade=venda.quantidade,
+                valor_total=venda.valor_total,
+            ))
+
+        for ficha_id in valor_por_ficha:
+            f = fichas[ficha_id]
+            publicar_apos_commit(TOPICO_SALDO, dados_saldo(
+                ficha_id=f.pk,
+                numero=f.numero,
+                saldo=f.saldo,
+                saldo_anterior=saldos_anteriores[ficha_id],
+            ))
+            f._saldo_original = f.saldo
+
+        for reserva in reservas:
+            status_anterior = reserva.status
+            reserva.status = status
+            reserva.data_confirmacao = agora
+            if ficha is not None:
+                reserva.ficha = ficha
+            reserva._status_original = status
+            if status_anterior != status:
+                publicar_apos_commit(TOPICO_RESERVA, dados_reserva(
+                    reserva_id=reserva.pk,
+                    produto_id=reserva.produto_id,
+                    ficha_id=reserva.ficha_id,
+                    qr_code_reserva_id=reserva.qr_code_reserva_id,
+                    quantidade=reserva.quantidade,
+                    status=status,
+                    status_anterior=status_anterior,
+                ))
+
+    resumo.update({
+        'reservas': len(reservas),
+        'itens': sum(quantidade_por_produto.values()),
+        'valor_total': sum(valor_por_ficha.values(), Decimal('0.00')),
+        'vendas': [venda.pk for venda in vendas],
+        'convertidas': list(zip(reservas, vendas)),
+    })
+    return resumo
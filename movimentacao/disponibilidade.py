@@ -0,0 +1,53 @@
+"""Disponibilidade pública dos QR codes de reserva.
+
+Monta o JSON de `reservas-publicas/<qr_code>/produtos/`; usado pelas views
+públicas (síncrona e assíncrona) e pela publicação estática.
+"""
+from django.db.models import Sum
+
+from .models import ReservaProduto
+
+
+def erro_periodo_qr(qr, agora):
+    """Mensagem de erro se o QR code ainda não começou ou já expirou"""
+    # Verifica se ainda não começou
+    if qr.data_inicio and qr.data_inicio > agora:
+        return 'QR code ainda não está ativo'
+    
+    # Verifica expiração
+    if qr.data_expiracao and qr.data_expiracao < agora:
+        return 'QR code expirado'
+    return None
+
+
+def produtos_publicos_data(qr, produtos, reservas_por_produto):
+    produtos_data = []
+    for produto in produtos:
+        reservas_ativas = reservas_por_produto.get(produto.id, 0)
+        disponivel = produto.quantidade_reserva_disponivel - reservas_ativas
+        
+        produtos_data.append({
+            'id': produto.id,
+            'nome': produto.nome,
+            'preco': float(produto.preco),
+            'limite_reserva': produto.limite_reserva,
+            'disponivel': max(0, disponivel),
+            'categoria': produto.categoria,
+            'reservado': reservas_ativas,
+            'quantidade_reserva_disponivel': produto.quantidade_reserva_disponivel,
+        })
+    
+    return {
+        'qr_code': qr.codigo,
+        'descricao': qr.descricao,
+        'data_inicio': qr.data_inicio,
+        'data_expiracao': qr.data_expiracao,
+        'produtos': produtos_data
+    }
+
+
+def reservas_ativas_queryset(produto_ids):
+    return ReservaProduto.objects.filter(
+        produto_id__in=produto_ids,
+        status__in=['pendente', 'confirmada']
+    ).values('produto_id').annotate(total=Sum('quantidade'))
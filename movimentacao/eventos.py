@@ -0,0 +1,207 @@
+"""Broker de eventos usado pelos streams server-sent events.
+
+Os eventos ficam num buffer circular com id crescente; assinantes aguardam
+novos eventos a partir do último id recebido (cabeçalho Last-Event-ID).
+
+O broker padrão (`BrokerLocal`) vale para um único processo. Outro broker
+pode ser configurado em `EVENTOS_BROKER` (caminho pontuado para a classe),
+desde que implemente a interface de `BrokerBase`.
+"""
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from projetoIntegrador1 import metricas
+
+Evento = namedtuple('Evento', ['id', 'topico', 'dados', 'data'])
+
+TOPICO_ESTOQUE = 'estoque'
+TOPICO_SALDO = 'saldo'
+TOPICO_RESERVA = 'reserva'
+TOPICO_VENDA = 'venda'
+TOPICO_ALERTA_ESTOQUE = 'alerta_estoque'
+
+TOPICOS = {
+    TOPICO_ESTOQUE,
+    TOPICO_SALDO,
+    TOPICO_RESERVA,
+    TOPICO_VENDA,
+    TOPICO_ALERTA_ESTOQUE,
+}
+
+
+class BrokerBase(ABC):
+    """Interface esperada pelos streams SSE."""
+
+    @property
+    @abstractmethod
+    def ultimo_id(self):
+        """Id do último evento publicado."""
+
+    @abstractmethod
+    def publicar(self, topico, dados):
+        """Publica um evento e o devolve."""
+
+    @abstractmethod
+    def eventos_desde(self, ultimo_id, topicos=None):
+        """Eventos dos `topicos` posteriores a `ultimo_id` ainda no buffer."""
+
+    @abstractmethod
+    def aguardar(self, ultimo_id, topicos=None, timeout=15):
+        """Bloqueia até haver eventos dos `topicos` após `ultimo_id` ou até o timeout."""
+
+    @abstractmethod
+    async def aguardar_async(self, ultimo_id, topicos=None, timeout=15):
+        """Versão assíncrona de `aguardar`, usada sob ASGI."""
+
+
+class BrokerLocal(BrokerBase):
+    """Broker em memória, válido para um único processo."""
+
+    def __init__(self, capacidade=1000):
+        self._eventos = deque(maxlen=capacidade)
+        self._condicao = threading.Condition()
+        self._ultimo_id = 0
+        # Assinantes assíncronos: (loop, asyncio.Event)
+        self._assinantes_async = set()
+
+    @property
+    def ultimo_id(self):
+        return self._ultimo_id
+
+    def publicar(self, topico, dados):
+        with self._condicao:
+            self._ultimo_id += 1
+            evento = Evento(self._ultimo_id, topico, dados, timezone.now())
+            self._eventos.append(evento)
+            self._condicao.notify_all()
+            assinantes = list(self._assinantes_async)
+        for loop, sinal in assinantes:
+            loop.call_soon_threadsafe(sinal.set)
+        return evento
+
+    def _eventos_desde(self, ultimo_id, topicos):
+        # Chamado com o lock; percorre só o fim do buffer, posterior a `ultimo_id`
+        eventos = []
+        for evento in reversed(self._eventos):
+            if evento.id <= ultimo_id:
+                break
+            if not topicos or evento.topico in topicos:
+                eventos.append(evento)
+        eventos.reverse()
+        return eventos
+
+    def eventos_desde(self, ultimo_id, topicos=None):
+        with self._condicao:
+            return self._eventos_desde(ultimo_id, topicos)
+
+    def aguardar(self, ultimo_id, topicos=None, timeout=15):
+        # O predicado considera os tópicos: eventos de outros tópicos não
+        # acordam o assinante, que seguiria sem nada para enviar
+        with self._condicao:
+            return self._condicao.wait_for(
+                lambda: self._eventos_desde(ultimo_id, topicos), timeout=timeout
+            )
+
+    async def aguardar_async(self, ultimo_id, topicos=None, timeout=15):
+        loop = asyncio.get_running_loop()
+        limite = loop.time() + timeout
+        sinal = asyncio.Event()
+        assinante = (loop, sinal)
+        with self._condicao:
+            self._assinantes_async.add(assinante)
+        try:
+            while True:
+                sinal.clear()
+                eventos = self.eventos_desde(ultimo_id, topicos)
+                restante = limite - loop.time()
+                if eventos or restante <= 0:
+                    return eventos
+                try:
+                    await asyncio.wait_for(sinal.wait(), restante)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condicao:
+                self._assinantes_async.discard(assinante)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENTOS_BROKER)()
+    return _broker
+
+
+def _contar(topico, dados):
+    """Contadores de negócio de `/metricas/`, derivados dos eventos publicados."""
+    if not settings.METRICAS_ATIVAS:
+        return
+    metricas.EVENTOS.incrementar(topico=topico)
+    if topico == TOPICO_VENDA:
+        metricas.VENDAS.incrementar()
+        metricas.VALOR_VENDIDO.incrementar(float(dados.get('valor_total') or 0))
+    elif topico == TOPICO_RESERVA and dados.get('status_anterior') is None:
+        metricas.RESERVAS_CRIADAS.incrementar()
+
+
+# Dados de cada tópico; todos os publicadores montam o evento por aqui
+def dados_estoque(*, produto_id, produto, caixa_id, estoque):
+    return {'produto_id': produto_id, 'produto': produto, 'caixa_id': caixa_id, 'estoque': estoque}
+
+
+def dados_saldo(*, ficha_id, numero, saldo, saldo_anterior):
+    return {'ficha_id': ficha_id, 'numero': numero, 'saldo': saldo, 'saldo_anterior': saldo_anterior}
+
+
+def dados_venda(*, venda_id, ficha_id, produto_id, caixa_id, quantidade, valor_total):
+    return {
+        'venda_id': venda_id,
+        'ficha_id': ficha_id,
+        'produto_id': produto_id,
+        'caixa_id': caixa_id,
+        'quantidade': quantidade,
+        'valor_total': valor_total,
+    }
+
+
+def dados_reserva(*, reserva_id, produto_id, ficha_id, qr_code_reserva_id, quantidade, status, status_anterior):
+    return {
+        'reserva_id': reserva_id,
+        'produto_id': produto_id,
+        'ficha_id': ficha_id,
+        'qr_code_reserva_id': qr_code_reserva_id,
+        'quantidade': quantidade,
+        'status': status,
+        'status_anterior': status_anterior,
+    }
+
+
+def publicar_apos_commit(topico, dados):
+    """Publica o evento somente depois que a transação atual for confirmada."""
+    def publicar():
+        get_broker().publicar(topico, dados)
+        _contar(topico, dados)
+
+    transaction.on_commit(publicar)
+
+
+def formatar_sse(evento):
+    dados = json.dumps(
+        {'topico': evento.topico, 'data': evento.data, **evento.dados},
+        cls=DjangoJSONEncoder,
+    )
+    return f"id: {evento.id}\nevent: {evento.topico}\ndata: {dados}\n\n"
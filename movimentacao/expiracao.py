@@ -0,0 +1,96 @@
+"""Expiração de reservas pendentes sem ficha.
+
+Uma reserva feita pelo QR code fica retida (consumindo a
+`quantidade_reserva_disponivel` do produto) até virar venda ou ser
+cancelada. Reservas pendentes e sem ficha mais antigas que o tempo de
+retenção do QR code (`QRCodeReserva.tempo_retencao_minutos`, ou
+`RESERVAS_RETENCAO_MINUTOS` quando vazio) são canceladas em lotes, o que
+devolve a capacidade para novas reservas.
+"""
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.timezone import timedelta
+
+from projetoIntegrador1.agendamento import iniciar_thread_periodica
+
+from .eventos import TOPICO_RESERVA, dados_reserva, publicar_apos_commit
+from .models import QRCodeReserva, ReservaProduto
+
+# Reservas canceladas por transação
+TAMANHO_LOTE = 500
+
+
+def _retencoes():
+    """Pares (filtro, minutos) com as regras de retenção em vigor."""
+    regras = [
+        (Q(qr_code_reserva_id=qr_id), minutos)
+        for qr_id, minutos in QRCodeReserva.objects.filter(
+            tempo_retencao_minutos__gt=0
+        ).values_list('id', 'tempo_retencao_minutos')
+    ]
+    padrao = settings.RESERVAS_RETENCAO_MINUTOS
+    if padrao > 0:
+        regras.append((
+            Q(qr_code_reserva__isnull=True) | Q(qr_code_reserva__tempo_retencao_minutos__isnull=True),
+            padrao,
+        ))
+    return regras
+
+
+def cancelar_reservas_expiradas(agora=None, tamanho_lote=TAMANHO_LOTE):
+    """Cancela as reservas retidas além do prazo. Retorna quantas foram canceladas."""
+    agora = agora or timezone.now()
+    canceladas = 0
+
+    for filtro, minutos in _retencoes():
+        expiradas = ReservaProduto.objects.filter(
+            filtro,
+            status='pendente',
+            ficha__isnull=True,
+            data_reserva__lt=agora - timedelta(minutes=minutos),
+        )
+        while True:
+            with transaction.atomic():
+                # Reservas bloqueadas por outra transação (ex.: virando venda) ficam para depois
+                lote = list(
+                    expiradas.select_for_update(skip_locked=True, of=('self',))
+                    .order_by('id')
+                    .values_list('id', 'produto_id', 'qr_code_reserva_id', 'quantidade')[:tamanho_lote]
+                )
+                if not lote:
+                    break
+                ReservaProduto.objects.filter(id__in=[linha[0] for linha in lote]).update(status='cancelada')
+
+                # update() não passa por ReservaProduto.save(); publica as mudanças aqui
+                for reserva_id, produto_id, qr_code_reserva_id, quantidade in lote:
+                    publicar_apos_commit(TOPICO_RESERVA, dados_reserva(
+                        reserva_id=reserva_id,
+                        produto_id=produto_id,
+                        ficha_id=None,
+                        qr_code_reserva_id=qr_code_reserva_id,
+                        quantidade=quantidade,
+                        status='cancelada',
+                        status_anterior='pendente',
+                    ))
+            canceladas += len(lote)
+
+    return canceladas
+
+
+_agendador = None
+_agendador_lock = threading.Lock()
+
+
+def iniciar_agendador(intervalo=None):
+    """Inicia (uma vez por processo) a thread que expira as reservas retidas."""
+    global _agendador
+    if intervalo is None:
+        intervalo = settings.RESERVAS_EXPIRACAO_INTERVALO_SEGUNDOS
+    with _agendador_lock:
+        if _agendador is None:
+            _agendador = iniciar_thread_periodica('reservas-expiracao', cancelar_reservas_expiradas, intervalo)
+    return _agendador
@@ -0,0 +1,107 @@
+"""Folhas para impressão (PDF) geradas com reportlab."""
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+# Grade de fichas por página A4
+FICHAS_COLUNAS = 4
+FICHAS_LINHAS = 8
+MARGEM = 10 * mm
+
+
+def folha_fichas_pdf(numeros, titulo=''):
+    """Gera um PDF com um cartão recortável por número de ficha."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    largura_pagina, altura_pagina = A4
+    largura = (largura_pagina - 2 * MARGEM) / FICHAS_COLUNAS
+    altura = (altura_pagina - 2 * MARGEM) / FICHAS_LINHAS
+    por_pagina = FICHAS_COLUNAS * FICHAS_LINHAS
+
+    for indice, numero in enumerate(numeros):
+        if indice and indice % por_pagina == 0:
+            pdf.showPage()
+        posicao = indice % por_pagina
+        x = MARGEM + (posicao % FICHAS_COLUNAS) * largura
+        y = altura_pagina - MARGEM - (posicao // FICHAS_COLUNAS + 1) * altura
+
+        pdf.setDash(2, 2)
+        pdf.rect(x, y, largura, altura)
+        pdf.setDash()
+        if titulo:
+            pdf.setFont('Helvetica', 8)
+            pdf.drawCentredString(x + largura / 2, y + altura - 5 * mm, titulo)
+        pdf.setFont('Helvetica-Bold', 26)
+        pdf.drawCentredString(x + largura / 2, y + altura / 2 - 4 * mm, str(numero))
+
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _moeda(valor):
+    return f"R$ {valor:.2f}".replace('.', ',')
+
+
+def lista_separacao_pdf(titulo, produtos, clientes):
+    """Gera o PDF da lista de separação de um QR code.
+
+    `produtos` e `clientes` são os agregados de `QRCodeReservaViewSet.separacao`:
+    primeiro os totais por produto, depois um bloco por cliente com os itens
+    a separar e uma caixa de conferência por item.
+    """
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    largura_pagina, altura_pagina = A4
+    linha = 5 * mm
+    y = altura_pagina - MARGEM
+
+    def reservar_espaco(altura):
+        nonlocal y
+        if y - altura < MARGEM:
+            pdf.showPage()
+            y = altura_pagina - MARGEM
+
+    def escrever(texto, x=MARGEM, fonte='Helvetica', tamanho=10, direita=None):
+        pdf.setFont(fonte, tamanho)
+        pdf.drawString(x, y, texto)
+        if direita is not None:
+            pdf.drawRightString(largura_pagina - MARGEM, y, direita)
+
+    reservar_espaco(linha * 2)
+    escrever(f"Lista de separação - {titulo}", fonte='Helvetica-Bold', tamanho=14)
+    y -= linha * 2
+
+    reservar_espaco(linha * 2)
+    escrever("Totais por produto", fonte='Helvetica-Bold', tamanho=11)
+    y -= linha
+    for produto in produtos:
+        reservar_espaco(linha)
+        escrever(
+            f"{produto['quantidade']:>5} x {produto['produto']}",
+            direita=f"{produto['reservas']} reserva(s)   {_moeda(produto['valor_total'])}",
+        )
+        y -= linha
+    y -= linha
+
+    for cliente in clientes:
+        # Mantém o cabeçalho do cliente junto do primeiro item
+        reservar_espaco(linha * 3)
+        pdf.line(MARGEM, y + linha - 1 * mm, largura_pagina - MARGEM, y + linha - 1 * mm)
+        ficha = f"  ficha {cliente['ficha']}" if cliente['ficha'] else ''
+        escrever(
+            f"{cliente['nome_completo']} ({cliente['cpf']}){ficha}",
+            fonte='Helvetica-Bold',
+            direita=_moeda(cliente['valor_total']),
+        )
+        y -= linha
+        for item in cliente['itens']:
+            reservar_espaco(linha)
+            pdf.rect(MARGEM, y - 0.5 * mm, 3 * mm, 3 * mm)
+            escrever(f"{item['quantidade']:>3} x {item['produto']}", x=MARGEM + 5 * mm)
+            y -= linha
+        y -= linha / 2
+
+    pdf.save()
+    return buffer.getvalue()
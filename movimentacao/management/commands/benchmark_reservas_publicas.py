@@ -0,0 +1,99 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispara uma rajada de requisições contra os endpoints públicos de reserva "
+        "de um servidor em execução e mostra vazão e latência. Rode uma vez contra "
+        "o deploy WSGI e outra contra o ASGI (VIEWS_PUBLICAS_ASYNC=True) para comparar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://127.0.0.1:8000",
+            help="URL base do servidor.",
+        )
+        parser.add_argument(
+            "--qr-code",
+            required=True,
+            help="Código do QR usado em reservas-publicas/<qr_code>/produtos/.",
+        )
+        parser.add_argument(
+            "--cpf",
+            help="CPF consultado em reservas-publicas/por-cpf/ (opcional).",
+        )
+        parser.add_argument(
+            "--requisicoes",
+            type=int,
+            default=500,
+            help="Total de requisições da rajada.",
+        )
+        parser.add_argument(
+            "--concorrencia",
+            type=int,
+            default=50,
+            help="Requisições simultâneas.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30,
+            help="Timeout de cada requisição, em segundos.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requisicoes"] < 1 or options["concorrencia"] < 1:
+            raise CommandError("--requisicoes e --concorrencia devem ser positivos.")
+
+        base = options["url"].rstrip("/")
+        urls = [f"{base}/movimentacao/reservas-publicas/{quote(options['qr_code'])}/produtos/"]
+        if options["cpf"]:
+            urls.append(
+                f"{base}/movimentacao/reservas-publicas/por-cpf/?{urlencode({'cpf': options['cpf']})}"
+            )
+
+        for url in urls:
+            self._rajada(url, options["requisicoes"], options["concorrencia"], options["timeout"])
+
+    def _rajada(self, url, requisicoes, concorrencia, timeout):
+        def requisitar(_):
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as resposta:
+                    resposta.read()
+                    ok = resposta.status == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            resultados = list(executor.map(requisitar, range(requisicoes)))
+        duracao = time.perf_counter() - inicio
+
+        latencias = sorted(latencia for ok, latencia in resultados if ok)
+        erros = len(resultados) - len(latencias)
+
+        self.stdout.write(url)
+        self.stdout.write(f"  requisições: {requisicoes} (concorrência {concorrencia}), erros: {erros}")
+        self.stdout.write(f"  duração: {duracao:.2f} s, vazão: {len(latencias) / duracao:.1f} req/s")
+        if latencias:
+            self.stdout.write(
+                "  latência (ms): "
+                f"p50 {self._percentil(latencias, 50):.1f}, "
+                f"p95 {self._percentil(latencias, 95):.1f}, "
+                f"p99 {self._percentil(latencias, 99):.1f}, "
+                f"máx {latencias[-1] * 1000:.1f}"
+            )
+
+    @staticmethod
+    def _percentil(latencias, percentil):
+        indice = min(len(latencias) - 1, int(len(latencias) * percentil / 100))
+        return latencias[indice] * 1000
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projetoIntegrador1.sqlite.base import PRAGMAS_PADRAO
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o SQLite padrão com o perfil de produção (WAL, busy_timeout, "
+        "BEGIN IMMEDIATE) simulando vários caixas gravando ao mesmo tempo. "
+        "Usa um banco temporário; o banco do projeto não é alterado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--caixas",
+            type=int,
+            default=4,
+            help="Threads gravando ao mesmo tempo.",
+        )
+        parser.add_argument(
+            "--operacoes",
+            type=int,
+            default=300,
+            help="Transações (venda: lê estoque, grava movimentação e estoque) por caixa.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=5,
+            help="Timeout de lock da conexão, em segundos (padrão do Django: 5).",
+        )
+
+    def handle(self, *args, **options):
+        if options["caixas"] < 1 or options["operacoes"] < 1:
+            raise CommandError("--caixas e --operacoes devem ser positivos.")
+
+        for nome, perfil in (("padrão", False), ("perfil", True)):
+            with tempfile.TemporaryDirectory() as diretorio:
+                caminho = os.path.join(diretorio, "benchmark.sqlite3")
+                self._preparar(caminho, perfil)
+                resultado = self._executar(
+                    caminho, perfil, options["caixas"], options["operacoes"], options["timeout"]
+                )
+            self._relatar(nome, options["caixas"], resultado)
+
+    def _conectar(self, caminho, perfil, timeout):
+        conexao = sqlite3.connect(
+            caminho, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        if perfil:
+            for nome, valor in PRAGMAS_PADRAO.items():
+                conexao.execute(f"PRAGMA {nome} = {valor}")
+        return conexao
+
+    def _preparar(self, caminho, perfil):
+        conexao = self._conectar(caminho, perfil, 5)
+        conexao.executescript(
+            """
+            CREATE TABLE produto (id INTEGER PRIMARY KEY, estoque INTEGER NOT NULL);
+            CREATE TABLE movimentacao (
+                id INTEGER PRIMARY KEY,
+                produto_id INTEGER NOT NULL,
+                quantidade INTEGER NOT NULL,
+                data REAL NOT NULL
+            );
+            """
+        )
+        conexao.executemany(
+            "INSERT INTO produto (id, estoque) VALUES (?, ?)",
+            [(produto, 1_000_000) for produto in range(1, 11)],
+        )
+        conexao.close()
+
+    def _executar(self, caminho, perfil, caixas, operacoes, timeout):
+        inicio_transacao = "BEGIN IMMEDIATE" if perfil else "BEGIN"
+        latencias = []
+        erros = []
+        lock = threading.Lock()
+
+        def caixa(indice):
+            conexao = self._conectar(caminho, perfil, timeout)
+            minhas_latencias = []
+            meus_erros = 0
+            for operacao in range(operacoes):
+                produto = (indice + operacao) % 10 + 1
+                inicio = time.perf_counter()
+                try:
+                    conexao.execute(inicio_transacao)
+                    estoque = conexao.execute(
+                        "SELECT estoque FROM produto WHERE id = ?", (produto,)
+                    ).fetchone()[0]
+                    conexao.execute(
+                        "INSERT INTO movimentacao (produto_id, quantidade, data) VALUES (?, ?, ?)",
+                        (produto, 1, time.time()),
+                    )
+                    conexao.execute(
+                        "UPDATE produto SET estoque = ? WHERE id = ?", (estoque - 1, produto)
+                    )
+                    conexao.execute("COMMIT")
+                    minhas_latencias.append(time.perf_counter() - inicio)
+                except sqlite3.OperationalError:
+                    meus_erros += 1
+                    if conexao.in_transaction:
+                        conexao.execute("ROLLBACK")
+            conexao.close()
+            with lock:
+                latencias.extend(minhas_latencias)
+                erros.append(meus_erros)
+
+        threads = [threading.Thread(target=caixa, args=(indice,)) for indice in range(caixas)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            "duracao": time.perf_counter() - inicio,
+            "latencias": sorted(latencias),
+            "erros": sum(erros),
+        }
+
+    def _relatar(self, nome, caixas, resultado):
+        latencias = resultado["latencias"]
+        self.stdout.write(f"{nome} ({caixas} caixas)")
+        self.stdout.write(
+            f"  transações: {len(latencias)}, 'database is locked': {resultado['erros']}"
+        )
+        self.stdout.write(
+            f"  duração: {resultado['duracao']:.2f} s, "
+            f"vazão: {len(latencias) / resultado['duracao']:.1f} transações/s"
+        )
+        if latencias:
+            p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+            self.stdout.write(
+                f"  latência (ms): p50 {latencias[len(latencias) // 2] * 1000:.2f}, "
+                f"p95 {p95 * 1000:.2f}, máx {latencias[-1] * 1000:.2f}"
+            )
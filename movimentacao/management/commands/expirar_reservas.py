@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from movimentacao.expiracao import cancelar_reservas_expiradas
+
+
+class Command(BaseCommand):
+    help = "Cancela reservas pendentes sem ficha que passaram do tempo de retenção."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Continua executando e varre as reservas periodicamente.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=int,
+            default=settings.RESERVAS_EXPIRACAO_INTERVALO_SEGUNDOS,
+            help="Segundos entre varreduras no modo --loop.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["loop"]:
+            self._executar()
+            return
+
+        self.stdout.write("Expirando reservas periodicamente (Ctrl+C para sair)...")
+        try:
+            while True:
+                self._executar()
+                close_old_connections()
+                time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            pass
+
+    def _executar(self):
+        canceladas = cancelar_reservas_expiradas()
+        if canceladas:
+            self.stdout.write(self.style.SUCCESS(f"{canceladas} reserva(s) expirada(s) cancelada(s)."))
@@ -330,6 +330,7 @@ class Command(BaseCommand):
             Venda.objects.filter(pk=venda.pk).update(
                 valor_unitario=produto.preco,
                 valor_total=produto.preco * quantidade,
+                data=data,
             )
 
     def _criar_reservas(self, fichas, produtos, now):
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from movimentacao.publicacao import TRAVA_PUBLICADOR, executar_publicador, publicar_qr_codes
+from projetoIntegrador1.agendamento import obter_trava_processo
+
+
+class Command(BaseCommand):
+    help = (
+        "Grava o JSON de disponibilidade de cada QR code de reserva em "
+        "RESERVAS_PUBLICAS_ESTATICAS_DIR, para o servidor web entregar direto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Continua executando e regrava os arquivos periodicamente.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=int,
+            default=settings.RESERVAS_PUBLICAS_ESTATICAS_INTERVALO_SEGUNDOS,
+            help="Segundos entre publicações no modo --loop.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["loop"]:
+            alterados = publicar_qr_codes()
+            self.stdout.write(self.style.SUCCESS(
+                f"{alterados} arquivo(s) atualizado(s) em {settings.RESERVAS_PUBLICAS_ESTATICAS_DIR}."
+            ))
+            return
+
+        if not obter_trava_processo(TRAVA_PUBLICADOR):
+            raise CommandError("Já existe um publicador rodando nesta máquina.")
+
+        self.stdout.write("Publicando a disponibilidade periodicamente (Ctrl+C para sair)...")
+        try:
+            executar_publicador(options["intervalo"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,94 @@
+# Generated by Django 4.2.9 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_sale_snapshot(apps, schema_editor):
+    Venda = apps.get_model("movimentacao", "Venda")
+
+    vendas = Venda.objects.select_related("movimentacao__produto").order_by("pk")
+    lote = []
+    for venda in vendas.iterator(chunk_size=500):
+        movimentacao = venda.movimentacao
+        venda.produto_id = movimentacao.produto_id
+        venda.caixa_id = movimentacao.caixa_id
+        venda.quantidade = movimentacao.quantidade
+        venda.data = movimentacao.data
+        venda.categoria = movimentacao.produto.categoria or ""
+        lote.append(venda)
+        if len(lote) >= 500:
+            Venda.objects.bulk_update(lote, ["produto", "caixa", "quantidade", "data", "categoria"])
+            lote = []
+    if lote:
+        Venda.objects.bulk_update(lote, ["produto", "caixa", "quantidade", "data", "categoria"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movimentacao", "0022_venda_valor_total_venda_valor_unitario_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="venda",
+            name="caixa",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="vendas",
+                to="movimentacao.caixa",
+            ),
+        ),
+        migrations.AddField(
+            model_name="venda",
+            name="categoria",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Categoria do produto no momento da venda",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="venda",
+            name="data",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="venda",
+            name="produto",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="vendas",
+                to="movimentacao.produto",
+            ),
+        ),
+        migrations.AddField(
+            model_name="venda",
+            name="quantidade",
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(
+            populate_sale_snapshot,
+            migrations.RunPython.noop,
+        ),
+        migrations.AddIndex(
+            model_name="venda",
+            index=models.Index(fields=["data"], name="movimentaca_data_26b424_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="venda",
+            index=models.Index(fields=["produto", "data"], name="movimentaca_produto_b47ec4_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="venda",
+            index=models.Index(fields=["caixa", "data"], name="movimentaca_caixa_i_70cc14_idx"),
+        ),
+    ]
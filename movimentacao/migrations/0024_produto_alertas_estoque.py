@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movimentacao', '0023_venda_desnormalizacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='dias_cobertura_minimo',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Alerta quando o estoque cobrir menos dias que isto, pelo ritmo recente de vendas'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='estoque_minimo',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Alerta quando o estoque chegar a este valor'),
+        ),
+    ]
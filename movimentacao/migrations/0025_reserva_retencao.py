@@ -0,0 +1,22 @@
+# Generated by Django 4.2.9 on 2026-10-19 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movimentacao', '0024_produto_alertas_estoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrcodereserva',
+            name='tempo_retencao_minutos',
+            field=models.PositiveIntegerField(blank=True, help_text='Minutos que uma reserva pendente sem ficha fica retida antes de expirar (vazio: padrão do sistema; 0: não expira)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reservaproduto',
+            index=models.Index(condition=models.Q(('ficha__isnull', True), ('status', 'pendente')), fields=['qr_code_reserva', 'data_reserva'], name='reserva_retida_idx'),
+        ),
+    ]
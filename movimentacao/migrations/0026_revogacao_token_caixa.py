@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movimentacao', '0025_reserva_retencao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevogacaoTokenCaixa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sessao', models.CharField(blank=True, default='', max_length=32)),
+                ('emitidos_ate', models.DateTimeField(blank=True, null=True)),
+                ('expira_em', models.DateTimeField(db_index=True)),
+                ('caixa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revogacoes_token', to='movimentacao.caixa')),
+            ],
+            options={
+                'verbose_name': 'Revogação de token de caixa',
+                'verbose_name_plural': 'Revogações de tokens de caixa',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='revogacaotokencaixa',
+            constraint=models.UniqueConstraint(fields=('caixa', 'sessao'), name='revogacao_token_caixa_sessao'),
+        ),
+    ]
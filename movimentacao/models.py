@@ -1,11 +1,27 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.db import transaction
 from django.contrib.auth.hashers import check_password, identify_hasher, make_password
 from decimal import Decimal
 
+from projetoIntegrador1.metricas import medir_secao
+
+from .alertas import avaliar_alertas_estoque
+from .eventos import (
+    TOPICO_ESTOQUE,
+    TOPICO_RESERVA,
+    TOPICO_SALDO,
+    TOPICO_VENDA,
+    dados_estoque,
+    dados_reserva,
+    dados_saldo,
+    dados_venda,
+    publicar_apos_commit,
+)
+
 
 def is_encoded_password(value):
     if not value:
@@ -45,6 +61,29 @@ class Caixa(models.Model):
         if self.senha and not is_encoded_password(self.senha):
             self.set_senha(self.senha)
         super().save(*args, **kwargs)
+
+
+class RevogacaoTokenCaixa(models.Model):
+    """Tokens de caixa revogados antes de expirar.
+
+    Com `sessao`, revoga só o token daquela sessão; com `sessao` vazia, todos
+    os tokens do caixa emitidos até `emitidos_ate`. Depois de `expira_em` os
+    tokens afetados já expiraram e o registro pode ser apagado.
+    """
+    caixa = models.ForeignKey(Caixa, on_delete=models.CASCADE, related_name='revogacoes_token')
+    sessao = models.CharField(max_length=32, blank=True, default='')
+    emitidos_ate = models.DateTimeField(null=True, blank=True)
+    expira_em = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Revogação de token de caixa"
+        verbose_name_plural = "Revogações de tokens de caixa"
+        constraints = [
+            models.UniqueConstraint(fields=['caixa', 'sessao'], name='revogacao_token_caixa_sessao'),
+        ]
+
+    def __str__(self):
+        return f"Caixa {self.caixa_id} - {self.sessao or f'até {self.emitidos_ate}'}"
     
 class Ficha(models.Model):
     numero = models.PositiveSmallIntegerField(unique=True)
@@ -60,6 +99,24 @@ class Ficha(models.Model):
     
     def __str__(self):
         return f"{self.numero} (Saldo ${self.saldo})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saldo_original = instance.__dict__.get('saldo')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        saldo_original = getattr(self, '_saldo_original', None)
+        if saldo_original != self.saldo:
+            publicar_apos_commit(TOPICO_SALDO, dados_saldo(
+                ficha_id=self.pk,
+                numero=self.numero,
+                saldo=self.saldo,
+                saldo_anterior=saldo_original,
+            ))
+            self._saldo_original = self.saldo
     
     def recarga(self, valor):
         valor = Decimal(valor)
@@ -108,6 +165,10 @@ class Produto(models.Model):
     limite_reserva = models.PositiveSmallIntegerField(default=2, help_text="Limite de itens por reserva (padrão: 2)")
     quantidade_reserva_disponivel = models.PositiveSmallIntegerField(default=0, help_text="Quantidade disponível para reserva")
 
+    # Regras de alerta de ruptura (0 desativa)
+    estoque_minimo = models.PositiveSmallIntegerField(default=0, help_text="Alerta quando o estoque chegar a este valor")
+    dias_cobertura_minimo = models.PositiveSmallIntegerField(default=0, help_text="Alerta quando o estoque cobrir menos dias que isto, pelo ritmo recente de vendas")
+
     data_criacao = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -116,6 +177,9 @@ class Produto(models.Model):
     @property
     def total_reservas_antecipadas(self):
         """Retorna total de reservas antecipadas confirmadas ou pendentes"""
+        # Valor já carregado por `com_total_reservas` (listagens)
+        if hasattr(self, 'total_reservas_anotado'):
+            return self.total_reservas_anotado
         return self.reservas.filter(
             status__in=['pendente', 'confirmada']
         ).aggregate(
@@ -125,6 +189,12 @@ class Produto(models.Model):
     def atualizar_estoque(self, novo_estoque):
         self.estoque = novo_estoque
         super().save(update_fields=['estoque'])
+        publicar_apos_commit(TOPICO_ESTOQUE, dados_estoque(
+            produto_id=self.pk,
+            produto=self.nome,
+            caixa_id=self.caixa_id,
+            estoque=novo_estoque,
+        ))
 
 class MovimentacaoEstoque(models.Model):
     TIPO_CHOICES = (
@@ -174,8 +244,9 @@ class MovimentacaoEstoque(models.Model):
                 raise ValidationError("Não é possível ter estoque negativo após a movimentação.")
 
     def save(self, *args, **kwargs):
-        with transaction.atomic():
+        with medir_secao('movimentacao_estoque.save') as secao, transaction.atomic():
             self.produto = Produto.objects.select_for_update().get(pk=self.produto_id)
+            secao.bloqueado()
 
             # Antes de salvar, executa validações
             self.full_clean()
@@ -183,9 +254,10 @@ class MovimentacaoEstoque(models.Model):
             tipo = self.tipo
             quantidade = self.quantidade
             estoque = self.produto.estoque
+            atualizacao = bool(self.pk)
             
             # Se tiver pk (movimentação já existe)
-            if self.pk:
+            if atualizacao:
                 movimentacao = self.__class__.objects.get(pk=self.pk)
                 diferenca = quantidade - movimentacao.quantidade
                 
@@ -203,9 +275,21 @@ class MovimentacaoEstoque(models.Model):
 
             # Salva a movimentação
             super().save(*args, **kwargs)
+
+            # Mantém a cópia desnormalizada da venda em sincronia, incluindo o
+            # valor_total que Venda.save calcula a partir da quantidade
+            if atualizacao:
+                Venda.objects.filter(movimentacao_id=self.pk).update(
+                    caixa_id=self.caixa_id,
+                    quantidade=self.quantidade,
+                    data=self.data,
+                    valor_total=Coalesce(F('valor_unitario'), Value(self.produto.preco)) * self.quantidade,
+                )
             
             # Atualiza o estoque do produto
+            estoque_anterior = self.produto.estoque
             self.produto.atualizar_estoque(estoque)
+            avaliar_alertas_estoque(self.produto, estoque_anterior, estoque)
         
     def delete(self, *args, **kwargs):
         with transaction.atomic():
@@ -226,29 +310,29 @@ class MovimentacaoEstoque(models.Model):
             super().delete(*args, **kwargs)
             
             # Atualiza o estoque do produto
+            estoque_anterior = self.produto.estoque
             self.produto.atualizar_estoque(estoque)
+            avaliar_alertas_estoque(self.produto, estoque_anterior, estoque)
 
 class Venda(models.Model):
     movimentacao = models.OneToOneField(MovimentacaoEstoque, on_delete=models.CASCADE)
     ficha = models.ForeignKey(Ficha, on_delete=models.PROTECT, related_name='compras')
     valor_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
-    
-    @property
-    def caixa(self):
-        return self.movimentacao.caixa
-    
-    @property
-    def produto(self):
-        return self.movimentacao.produto.nome
-    
-    @property
-    def data(self):
-        return self.movimentacao.data
-    
-    @property
-    def quantidade(self):
-        return self.movimentacao.quantidade
+
+    # Cópia dos dados da movimentação para relatórios sem joins
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='vendas', null=True, blank=True, editable=False)
+    caixa = models.ForeignKey(Caixa, on_delete=models.PROTECT, related_name='vendas', null=True, blank=True, editable=False)
+    quantidade = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    data = models.DateTimeField(null=True, blank=True, editable=False)
+    categoria = models.CharField(max_length=20, blank=True, editable=False, help_text="Categoria do produto no momento da venda")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['data']),
+            models.Index(fields=['produto', 'data']),
+            models.Index(fields=['caixa', 'data']),
+        ]
         
     @property
     def preco_total(self):
@@ -259,6 +343,15 @@ class Venda(models.Model):
     def calcular_preco_total(self):
         valor_unitario = self.valor_unitario or self.movimentacao.produto.preco
         return valor_unitario * self.movimentacao.quantidade
+
+    def sincronizar_movimentacao(self):
+        """Copia produto, caixa, quantidade, data e categoria da movimentação"""
+        movimentacao = self.movimentacao
+        self.produto_id = movimentacao.produto_id
+        self.caixa_id = movimentacao.caixa_id
+        self.quantidade = movimentacao.quantidade
+        self.data = movimentacao.data
+        self.categoria = movimentacao.produto.categoria or ''
     
     def __str__(self):
         return f"{self.movimentacao} - Ficha {self.ficha}"
@@ -286,11 +379,13 @@ class Venda(models.Model):
             raise ValidationError("Saldo insuficiente para venda.")
     
     def save(self, *args, **kwargs):
-        with transaction.atomic():
+        with medir_secao('venda.save') as secao, transaction.atomic():
             self.ficha = Ficha.objects.select_for_update().get(pk=self.ficha_id)
+            secao.bloqueado()
             if self.valor_unitario is None:
                 self.valor_unitario = self.movimentacao.produto.preco
             self.valor_total = self.calcular_preco_total()
+            self.sincronizar_movimentacao()
 
             # Antes de salvar, executa validações
             self.full_clean()
@@ -313,8 +408,19 @@ class Venda(models.Model):
             self.ficha.save()
             
             # Salva a movimentação
+            nova = self.pk is None
             super().save(*args, **kwargs)
 
+            if nova:
+                publicar_apos_commit(TOPICO_VENDA, dados_venda(
+                    venda_id=self.pk,
+                    ficha_id=self.ficha_id,
+                    produto_id=self.produto_id,
+                    caixa_id=self.caixa_id,
+                    quantidade=self.quantidade,
+                    valor_total=self.valor_total,
+                ))
+
 
 class QRCodeReserva(models.Model):
     """QR Code para reserva antecipada"""
@@ -323,6 +429,11 @@ class QRCodeReserva(models.Model):
     data_inicio = models.DateTimeField(null=True, blank=True, help_text="Data e hora de início da reserva")
     data_expiracao = models.DateTimeField(null=True, blank=True, help_text="Data e hora de expiração/fim da reserva")
     ativo = models.BooleanField(default=True)
+    tempo_retencao_minutos = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Minutos que uma reserva pendente sem ficha fica retida antes de expirar (vazio: padrão do sistema; 0: não expira)"
+    )
     produtos_disponiveis = models.ManyToManyField(Produto, related_name='qr_codes_reserva', blank=True)
     data_criacao = models.DateTimeField(auto_now_add=True)
     
@@ -370,6 +481,12 @@ class ReservaProduto(models.Model):
             models.Index(fields=['produto', 'status']),
             models.Index(fields=['cpf', 'status']),
             models.Index(fields=['qr_code_reserva', 'status']),
+            # Varredura de reservas pendentes sem ficha expiradas
+            models.Index(
+                fields=['qr_code_reserva', 'data_reserva'],
+                name='reserva_retida_idx',
+                condition=models.Q(status='pendente', ficha__isnull=True),
+            ),
         ]
         # Evitar múltiplas reservas do mesmo CPF para mesmo produto
         constraints = [
@@ -385,6 +502,38 @@ class ReservaProduto(models.Model):
             return f"Reserva {self.id} - Ficha {self.ficha.numero} - {self.produto.nome}"
         return f"Reserva {self.id} - {self.nome_completo} ({self.cpf}) - {self.produto.nome}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._status_original = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        status_original = getattr(self, '_status_original', None)
+        if status_original != self.status:
+            publicar_apos_commit(TOPICO_RESERVA, dados_reserva(
+                reserva_id=self.pk,
+                produto_id=self.produto_id,
+                ficha_id=self.ficha_id,
+                qr_code_reserva_id=self.qr_code_reserva_id,
+                quantidade=self.quantidade,
+                status=self.status,
+                status_anterior=status_original,
+            ))
+            self._status_original = self.status
+
+
+def com_total_reservas(queryset):
+    """Anota o `total_reservas_antecipadas` dos produtos na própria consulta."""
+    reservas = ReservaProduto.objects.filter(
+        produto=OuterRef('pk'),
+        status__in=['pendente', 'confirmada']
+    ).order_by().values('produto').annotate(total=Sum('quantidade')).values('total')
+    return queryset.annotate(
+        total_reservas_anotado=Coalesce(Subquery(reservas, output_field=IntegerField()), 0)
+    )
+
 
 class Recarga(models.Model):
     """Modelo para registrar histórico de recargas de fichas"""
@@ -0,0 +1,217 @@
+"""Publicação estática da disponibilidade dos QR codes de reserva.
+
+Com `RESERVAS_PUBLICAS_ESTATICAS` ligado, o JSON de
+`reservas-publicas/<qr_code>/produtos/` de cada QR code ativo e dentro do
+período é gravado em `RESERVAS_PUBLICAS_ESTATICAS_DIR/<codigo>.json`, para o
+servidor web entregar direto (ex.: mapeamento de arquivos estáticos em
+`RESERVAS_PUBLICAS_ESTATICAS_URL`). O endpoint ao vivo continua existindo e a
+criação de reservas segue pelo Django.
+
+Os arquivos são regravados pela thread do publicador quando o broker de
+eventos publica mudanças de reserva ou estoque e quando um QR code ou produto
+é alterado (com um pequeno atraso para agrupar rajadas) e, em qualquer caso, a
+cada `RESERVAS_PUBLICAS_ESTATICAS_INTERVALO_SEGUNDOS`. As requisições só
+acordam a thread; nenhuma delas regrava arquivos. Uma trava entre processos
+garante um único publicador por máquina, mesmo com vários workers. Arquivos de QR codes que
+deixaram de estar disponíveis são removidos (o servidor web responde 404 e o
+frontend pode recorrer ao endpoint ao vivo); só são removidos arquivos
+listados no manifesto (`MANIFESTO`) que o próprio publicador mantém no
+diretório, nunca outros arquivos que estejam lá.
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from projetoIntegrador1.agendamento import obter_trava_processo
+
+from .disponibilidade import erro_periodo_qr, produtos_publicos_data, reservas_ativas_queryset
+from .eventos import TOPICO_ESTOQUE, TOPICO_RESERVA, get_broker
+from .models import Produto, QRCodeReserva
+
+logger = logging.getLogger(__name__)
+
+TOPICOS_PUBLICACAO = {TOPICO_RESERVA, TOPICO_ESTOQUE}
+# Segundos aguardados após um evento para agrupar mudanças seguidas
+ATRASO_AGRUPAMENTO = 1
+# Trava entre processos: um único publicador por máquina
+TRAVA_PUBLICADOR = 'reservas-publicas-publicador'
+
+# Códigos que podem virar nome de arquivo sem escapar
+_CODIGO_ARQUIVO = re.compile(r'^[\w-][\w.-]*$')
+# Lista dos arquivos gravados pelo publicador (o único que ele pode apagar)
+MANIFESTO = '.publicados'
+
+
+def _caminho(codigo):
+    return os.path.join(settings.RESERVAS_PUBLICAS_ESTATICAS_DIR, f'{codigo}.json')
+
+
+def _caminho_manifesto():
+    return os.path.join(settings.RESERVAS_PUBLICAS_ESTATICAS_DIR, MANIFESTO)
+
+
+def _ler_manifesto():
+    try:
+        with open(_caminho_manifesto(), encoding='utf-8') as arquivo:
+            return set(arquivo.read().split())
+    except FileNotFoundError:
+        return set()
+
+
+def _gravar_se_mudou(caminho, conteudo):
+    """Grava de forma atômica; não toca no arquivo se o conteúdo não mudou."""
+    try:
+        with open(caminho, 'rb') as arquivo:
+            if arquivo.read() == conteudo:
+                return False
+    except FileNotFoundError:
+        pass
+
+    diretorio = os.path.dirname(caminho)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(conteudo)
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    return True
+
+
+def publicar_qr_codes():
+    """Regrava os JSON de todos os QR codes disponíveis. Retorna quantos mudaram."""
+    agora = timezone.now()
+    os.makedirs(settings.RESERVAS_PUBLICAS_ESTATICAS_DIR, exist_ok=True)
+
+    qr_codes = [
+        qr for qr in QRCodeReserva.objects.filter(ativo=True).prefetch_related('produtos_disponiveis')
+        if _CODIGO_ARQUIVO.match(qr.codigo) and not erro_periodo_qr(qr, agora)
+    ]
+    produtos_por_qr = {
+        qr.pk: [produto for produto in qr.produtos_disponiveis.all() if produto.disponivel_reserva]
+        for qr in qr_codes
+    }
+    # Um único agregado de reservas para todos os produtos publicados
+    reservas_por_produto = {
+        item['produto_id']: item['total'] or 0
+        for item in reservas_ativas_queryset(
+            {produto.id for produtos in produtos_por_qr.values() for produto in produtos}
+        )
+    }
+
+    alterados = 0
+    publicados = set()
+    for qr in qr_codes:
+        produtos = sorted(produtos_por_qr[qr.pk], key=lambda produto: produto.pk)
+        conteudo = json.dumps(
+            produtos_publicos_data(qr, produtos, reservas_por_produto),
+            cls=JSONEncoder,
+            ensure_ascii=False,
+        ).encode()
+        alterados += _gravar_se_mudou(_caminho(qr.codigo), conteudo)
+        publicados.add(f'{qr.codigo}.json')
+
+    # Só apaga o que foi gravado por publicações anteriores
+    for nome in _ler_manifesto() - publicados:
+        if not _CODIGO_ARQUIVO.match(nome):
+            continue
+        try:
+            os.unlink(os.path.join(settings.RESERVAS_PUBLICAS_ESTATICAS_DIR, nome))
+        except FileNotFoundError:
+            continue
+        alterados += 1
+    _gravar_se_mudou(_caminho_manifesto(), ''.join(f'{nome}\n' for nome in sorted(publicados)).encode())
+    return alterados
+
+
+# Avisa o publicador de que há mudanças a publicar
+_alteracao = threading.Event()
+
+
+def _acompanhar_broker():
+    """Repassa ao publicador os eventos de reserva e estoque do broker."""
+    broker = get_broker()
+    ultimo_id = broker.ultimo_id
+    while True:
+        eventos = broker.aguardar(ultimo_id, TOPICOS_PUBLICACAO, timeout=60)
+        if eventos:
+            ultimo_id = eventos[-1].id
+            _alteracao.set()
+
+
+def executar_publicador(intervalo=None):
+    """Mantém os arquivos em dia para sempre (thread do agendador ou comando --loop)."""
+    if intervalo is None:
+        intervalo = settings.RESERVAS_PUBLICAS_ESTATICAS_INTERVALO_SEGUNDOS
+    threading.Thread(
+        target=_acompanhar_broker, name='reservas-publicas-eventos', daemon=True
+    ).start()
+    proxima = 0
+    while True:
+        espera = proxima - time.monotonic()
+        if espera > 0 and _alteracao.wait(espera):
+            time.sleep(ATRASO_AGRUPAMENTO)
+        _alteracao.clear()
+
+        try:
+            publicar_qr_codes()
+        except Exception:
+            logger.exception("Falha ao publicar a disponibilidade dos QR codes")
+        finally:
+            close_old_connections()
+        proxima = time.monotonic() + intervalo
+
+
+def _sinalizar_apos_commit(sender, update_fields=None, **kwargs):
+    """Alterações de QR codes e produtos não passam pelo broker: acorda o publicador."""
+    # Mudanças de estoque já chegam pelo broker (tópico estoque)
+    if sender is Produto and update_fields is not None and set(update_fields) == {'estoque'}:
+        return
+    transaction.on_commit(_alteracao.set)
+
+
+def conectar_sinais():
+    uid = 'movimentacao.publicacao'
+    post_save.connect(_sinalizar_apos_commit, sender=QRCodeReserva, dispatch_uid=f'{uid}.qr.save')
+    post_delete.connect(_sinalizar_apos_commit, sender=QRCodeReserva, dispatch_uid=f'{uid}.qr.delete')
+    m2m_changed.connect(
+        _sinalizar_apos_commit,
+        sender=QRCodeReserva.produtos_disponiveis.through,
+        dispatch_uid=f'{uid}.qr.produtos',
+    )
+    post_save.connect(_sinalizar_apos_commit, sender=Produto, dispatch_uid=f'{uid}.produto.save')
+
+
+_publicador = None
+_publicador_lock = threading.Lock()
+
+
+def iniciar_publicador():
+    """Inicia a thread que mantém os arquivos publicados.
+
+    Só um processo da máquina publica: os demais workers não obtêm a trava e
+    não iniciam nada (assim como quando o comando `--loop` já está rodando).
+    """
+    global _publicador
+    with _publicador_lock:
+        if _publicador is None:
+            if not obter_trava_processo(TRAVA_PUBLICADOR):
+                logger.info("Publicador de reservas públicas já roda em outro processo")
+                return None
+            _publicador = threading.Thread(
+                target=executar_publicador, name='reservas-publicas-estaticas', daemon=True
+            )
+            _publicador.start()
+    return _publicador
@@ -0,0 +1,110 @@
+"""Resolução dos QR codes de reserva usados pelas views públicas.
+
+Os dados do QR code e o conjunto de ids dos produtos liberados nele ficam num
+cache em memória do processo por `QR_CODES_CACHE_SEGUNDOS`. O cache guarda
+no máximo `QR_CODES_CACHE_MAXIMO` códigos (os usados há mais tempo saem
+primeiro) e não guarda códigos inexistentes, para que códigos aleatórios não
+o façam crescer. Ele é limpo quando um `QRCodeReserva` é salvo ou excluído e
+quando seus `produtos_disponiveis` mudam; outros processos enxergam a mudança
+quando a entrada expira.
+
+`disponivel_reserva` e as quantidades continuam sendo lidos do `Produto` a
+cada requisição.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .models import QRCodeReserva
+
+QRCodeResolvido = namedtuple(
+    'QRCodeResolvido',
+    ['id', 'codigo', 'descricao', 'data_inicio', 'data_expiracao', 'produtos_ids'],
+)
+
+_AUSENTE = object()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _do_cache(codigo):
+    with _cache_lock:
+        entrada = _cache.get(codigo)
+        if entrada is None or entrada[0] < time.monotonic():
+            return _AUSENTE
+        _cache.move_to_end(codigo)
+    return entrada[1]
+
+
+def _guardar(codigo, qr):
+    agora = time.monotonic()
+    with _cache_lock:
+        for chave in [chave for chave, (expira, _) in _cache.items() if expira < agora]:
+            del _cache[chave]
+        _cache[codigo] = (agora + settings.QR_CODES_CACHE_SEGUNDOS, qr)
+        _cache.move_to_end(codigo)
+        while len(_cache) > settings.QR_CODES_CACHE_MAXIMO:
+            _cache.popitem(last=False)
+
+
+def _carregar(codigo):
+    qr = (
+        QRCodeReserva.objects.filter(codigo=codigo, ativo=True)
+        .values('id', 'codigo', 'descricao', 'data_inicio', 'data_expiracao')
+        .first()
+    )
+    if qr is None:
+        return None
+    qr = QRCodeResolvido(
+        produtos_ids=frozenset(
+            QRCodeReserva.produtos_disponiveis.through.objects.filter(
+                qrcodereserva_id=qr['id']
+            ).values_list('produto_id', flat=True)
+        ),
+        **qr,
+    )
+    _guardar(codigo, qr)
+    return qr
+
+
+def resolver_qr_code(codigo):
+    """`QRCodeResolvido` do QR code ativo com esse código, ou None."""
+    qr = _do_cache(codigo)
+    if qr is _AUSENTE:
+        qr = _carregar(codigo)
+    return qr
+
+
+async def aresolver_qr_code(codigo):
+    """Versão assíncrona de `resolver_qr_code`; só vai ao banco se não houver cache."""
+    qr = _do_cache(codigo)
+    if qr is _AUSENTE:
+        qr = await sync_to_async(_carregar)(codigo)
+    return qr
+
+
+def limpar_cache_qr_codes(**kwargs):
+    with _cache_lock:
+        _cache.clear()
+
+
+def _invalidar(**kwargs):
+    # Limpa já e de novo após o commit, para não guardar dados lidos antes dele
+    limpar_cache_qr_codes()
+    transaction.on_commit(limpar_cache_qr_codes)
+
+
+def conectar_sinais():
+    uid = 'movimentacao.qrcodes'
+    post_save.connect(_invalidar, sender=QRCodeReserva, dispatch_uid=f'{uid}.save')
+    post_delete.connect(_invalidar, sender=QRCodeReserva, dispatch_uid=f'{uid}.delete')
+    m2m_changed.connect(
+        _invalidar,
+        sender=QRCodeReserva.produtos_disponiveis.through,
+        dispatch_uid=f'{uid}.produtos',
+    )
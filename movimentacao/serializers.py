@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.db import transaction
 from .models import Caixa, Ficha, Produto, MovimentacaoEstoque, Venda, ReservaProduto, QRCodeReserva, Recarga
@@ -48,6 +50,51 @@ class FichaSerializer(serializers.ModelSerializer):
 
 class RecargaFichaSerializer(serializers.Serializer):
     valor = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+class RecargaLoteItemSerializer(serializers.Serializer):
+    ficha_id = serializers.IntegerField(required=False)
+    numero = serializers.IntegerField(required=False)
+    valor = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+    def validate(self, data):
+        if ('ficha_id' in data) == ('numero' in data):
+            raise serializers.ValidationError('Informe ficha_id ou numero.')
+        return data
+
+class RecargaLoteSerializer(serializers.Serializer):
+    """Recarga em lote: lista de `itens` ou um `valor` para o intervalo `inicio`-`fim`"""
+    itens = RecargaLoteItemSerializer(many=True, required=False)
+    inicio = serializers.IntegerField(required=False, min_value=1)
+    fim = serializers.IntegerField(required=False, min_value=1)
+    valor = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False)
+    caixa_id = serializers.PrimaryKeyRelatedField(queryset=Caixa.objects.all(), source='caixa')
+    produto_id = serializers.PrimaryKeyRelatedField(
+        queryset=Produto.objects.all(),
+        source='produto',
+        required=False,
+        allow_null=True
+    )
+    observacoes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, data):
+        if data.get('itens'):
+            if len(data['itens']) > self.context.get('limite', len(data['itens'])):
+                raise serializers.ValidationError({'itens': 'Fichas demais para um único lote.'})
+            return data
+        if not all(campo in data for campo in ('inicio', 'fim', 'valor')):
+            raise serializers.ValidationError('Informe itens, ou inicio, fim e valor.')
+        if data['fim'] < data['inicio']:
+            raise serializers.ValidationError({'fim': 'fim deve ser maior ou igual a inicio.'})
+        if data['fim'] - data['inicio'] + 1 > self.context.get('limite', data['fim']):
+            raise serializers.ValidationError('Fichas demais para um único lote.')
+        return data
+
+class EmissaoFichasLoteSerializer(serializers.Serializer):
+    """Saldo inicial e caixa da emissão em lote; o intervalo é lido por `_intervalo_fichas`"""
+    saldo = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0.00'), required=False, default=Decimal('0.00')
+    )
+    caixa_id = serializers.PrimaryKeyRelatedField(queryset=Caixa.objects.all(), source='caixa')
  
 class ProdutoSerializer(serializers.ModelSerializer):
     estoque = serializers.IntegerField(required=False)
@@ -122,7 +169,19 @@ class VendaSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Venda
-        fields = '__all__'
+        # As colunas desnormalizadas (produto, caixa, categoria) ficam fora da API
+        fields = [
+            'id',
+            'movimentacao',
+            'preco_total',
+            'produto_nome',
+            'caixa_nome',
+            'quantidade',
+            'data',
+            'valor_unitario',
+            'valor_total',
+            'ficha',
+        ]
     
     def create(self, validated_data):
         with transaction.atomic():
@@ -1,11 +1,77 @@
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
 from decimal import Decimal
+from unittest import mock, skipUnless
 
+from asgiref.sync import async_to_sync, iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.hashers import check_password
 from django.core.exceptions import ValidationError
-from django.test import TestCase, override_settings
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.timezone import timedelta
+
+from projetoIntegrador1 import agendamento
+from projetoIntegrador1.consultas_repetidas import (
+    ConsultasRepetidas,
+    ConsultasRepetidasMiddleware,
+    ExecutorTestes,
+    sem_consultas_repetidas,
+)
+from projetoIntegrador1.metricas import MetricasMiddleware, gerar_texto
+from projetoIntegrador1.perfilamento import PerfilamentoMiddleware
+from projetoIntegrador1.roteamento import (
+    ALIAS_RELATORIOS,
+    RoteadorRelatorios,
+    _usar_alias,
+    banco_principal,
+    banco_relatorios,
+)
+from projetoIntegrador1.sqlite.base import DatabaseWrapper as SqliteDatabaseWrapper
 
-from .models import Caixa, Ficha, MovimentacaoEstoque, Produto, QRCodeReserva, Venda
+from .alertas import TOPICO_ALERTA_ESTOQUE
+from .autenticacao import gerar_token_caixa, ler_token_caixa
+from .eventos import BrokerBase, BrokerLocal, get_broker
+from .expiracao import cancelar_reservas_expiradas
+from .publicacao import (
+    _alteracao as _alteracao_publicacao,
+    TRAVA_PUBLICADOR,
+    conectar_sinais as conectar_sinais_publicacao,
+    iniciar_publicador,
+    publicar_qr_codes,
+)
+from .qrcodes import limpar_cache_qr_codes, resolver_qr_code
+from .models import (
+    Caixa,
+    Ficha,
+    MovimentacaoEstoque,
+    Produto,
+    QRCodeReserva,
+    Recarga,
+    ReservaProduto,
+    RevogacaoTokenCaixa,
+    Venda,
+)
 from .serializers import VendaSerializer
+from .urls import router
+from .views_eventos import stream_eventos
+from .views_reserva import reserva_publica_produtos_async, reservas_por_cpf_async
+
+
+def autenticar_caixa(client, caixa):
+    """Envia o token do caixa em todas as requisições do client."""
+    token, _ = gerar_token_caixa(caixa)
+    client.defaults["HTTP_AUTHORIZATION"] = f"Caixa {token}"
 
 
 class TestEstoquePersistence(TestCase):
@@ -120,6 +186,42 @@ class TestEstoquePersistence(TestCase):
 
         self.assertEqual(venda.preco_total, Decimal("10.00"))
 
+    def test_sale_stores_movement_snapshot_for_reports(self):
+        MovimentacaoEstoque.objects.create(
+            caixa=self.caixa,
+            produto=self.produto,
+            quantidade=5,
+            tipo="E",
+        )
+        ficha = Ficha.objects.create(numero=3, saldo=Decimal("50.00"))
+        movimentacao = MovimentacaoEstoque.objects.create(
+            caixa=self.caixa,
+            produto=self.produto,
+            quantidade=2,
+            tipo="S",
+        )
+        venda = Venda.objects.create(movimentacao=movimentacao, ficha=ficha)
+
+        venda.refresh_from_db()
+        self.assertEqual(venda.produto_id, self.produto.id)
+        self.assertEqual(venda.caixa_id, self.caixa.id)
+        self.assertEqual(venda.quantidade, 2)
+        self.assertEqual(venda.data, movimentacao.data)
+        self.assertEqual(venda.categoria, self.produto.categoria)
+
+        movimentacao.quantidade = 3
+        movimentacao.save()
+        venda.refresh_from_db()
+        self.assertEqual(venda.quantidade, 3)
+        self.assertEqual(venda.valor_total, venda.valor_unitario * 3)
+        self.assertEqual(venda.data, movimentacao.data)
+
+        dados = VendaSerializer(venda).data
+        self.assertNotIn("produto", dados)
+        self.assertNotIn("caixa", dados)
+        self.assertNotIn("categoria", dados)
+        self.assertEqual(dados["quantidade"], 3)
+
 
 class TestFichaPersistence(TestCase):
     def test_recarga_action_uses_validated_decimal_value(self):
@@ -145,6 +247,344 @@ class TestFichaPersistence(TestCase):
         self.assertEqual(ficha.recargas.count(), 1)
 
 
+class TestEmissaoFichasLote(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+
+    def test_bulk_issue_creates_range_with_initial_balance(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(
+                "/movimentacao/fichas/emitir-lote/",
+                data={"inicio": 1000, "fim": 1999, "saldo": "10.00", "caixa_id": self.caixa.id},
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 201)
+        # Inserções em lotes (limitados pelo banco), e não uma consulta por ficha
+        self.assertLessEqual(len(consultas), 20)
+        data = response.json()
+        self.assertEqual(data["quantidade"], 1000)
+        self.assertEqual(data["valor_total"], 10000.0)
+        self.assertEqual(Ficha.objects.filter(numero__range=(1000, 1999), saldo=Decimal("10.00")).count(), 1000)
+        self.assertEqual(Recarga.objects.filter(caixa=self.caixa).count(), 1000)
+
+        response = self.client.get(data["folha_impressao"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(response.content.startswith(b"%PDF"))
+
+    def test_bulk_issue_continues_numbering_and_rejects_overlap(self):
+        Ficha.objects.create(numero=5)
+
+        response = self.client.post(
+            "/movimentacao/fichas/emitir-lote/",
+            data={"quantidade": 3, "caixa_id": self.caixa.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()["inicio"], response.json()["fim"]), (6, 8))
+        self.assertEqual(Recarga.objects.count(), 0)
+
+        response = self.client.post(
+            "/movimentacao/fichas/emitir-lote/",
+            data={"inicio": 1, "fim": 10, "caixa_id": self.caixa.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["numeros_existentes"], [5, 6, 7, 8])
+        self.assertEqual(Ficha.objects.count(), 4)
+
+    def test_bulk_issue_validates_range(self):
+        response = self.client.post(
+            "/movimentacao/fichas/emitir-lote/",
+            data={"inicio": 1, "fim": 6000, "caixa_id": self.caixa.id},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_issue_rejects_invalid_balance_and_cashier(self):
+        invalidos = [
+            {"saldo": "NaN", "caixa_id": self.caixa.id},
+            {"saldo": "Infinity", "caixa_id": self.caixa.id},
+            {"saldo": "1e30", "caixa_id": self.caixa.id},
+            {"saldo": "-1.00", "caixa_id": self.caixa.id},
+            {"saldo": "10.00", "caixa_id": "abc"},
+            {"saldo": "10.00", "caixa_id": 999},
+            {"saldo": "10.00"},
+        ]
+        for dados in invalidos:
+            with self.subTest(dados=dados):
+                response = self.client.post(
+                    "/movimentacao/fichas/emitir-lote/",
+                    data={"inicio": 1, "fim": 3, **dados},
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Ficha.objects.count(), 0)
+
+
+class TestRecargaLote(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        self.fichas = [
+            Ficha.objects.create(numero=numero, saldo=Decimal("1.00"))
+            for numero in range(100, 105)
+        ]
+
+    def test_range_recharge_updates_balances_set_based(self):
+        Ficha.objects.filter(numero=104).update(is_active=False)
+
+        with CaptureQueriesContext(connection) as consultas:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    "/movimentacao/fichas/recarga-lote/",
+                    data={"inicio": 100, "fim": 104, "valor": "20.00", "caixa_id": self.caixa.id},
+                    content_type="application/json",
+                )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["quantidade"], 4)
+        self.assertEqual(response.json()["valor_total"], 80.0)
+        saldos = dict(Ficha.objects.values_list("numero", "saldo"))
+        self.assertEqual(saldos[100], Decimal("21.00"))
+        self.assertEqual(saldos[104], Decimal("1.00"))
+        self.assertEqual(Recarga.objects.filter(caixa=self.caixa, valor=Decimal("20.00")).count(), 4)
+        updates = [c["sql"] for c in consultas.captured_queries if c["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+
+    def test_item_recharge_accepts_ids_and_numbers_and_reports_missing(self):
+        response = self.client.post(
+            "/movimentacao/fichas/recarga-lote/",
+            data={
+                "caixa_id": self.caixa.id,
+                "itens": [
+                    {"ficha_id": self.fichas[0].id, "valor": "5.00"},
+                    {"numero": 101, "valor": "2.50"},
+                    {"numero": 100, "valor": "1.00"},
+                ],
+            },
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        saldos = dict(Ficha.objects.values_list("numero", "saldo"))
+        self.assertEqual(saldos[100], Decimal("7.00"))
+        self.assertEqual(saldos[101], Decimal("3.50"))
+
+        response = self.client.post(
+            "/movimentacao/fichas/recarga-lote/",
+            data={"caixa_id": self.caixa.id, "itens": [{"numero": 999, "valor": "5.00"}]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["faltando"]["numero"], [999])
+        self.assertEqual(Recarga.objects.count(), 2)
+
+
+class TestConversaoReservas(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        self.produtos = []
+        for nome, preco in (("Bolo", "6.00"), ("Pamonha", "7.50")):
+            produto = Produto.objects.create(
+                caixa=self.caixa,
+                nome=nome,
+                medida="UN",
+                preco=Decimal(preco),
+                disponivel_reserva=True,
+            )
+            MovimentacaoEstoque.objects.create(caixa=self.caixa, produto=produto, quantidade=5, tipo="E")
+            ReservaProduto.objects.create(
+                nome_completo="Maria Silva",
+                cpf="12345678901",
+                produto=produto,
+                quantidade=2,
+            )
+            self.produtos.append(produto)
+
+    def criar_ficha(self, saldo):
+        return self.client.post(
+            "/movimentacao/fichas/",
+            data={"numero": 42, "saldo": saldo, "cpf_reserva": "12345678901", "caixa_id": self.caixa.id},
+            content_type="application/json",
+        )
+
+    def test_ficha_by_cpf_converts_all_reservations_in_one_batch(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.criar_ficha("40.00")
+
+        self.assertEqual(response.status_code, 201)
+        resumo = response.json()["reservas_convertidas"]
+        self.assertEqual(resumo["reservas"], 2)
+        self.assertEqual(resumo["itens"], 4)
+        self.assertEqual(resumo["valor_total"], 27.0)
+        self.assertEqual(len(resumo["vendas"]), 2)
+
+        ficha = Ficha.objects.get(numero=42)
+        self.assertEqual(ficha.saldo, Decimal("13.00"))
+        self.assertEqual(ficha.recargas.get().valor, Decimal("40.00"))
+        self.assertEqual(
+            list(Produto.objects.order_by("nome").values_list("estoque", flat=True)),
+            [3, 3],
+        )
+        venda = Venda.objects.get(produto=self.produtos[1])
+        self.assertEqual(venda.valor_total, Decimal("15.00"))
+        self.assertEqual(venda.caixa, self.caixa)
+        self.assertEqual(venda.movimentacao.tipo, "S")
+        self.assertEqual(
+            set(ReservaProduto.objects.values_list("status", "ficha_id")),
+            {("finalizada", ficha.id)},
+        )
+        # estoque x2, venda x2, saldo (criação e conversão) e reserva x2
+        self.assertGreaterEqual(len(callbacks), 7)
+
+    def test_insufficient_stock_rolls_back_ficha_creation(self):
+        MovimentacaoEstoque.objects.create(caixa=self.caixa, produto=self.produtos[1], quantidade=4, tipo="S")
+
+        response = self.criar_ficha("40.00")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Estoque insuficiente para Pamonha", response.json()["detail"])
+        self.assertFalse(Ficha.objects.filter(numero=42).exists())
+        self.assertEqual(Venda.objects.count(), 0)
+        self.assertEqual(ReservaProduto.objects.filter(status="pendente").count(), 2)
+
+
+class TestConfirmacaoReservasLote(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        self.qr_code = QRCodeReserva.objects.create(codigo="ONDA-1", ativo=True)
+        self.produto = Produto.objects.create(caixa=self.caixa, nome="Bolo", medida="UN", preco=Decimal("5.00"))
+        MovimentacaoEstoque.objects.create(caixa=self.caixa, produto=self.produto, quantidade=3, tipo="E")
+        self.rica = Ficha.objects.create(numero=1, saldo=Decimal("50.00"))
+        self.pobre = Ficha.objects.create(numero=2, saldo=Decimal("1.00"))
+
+    def reservar(self, cpf, ficha, quantidade=1):
+        return ReservaProduto.objects.create(
+            nome_completo="Cliente",
+            cpf=cpf,
+            produto=self.produto,
+            quantidade=quantidade,
+            ficha=ficha,
+            qr_code_reserva=self.qr_code,
+        )
+
+    def test_bulk_confirm_by_qr_code_reports_each_item(self):
+        ok = self.reservar("11111111111", self.rica, quantidade=2)
+        sem_saldo = self.reservar("22222222222", self.pobre)
+        sem_ficha = self.reservar("33333333333", None)
+        sem_estoque = self.reservar("44444444444", self.rica, quantidade=2)
+
+        response = self.client.post(
+            "/movimentacao/reservas/confirmar-lote/",
+            data={"qr_code": "ONDA-1", "status": "finalizada"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["processadas"], data["rejeitadas"]), (1, 3))
+        self.assertEqual(data["valor_total"], 10.0)
+        itens = {item["reserva_id"]: item for item in data["itens"]}
+        self.assertEqual(itens[ok.id]["status"], "finalizada")
+        self.assertTrue(Venda.objects.filter(id=itens[ok.id]["venda_id"], ficha=self.rica).exists())
+        self.assertIn("Saldo insuficiente", itens[sem_saldo.id]["motivo"])
+        self.assertEqual(itens[sem_ficha.id]["motivo"], "Reserva sem ficha vinculada.")
+        self.assertIn("Estoque insuficiente", itens[sem_estoque.id]["motivo"])
+
+        self.produto.refresh_from_db()
+        self.rica.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 1)
+        self.assertEqual(self.rica.saldo, Decimal("40.00"))
+        self.assertEqual(ReservaProduto.objects.filter(status="pendente").count(), 3)
+
+    def test_bulk_confirm_by_ids_reports_processed_and_unknown(self):
+        reserva = self.reservar("11111111111", self.rica)
+        reserva.status = "cancelada"
+        reserva.save()
+
+        response = self.client.post(
+            "/movimentacao/reservas/confirmar-lote/",
+            data={"ids": [reserva.id, 9999]},
+            content_type="application/json",
+        )
+
+        motivos = [item["motivo"] for item in response.json()["itens"]]
+        self.assertEqual(motivos, ["Reserva já processada", "Reserva não encontrada"])
+
+        response = self.client.post(
+            "/movimentacao/reservas/confirmar-lote/",
+            data={"ids": [reserva.id], "cpf": "11111111111"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TestExpiracaoReservas(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        self.produto = Produto.objects.create(
+            caixa=self.caixa,
+            nome="Bolo",
+            medida="UN",
+            preco=Decimal("5.00"),
+            disponivel_reserva=True,
+            limite_reserva=2,
+            quantidade_reserva_disponivel=5,
+        )
+        self.qr_curto = QRCodeReserva.objects.create(codigo="CURTO", ativo=True, tempo_retencao_minutos=10)
+        self.qr_padrao = QRCodeReserva.objects.create(codigo="PADRAO", ativo=True)
+        self.qr_sem_expiracao = QRCodeReserva.objects.create(codigo="SEMPRE", ativo=True, tempo_retencao_minutos=0)
+
+    def reservar(self, cpf, qr_code, minutos_atras, ficha=None):
+        reserva = ReservaProduto.objects.create(
+            nome_completo="Cliente",
+            cpf=cpf,
+            produto=self.produto,
+            quantidade=1,
+            ficha=ficha,
+            qr_code_reserva=qr_code,
+        )
+        ReservaProduto.objects.filter(pk=reserva.pk).update(
+            data_reserva=timezone.now() - timedelta(minutes=minutos_atras)
+        )
+        return reserva
+
+    @override_settings(RESERVAS_RETENCAO_MINUTOS=60)
+    def test_cancels_only_expired_holds_without_ficha(self):
+        expirada = self.reservar("11111111111", self.qr_curto, 15)
+        recente = self.reservar("22222222222", self.qr_curto, 5)
+        com_ficha = self.reservar("33333333333", self.qr_curto, 15, Ficha.objects.create(numero=1))
+        padrao_recente = self.reservar("44444444444", self.qr_padrao, 30)
+        padrao_expirada = self.reservar("55555555555", self.qr_padrao, 90)
+        sem_expiracao = self.reservar("66666666666", self.qr_sem_expiracao, 600)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            canceladas = cancelar_reservas_expiradas(tamanho_lote=1)
+
+        self.assertEqual(canceladas, 2)
+        status = dict(ReservaProduto.objects.values_list("id", "status"))
+        self.assertEqual(status[expirada.id], "cancelada")
+        self.assertEqual(status[padrao_expirada.id], "cancelada")
+        for reserva in (recente, com_ficha, padrao_recente, sem_expiracao):
+            self.assertEqual(status[reserva.id], "pendente")
+
+    def test_default_zero_keeps_holds_and_publishes_cancellations(self):
+        self.reservar("11111111111", self.qr_padrao, 10_000)
+        expirada = self.reservar("22222222222", self.qr_curto, 15)
+        broker = get_broker()
+        inicio = broker.ultimo_id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(cancelar_reservas_expiradas(), 1)
+
+        eventos = [evento.dados for evento in broker.eventos_desde(inicio, {"reserva"})]
+        self.assertEqual(len(eventos), 1)
+        self.assertEqual(eventos[0]["reserva_id"], expirada.id)
+        self.assertEqual((eventos[0]["status_anterior"], eventos[0]["status"]), ("pendente", "cancelada"))
+
+
 class TestAuthenticationPersistence(TestCase):
     def test_caixa_password_is_hashed_and_login_still_works(self):
         caixa = Caixa.objects.create(
@@ -166,6 +606,97 @@ class TestAuthenticationPersistence(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertNotIn("senha", response.json())
 
+    def test_caixa_login_issues_token_that_can_be_renewed_and_revoked(self):
+        caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+
+        response = self.client.post(
+            "/movimentacao/caixas/login/",
+            data={"usuario": "caixa", "senha": "123"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        token = response.json()["token"]
+        self.assertEqual(response.json()["id"], caixa.id)
+        self.assertIn("token_expira_em", response.json())
+
+        # Com o estado de revogação em cache, a verificação não vai ao banco
+        ler_token_caixa(token)
+        with self.assertNumQueries(0):
+            ler_token_caixa(token)
+
+        # Caixa, limpeza das revogações vencidas e revogação do token antigo
+        with self.assertNumQueries(3):
+            response = self.client.post(
+                "/movimentacao/caixas/renovar/",
+                HTTP_AUTHORIZATION=f"Caixa {token}",
+            )
+        self.assertEqual(response.status_code, 200)
+        novo_token = response.json()["token"]
+
+        # O token renovado substitui o anterior
+        response = self.client.post(
+            "/movimentacao/caixas/renovar/",
+            HTTP_AUTHORIZATION=f"Caixa {token}",
+        )
+        self.assertEqual(response.status_code, 401)
+
+        response = self.client.post(
+            "/movimentacao/caixas/logout/",
+            HTTP_AUTHORIZATION=f"Caixa {novo_token}",
+        )
+        self.assertEqual(response.status_code, 204)
+        response = self.client.post(
+            "/movimentacao/caixas/renovar/",
+            HTTP_AUTHORIZATION=f"Caixa {novo_token}",
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_caixa_token_rejects_tampering_expiry_and_password_change(self):
+        caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        token, _ = gerar_token_caixa(caixa)
+
+        response = self.client.post(
+            "/movimentacao/caixas/renovar/",
+            HTTP_AUTHORIZATION=f"Caixa {token[:-2]}xx",
+        )
+        self.assertEqual(response.status_code, 401)
+
+        with override_settings(CAIXA_TOKEN_VALIDADE_SEGUNDOS=-1):
+            response = self.client.post(
+                "/movimentacao/caixas/renovar/",
+                HTTP_AUTHORIZATION=f"Caixa {token}",
+            )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["detail"], "Sessão do caixa expirada.")
+
+        self.client.patch(
+            f"/movimentacao/caixas/{caixa.id}/",
+            data={"senha": "456"},
+            content_type="application/json",
+        )
+        response = self.client.post(
+            "/movimentacao/caixas/renovar/",
+            HTTP_AUTHORIZATION=f"Caixa {token}",
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_caixa_token_revocation_is_shared_through_database(self):
+        caixa = Caixa.objects.create(nome="Caixa Principal", usuario="caixa", senha="123")
+        outro = Caixa.objects.create(nome="Caixa 2", usuario="caixa2", senha="123")
+        token, _ = gerar_token_caixa(caixa)
+        token_outro, _ = gerar_token_caixa(outro)
+
+        self.client.post("/movimentacao/caixas/logout/", HTTP_AUTHORIZATION=f"Caixa {token}")
+        cache.clear()
+        response = self.client.post("/movimentacao/caixas/renovar/", HTTP_AUTHORIZATION=f"Caixa {token}")
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(RevogacaoTokenCaixa.objects.filter(caixa=caixa).exists())
+
+        # Tokens de um caixa excluído deixam de valer
+        outro.delete()
+        response = self.client.get("/movimentacao/vendas/", HTTP_AUTHORIZATION=f"Caixa {token_outro}")
+        self.assertEqual(response.status_code, 401)
+
     @override_settings(ADMIN_USERNAME="admin", ADMIN_PASSWORD="secret")
     def test_admin_login_uses_backend_settings(self):
         response = self.client.post(
@@ -188,6 +719,212 @@ class TestAuthenticationPersistence(TestCase):
         self.assertEqual(response.status_code, 401)
 
 
+@skipUnless(isinstance(connections["default"], SqliteDatabaseWrapper), "Perfil SQLite não está ativo")
+class TestSqlitePerfil(TestCase):
+    def test_connection_applies_profile_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA synchronous")
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_atomic_blocks_begin_immediate(self):
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+        executados = []
+        with mock.patch.object(
+            SqliteDatabaseWrapper,
+            "cursor",
+            return_value=mock.Mock(execute=executados.append),
+        ):
+            connection._start_transaction_under_autocommit()
+        self.assertEqual(executados, ["BEGIN IMMEDIATE"])
+
+
+@override_settings(PERFILAMENTO_ATIVO=True, PERFILAMENTO_LENTO_MS=0, PERFILAMENTO_MEMORIA=True)
+class TestPerfilamento(TestCase):
+    def test_sampled_request_gets_server_timing_and_slow_log(self):
+        Produto.objects.create(
+            caixa=Caixa.objects.create(nome="Caixa", usuario="caixa", senha="123"),
+            nome="Bolo",
+            medida="UN",
+            preco=Decimal("5.00"),
+        )
+
+        with self.assertLogs("projetoIntegrador1.perfilamento", "WARNING") as logs:
+            response = self.client.get("/movimentacao/produtos/")
+
+        self.assertEqual(response.status_code, 200)
+        metricas = response["Server-Timing"]
+        self.assertRegex(metricas, r'db;desc="SQL \((\d+)\)";dur=[\d.]+')
+        self.assertIn("app;", metricas)
+        self.assertIn('mem;desc="pico', metricas)
+        self.assertIn("GET /movimentacao/produtos/ -> 200", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    async def test_async_request_is_profiled(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(PerfilamentoMiddleware(get_response)))
+        with self.assertLogs("projetoIntegrador1.perfilamento", "WARNING"):
+            response = await self.async_client.get("/movimentacao/produtos/")
+
+        self.assertEqual(response.status_code, 200)
+        consultas = re.search(r'db;desc="SQL \((\d+)\)"', response["Server-Timing"])
+        self.assertGreater(int(consultas.group(1)), 0)
+
+    @override_settings(PERFILAMENTO_AMOSTRAGEM=0)
+    def test_unsampled_request_is_untouched(self):
+        response = self.client.get("/movimentacao/produtos/")
+
+        self.assertNotIn("Server-Timing", response)
+
+
+@override_settings(METRICAS_ATIVAS=True, METRICAS_TOKEN="segredo")
+class TestMetricas(TestCase):
+    def test_metrics_endpoint_exposes_views_sections_and_business_counters(self):
+        caixa = Caixa.objects.create(nome="Caixa", usuario="caixa", senha="123")
+        produto = Produto.objects.create(caixa=caixa, nome="Bolo", medida="UN", preco=Decimal("5.00"))
+        ficha = Ficha.objects.create(numero=1, saldo=Decimal("20.00"))
+        MovimentacaoEstoque.objects.create(caixa=caixa, produto=produto, quantidade=5, tipo="E")
+        with self.captureOnCommitCallbacks(execute=True):
+            movimentacao = MovimentacaoEstoque.objects.create(caixa=caixa, produto=produto, quantidade=2, tipo="S")
+            Venda.objects.create(movimentacao=movimentacao, ficha=ficha)
+        self.client.get("/movimentacao/produtos/")
+
+        self.assertEqual(self.client.get("/metricas/").status_code, 401)
+        response = self.client.get("/metricas/", HTTP_AUTHORIZATION="Bearer segredo")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        texto = response.content.decode()
+        self.assertIn("# TYPE http_requisicao_duracao_segundos histogram", texto)
+        self.assertIn('http_requisicao_duracao_segundos_bucket{view="produto-list",metodo="GET",le="+Inf"}', texto)
+        self.assertIn('http_requisicao_consultas_sql_count{view="produto-list"}', texto)
+        self.assertIn('secao_bloqueio_espera_segundos_count{secao="venda.save"}', texto)
+        self.assertIn('secao_transacao_duracao_segundos_count{secao="movimentacao_estoque.save"}', texto)
+        self.assertRegex(texto, r"\nvendas_total \d+\n")
+        self.assertNotIn('view="metricas"', texto)
+
+    async def test_async_requests_are_measured(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(MetricasMiddleware(get_response)))
+
+        def consultas():
+            soma = re.search(r'http_requisicao_consultas_sql_sum\{view="produto-list"\} (\d+)', gerar_texto())
+            return int(soma.group(1)) if soma else 0
+
+        antes = consultas()
+        await self.async_client.get("/movimentacao/produtos/")
+        self.assertGreater(consultas(), antes)
+
+    @override_settings(METRICAS_ATIVAS=False)
+    def test_metrics_endpoint_disabled_by_default(self):
+        self.assertEqual(self.client.get("/metricas/").status_code, 404)
+
+
+@override_settings(CONSULTAS_REPETIDAS_LIMITE=3, CONSULTAS_REPETIDAS_ERRO=True)
+class TestConsultasRepetidas(TestCase):
+    def setUp(self):
+        caixas = [
+            Caixa.objects.create(nome=f"Caixa {indice}", usuario=f"caixa{indice}", senha="123")
+            for indice in range(5)
+        ]
+        qr_code = QRCodeReserva.objects.create(codigo="N-MAIS-1", ativo=True)
+        for indice, caixa in enumerate(caixas):
+            produto = Produto.objects.create(
+                caixa=caixa, nome=f"Produto {indice}", medida="UN", preco=Decimal("2.00"),
+                disponivel_reserva=True, quantidade_reserva_disponivel=10,
+            )
+            qr_code.produtos_disponiveis.add(produto)
+            ficha = Ficha.objects.create(numero=indice + 1, saldo=Decimal("50.00"), deleted_by_caixa=caixa)
+            MovimentacaoEstoque.objects.create(caixa=caixa, produto=produto, quantidade=10, tipo="E")
+            venda = MovimentacaoEstoque.objects.create(caixa=caixa, produto=produto, quantidade=1, tipo="S")
+            Venda.objects.create(movimentacao=venda, ficha=ficha)
+            Recarga.objects.create(ficha=ficha, caixa=caixa, valor=Decimal("5.00"))
+            ReservaProduto.objects.create(
+                nome_completo="Cliente", cpf="11111111111", produto=produto, quantidade=1,
+                ficha=ficha if indice % 2 else None, qr_code_reserva=qr_code,
+            )
+
+    def test_list_endpoints_do_not_repeat_queries_per_row(self):
+        for prefixo, _, _ in router.registry:
+            with self.subTest(prefixo=prefixo):
+                self.assertEqual(self.client.get(f"/movimentacao/{prefixo}/").status_code, 200)
+
+        for url in (
+            "/movimentacao/reservas-publicas/por-cpf/?cpf=11111111111",
+            "/movimentacao/reservas/pendentes_por_cpf/?cpf=11111111111",
+            "/movimentacao/fichas/1/historico/",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    async def test_async_middleware_detects_repeated_queries(self):
+        async def get_response(request):
+            for caixa_id in range(5):
+                await Caixa.objects.filter(pk=caixa_id).aexists()
+            return HttpResponse()
+
+        middleware = ConsultasRepetidasMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertRaises(ConsultasRepetidas):
+            await middleware(RequestFactory().get("/"))
+
+    def test_detector_reports_repeated_shape_with_stack(self):
+        with self.assertRaises(ConsultasRepetidas) as erro, sem_consultas_repetidas(limite=3):
+            for produto in Produto.objects.all():
+                produto.caixa.nome
+
+        self.assertIn('5x (limite 3): SELECT "movimentacao_caixa"', str(erro.exception))
+        self.assertIn("produto.caixa.nome", str(erro.exception))
+
+
+class TestExecutorTestes(SimpleTestCase):
+    @override_settings(
+        CONSULTAS_REPETIDAS_LIMITE=0, CONSULTAS_REPETIDAS_ERRO=False, CONSULTAS_REPETIDAS_LIMITE_TESTES=4
+    )
+    def test_runner_restores_detector_settings_on_teardown(self):
+        executor = ExecutorTestes()
+        # O ambiente de testes já está montado: só a parte do executor roda
+        with mock.patch.object(DiscoverRunner, "setup_test_environment"), mock.patch.object(
+            DiscoverRunner, "teardown_test_environment"
+        ):
+            executor.setup_test_environment()
+            self.assertEqual(settings.CONSULTAS_REPETIDAS_LIMITE, 4)
+            self.assertTrue(settings.CONSULTAS_REPETIDAS_ERRO)
+            executor.teardown_test_environment()
+
+        self.assertEqual(settings.CONSULTAS_REPETIDAS_LIMITE, 0)
+        self.assertFalse(settings.CONSULTAS_REPETIDAS_ERRO)
+
+
+class TestRoteadorRelatorios(SimpleTestCase):
+    def setUp(self):
+        self.roteador = RoteadorRelatorios()
+
+    def test_reads_use_reporting_alias_only_inside_reporting_context(self):
+        self.assertIsNone(self.roteador.db_for_read(Venda))
+        with _usar_alias(ALIAS_RELATORIOS):
+            self.assertEqual(self.roteador.db_for_read(Venda), ALIAS_RELATORIOS)
+            self.assertEqual(self.roteador.db_for_write(Venda), "default")
+            with banco_principal():
+                self.assertIsNone(self.roteador.db_for_read(Venda))
+        self.assertIsNone(self.roteador.db_for_read(Venda))
+
+    def test_reporting_context_is_noop_without_reporting_database(self):
+        bancos = {"default": settings.DATABASES["default"]}
+        with mock.patch.object(settings, "DATABASES", bancos), banco_relatorios():
+            self.assertIsNone(self.roteador.db_for_read(Venda))
+
+    def test_reporting_database_is_never_migrated(self):
+        self.assertFalse(self.roteador.allow_migrate(ALIAS_RELATORIOS, "movimentacao"))
+        self.assertTrue(self.roteador.allow_migrate("default", "movimentacao"))
+
+
 class TestQRCodeReservationFlow(TestCase):
     def setUp(self):
         self.caixa = Caixa.objects.create(
@@ -220,6 +957,145 @@ class TestQRCodeReservationFlow(TestCase):
         )
         self.qr_code.produtos_disponiveis.set([self.produto_permitido])
 
+    def test_pick_list_aggregates_by_product_and_customer(self):
+        self.qr_code.produtos_disponiveis.add(self.produto_fora_qr)
+        for cpf, nome, produto, quantidade in (
+            ("11111111111", "Ana", self.produto_permitido, 2),
+            ("11111111111", "Ana", self.produto_fora_qr, 1),
+            ("22222222222", "Bruno", self.produto_permitido, 1),
+        ):
+            ReservaProduto.objects.create(
+                nome_completo=nome, cpf=cpf, produto=produto, quantidade=quantidade, qr_code_reserva=self.qr_code
+            )
+        ReservaProduto.objects.create(
+            nome_completo="Carla", cpf="33333333333", produto=self.produto_permitido,
+            quantidade=2, qr_code_reserva=self.qr_code, status="cancelada",
+        )
+
+        # QR code (com o prefetch do viewset) + um agregado por produto + um por cliente
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/movimentacao/qr-codes-reserva/{self.qr_code.id}/separacao/")
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["total_reservas"], data["total_itens"], data["valor_total"]), (3, 4, 22.0))
+        self.assertEqual(
+            [(p["produto"], p["quantidade"], p["reservas"]) for p in data["produtos"]],
+            [("Bolo", 3, 2), ("Suco", 1, 1)],
+        )
+        ana = data["clientes"][0]
+        self.assertEqual((ana["nome_completo"], ana["quantidade"], ana["valor_total"]), ("Ana", 3, 16.0))
+        self.assertEqual([item["produto"] for item in ana["itens"]], ["Bolo", "Suco"])
+        self.assertEqual(data["clientes"][1]["nome_completo"], "Bruno")
+
+        pdf = self.client.get(f"/movimentacao/qr-codes-reserva/{self.qr_code.id}/separacao/", {"formato": "pdf"})
+        self.assertEqual(pdf["Content-Type"], "application/pdf")
+        self.assertTrue(pdf.content.startswith(b"%PDF"))
+
+        response = self.client.get(
+            f"/movimentacao/qr-codes-reserva/{self.qr_code.id}/separacao/", {"status": "sumida"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_static_snapshot_matches_live_endpoint(self):
+        ReservaProduto.objects.create(
+            nome_completo="Ana", cpf="11111111111", produto=self.produto_permitido, quantidade=2
+        )
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(
+            RESERVAS_PUBLICAS_ESTATICAS_DIR=diretorio
+        ):
+            self.assertEqual(publicar_qr_codes(), 1)
+            caminho = os.path.join(diretorio, "RESERVA-TESTE.json")
+            with open(caminho, encoding="utf-8") as arquivo:
+                publicado = json.load(arquivo)
+            live = self.client.get("/movimentacao/reservas-publicas/RESERVA-TESTE/produtos/").json()
+            self.assertEqual(publicado, live)
+            self.assertEqual(publicado["produtos"][0]["disponivel"], 3)
+
+            # Conteúdo igual não regrava; QR code fora do período some
+            self.assertEqual(publicar_qr_codes(), 0)
+            self.qr_code.data_expiracao = timezone.now() - timedelta(minutes=1)
+            self.qr_code.save()
+            self.assertEqual(publicar_qr_codes(), 1)
+            self.assertFalse(os.path.exists(caminho))
+
+    def test_static_publisher_only_removes_files_it_wrote(self):
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(
+            RESERVAS_PUBLICAS_ESTATICAS_DIR=diretorio
+        ):
+            alheio = os.path.join(diretorio, "config.json")
+            with open(alheio, "w", encoding="utf-8") as arquivo:
+                arquivo.write("{}")
+
+            self.assertEqual(publicar_qr_codes(), 1)
+            self.qr_code.ativo = False
+            self.qr_code.save()
+            self.assertEqual(publicar_qr_codes(), 1)
+
+            self.assertFalse(os.path.exists(os.path.join(diretorio, "RESERVA-TESTE.json")))
+            self.assertTrue(os.path.exists(alheio))
+
+    def test_static_publisher_is_woken_by_edits_but_not_by_sales(self):
+        conectar_sinais_publicacao()
+        _alteracao_publicacao.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto_permitido.atualizar_estoque(4)
+        self.assertFalse(_alteracao_publicacao.is_set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto_permitido.preco = Decimal("6.00")
+            self.produto_permitido.save()
+        self.assertTrue(_alteracao_publicacao.is_set())
+        _alteracao_publicacao.clear()
+
+    @skipUnless(agendamento.fcntl, "travas entre processos exigem fcntl")
+    def test_static_publisher_runs_in_a_single_process(self):
+        # Outro processo (aqui, outro descritor) já segura a trava do publicador
+        with open(agendamento._caminho_trava(TRAVA_PUBLICADOR), "a") as arquivo:
+            agendamento.fcntl.flock(arquivo, agendamento.fcntl.LOCK_EX | agendamento.fcntl.LOCK_NB)
+            with mock.patch("movimentacao.publicacao.threading.Thread") as thread:
+                self.assertIsNone(iniciar_publicador())
+            thread.assert_not_called()
+
+    def test_qr_resolver_is_cached_and_invalidated_on_changes(self):
+        url = "/movimentacao/reservas-publicas/RESERVA-TESTE/produtos/"
+        self.client.get(url)
+
+        # Com o QR code em cache: só produtos e reservas ativas
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()["produtos"]), 1)
+
+        self.qr_code.produtos_disponiveis.add(self.produto_fora_qr)
+        self.assertEqual(len(self.client.get(url).json()["produtos"]), 2)
+
+        self.qr_code.ativo = False
+        self.qr_code.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(QR_CODES_CACHE_MAXIMO=2)
+    def test_qr_resolver_cache_is_bounded_and_skips_unknown_codes(self):
+        for codigo in ("EXTRA-1", "EXTRA-2"):
+            QRCodeReserva.objects.create(codigo=codigo, descricao=codigo, ativo=True)
+        limpar_cache_qr_codes()
+
+        resolver_qr_code("RESERVA-TESTE")
+        resolver_qr_code("EXTRA-1")
+        resolver_qr_code("RESERVA-TESTE")
+        resolver_qr_code("EXTRA-2")
+        # EXTRA-1 era o menos usado e saiu do cache
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver_qr_code("RESERVA-TESTE").codigo, "RESERVA-TESTE")
+            resolver_qr_code("EXTRA-2")
+        with self.assertNumQueries(2):
+            resolver_qr_code("EXTRA-1")
+
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertIsNone(resolver_qr_code("INEXISTENTE"))
+        limpar_cache_qr_codes()
+
     def test_public_products_returns_availability_for_qr_products_only(self):
         response = self.client.get(
             "/movimentacao/reservas-publicas/RESERVA-TESTE/produtos/"
@@ -232,6 +1108,39 @@ class TestQRCodeReservationFlow(TestCase):
         self.assertEqual(data["produtos"][0]["disponivel"], 5)
         self.assertEqual(data["produtos"][0]["reservado"], 0)
 
+    def test_async_public_views_match_sync_responses(self):
+        ReservaProduto.objects.create(
+            nome_completo="Maria Silva",
+            cpf="12345678901",
+            produto=self.produto_permitido,
+            quantidade=2,
+            qr_code_reserva=self.qr_code,
+        )
+        factory = RequestFactory()
+
+        sincrona = self.client.get("/movimentacao/reservas-publicas/RESERVA-TESTE/produtos/")
+        assincrona = async_to_sync(reserva_publica_produtos_async)(
+            factory.get("/"), qr_code="RESERVA-TESTE"
+        )
+        self.assertEqual(assincrona.status_code, 200)
+        self.assertEqual(json.loads(assincrona.content), sincrona.json())
+        self.assertEqual(json.loads(assincrona.content)["produtos"][0]["disponivel"], 3)
+
+        sincrona = self.client.get("/movimentacao/reservas-publicas/por-cpf/?cpf=12345678901")
+        assincrona = async_to_sync(reservas_por_cpf_async)(
+            factory.get("/", {"cpf": "12345678901"})
+        )
+        self.assertEqual(assincrona.status_code, 200)
+        self.assertEqual(json.loads(assincrona.content), sincrona.json())
+        self.assertEqual(json.loads(assincrona.content)["total"], 12.0)
+
+    def test_async_public_products_rejects_unknown_qr_code(self):
+        response = async_to_sync(reserva_publica_produtos_async)(
+            RequestFactory().get("/"), qr_code="NAO-EXISTE"
+        )
+
+        self.assertEqual(response.status_code, 404)
+
     def test_public_reservation_rejects_product_outside_qr_code(self):
         response = self.client.post(
             "/movimentacao/reservas-publicas/criar/",
@@ -251,3 +1160,216 @@ class TestQRCodeReservationFlow(TestCase):
 
         self.assertEqual(response.status_code, 400)
         self.assertIn("não está disponível neste QR code", response.json()["error"])
+
+
+class TestAlertasEstoque(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(
+            nome="Caixa Principal",
+            usuario="caixa",
+            senha="123",
+        )
+        self.produto = Produto.objects.create(
+            caixa=self.caixa,
+            nome="Pastel",
+            medida="UN",
+            preco=Decimal("5.00"),
+            estoque_minimo=3,
+        )
+        self.broker = get_broker()
+
+    def movimentar(self, quantidade, tipo):
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimentacaoEstoque.objects.create(
+                caixa=self.caixa,
+                produto=self.produto,
+                quantidade=quantidade,
+                tipo=tipo,
+            )
+
+    def alertas_desde(self, ultimo_id):
+        return self.broker.eventos_desde(ultimo_id, {TOPICO_ALERTA_ESTOQUE})
+
+    def test_alert_is_emitted_once_when_crossing_minimum(self):
+        self.movimentar(5, "E")
+        inicio = self.broker.ultimo_id
+
+        self.movimentar(1, "S")
+        self.assertEqual(self.alertas_desde(inicio), [])
+
+        self.movimentar(1, "S")
+        alertas = self.alertas_desde(inicio)
+        self.assertEqual(len(alertas), 1)
+        self.assertEqual(alertas[0].dados["regra"], "estoque_minimo")
+        self.assertEqual(alertas[0].dados["estoque"], 3)
+
+        self.movimentar(1, "S")
+        self.assertEqual(len(self.alertas_desde(inicio)), 1)
+
+    def test_days_of_cover_alert_uses_recent_sale_rate(self):
+        self.produto.estoque_minimo = 0
+        self.produto.dias_cobertura_minimo = 2
+        self.produto.save()
+        self.movimentar(30, "E")
+        ficha = Ficha.objects.create(numero=1, saldo=Decimal("500.00"))
+        movimentacao = MovimentacaoEstoque.objects.create(
+            caixa=self.caixa,
+            produto=self.produto,
+            quantidade=10,
+            tipo="S",
+        )
+        Venda.objects.create(movimentacao=movimentacao, ficha=ficha)
+        inicio = self.broker.ultimo_id
+
+        # Ritmo de 10/dia: 20 unidades cobrem 2 dias, 19 cobrem menos
+        self.movimentar(1, "S")
+
+        alertas = self.alertas_desde(inicio)
+        self.assertEqual(len(alertas), 1)
+        self.assertEqual(alertas[0].dados["regra"], "dias_cobertura")
+        self.assertEqual(alertas[0].dados["dias_cobertura"], 1.9)
+
+    def test_stream_replays_alerts_after_last_event_id(self):
+        self.movimentar(4, "E")
+        inicio = self.broker.ultimo_id
+        self.movimentar(1, "S")
+
+        # O EventSource não envia cabeçalhos: o token vai na query string
+        token, _ = gerar_token_caixa(self.caixa)
+        response = self.client.get(
+            "/movimentacao/alertas-estoque/stream/",
+            {"token": token},
+            HTTP_LAST_EVENT_ID=str(inicio),
+        )
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        conteudo = iter(response.streaming_content)
+        self.assertEqual(next(conteudo), b"retry: 3000\n\n")
+        evento = next(conteudo).decode()
+        self.assertIn("event: alerta_estoque", evento)
+        self.assertIn('"regra": "estoque_minimo"', evento)
+        response.close()
+
+
+class TestEventosStream(TestCase):
+    def setUp(self):
+        self.caixa = Caixa.objects.create(
+            nome="Caixa Principal",
+            usuario="caixa",
+            senha="123",
+        )
+        self.produto = Produto.objects.create(
+            caixa=self.caixa,
+            nome="Pastel",
+            medida="UN",
+            preco=Decimal("5.00"),
+        )
+        self.broker = get_broker()
+        autenticar_caixa(self.client, self.caixa)
+
+    def test_sale_publishes_stock_balance_and_sale_events_after_commit(self):
+        MovimentacaoEstoque.objects.create(caixa=self.caixa, produto=self.produto, quantidade=5, tipo="E")
+        ficha = Ficha.objects.create(numero=1, saldo=Decimal("20.00"))
+        inicio = self.broker.ultimo_id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            movimentacao = MovimentacaoEstoque.objects.create(
+                caixa=self.caixa,
+                produto=self.produto,
+                quantidade=2,
+                tipo="S",
+            )
+            Venda.objects.create(movimentacao=movimentacao, ficha=ficha)
+            self.assertEqual(self.broker.eventos_desde(inicio), [])
+
+        eventos = {evento.topico: evento.dados for evento in self.broker.eventos_desde(inicio)}
+        self.assertEqual(eventos["estoque"]["estoque"], 3)
+        self.assertEqual(eventos["saldo"]["saldo"], Decimal("10.00"))
+        self.assertEqual(eventos["venda"]["quantidade"], 2)
+
+    def test_stream_filters_by_topic(self):
+        inicio = self.broker.ultimo_id
+        self.broker.publicar("estoque", {"produto_id": 1})
+        self.broker.publicar("saldo", {"ficha_id": 1})
+
+        response = self.client.get(
+            "/movimentacao/eventos/stream/",
+            {"topicos": "saldo"},
+            HTTP_LAST_EVENT_ID=str(inicio),
+        )
+
+        conteudo = iter(response.streaming_content)
+        next(conteudo)
+        self.assertIn("event: saldo", next(conteudo).decode())
+        response.close()
+
+    def test_streams_require_authentication(self):
+        del self.client.defaults["HTTP_AUTHORIZATION"]
+
+        for url in ("/movimentacao/eventos/stream/", "/movimentacao/alertas-estoque/stream/"):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 401)
+                self.assertEqual(self.client.get(url, {"token": "invalido"}).status_code, 401)
+
+    @override_settings(EVENTOS_STREAM_DURACAO_SEGUNDOS=0.3)
+    def test_stream_closes_after_max_duration_with_resume_id(self):
+        broker = BrokerLocal()
+        broker.publicar("saldo", {"ficha_id": 1})
+
+        with mock.patch("movimentacao.views_eventos.HEARTBEAT_SEGUNDOS", 0.1):
+            partes = list(stream_eventos({"saldo"}, 0, broker))
+
+        self.assertIn("event: saldo", partes[1])
+        self.assertIn(": ping\n\n", partes)
+        self.assertEqual(partes[-1], "id: 1\n\n")
+
+    def test_stream_rejects_unknown_topic(self):
+        response = self.client.get("/movimentacao/eventos/stream/", {"topicos": "inexistente"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_async_wait_wakes_up_on_publish(self):
+        broker = BrokerLocal()
+
+        async def cenario():
+            espera = asyncio.create_task(broker.aguardar_async(0, {"venda"}, timeout=5))
+            await asyncio.sleep(0)
+            broker.publicar("venda", {"venda_id": 1})
+            return await espera
+
+        eventos = asyncio.run(cenario())
+        self.assertEqual([evento.dados for evento in eventos], [{"venda_id": 1}])
+
+    def test_broker_interface_is_abstract(self):
+        class BrokerIncompleto(BrokerBase):
+            def publicar(self, topico, dados):
+                return None
+
+        with self.assertRaises(TypeError):
+            BrokerIncompleto()
+
+    def test_stream_waits_for_heartbeat_on_other_topics(self):
+        broker = BrokerLocal()
+        broker.publicar("estoque", {"produto_id": 1})
+        stream = stream_eventos({"saldo"}, 0, broker)
+        next(stream)
+
+        with mock.patch("movimentacao.views_eventos.HEARTBEAT_SEGUNDOS", 0.2):
+            inicio = time.monotonic()
+            self.assertEqual(next(stream), ": ping\n\n")
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.2)
+
+    def test_async_wait_ignores_other_topics(self):
+        broker = BrokerLocal()
+
+        async def cenario():
+            espera = asyncio.create_task(broker.aguardar_async(0, {"saldo"}, timeout=0.2))
+            await asyncio.sleep(0)
+            broker.publicar("estoque", {"produto_id": 1})
+            inicio = time.monotonic()
+            eventos = await espera
+            return eventos, time.monotonic() - inicio
+
+        eventos, espera = asyncio.run(cenario())
+        self.assertEqual(eventos, [])
+        self.assertGreaterEqual(espera, 0.15)
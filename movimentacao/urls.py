@@ -10,12 +10,16 @@ from .views import (
     admin_login,
     movimentacoes_financeiras,
 )
+from django.conf import settings
 from .views_reserva import (
     QRCodeReservaViewSet,
     reserva_publica_produtos,
+    reserva_publica_produtos_async,
     criar_reserva_publica,
-    reservas_por_cpf
+    reservas_por_cpf,
+    reservas_por_cpf_async,
 )
+from .views_eventos import alertas_estoque_stream, eventos_stream
 
 router = DefaultRouter()
 router.register(r'caixas', CaixaViewSet)
@@ -26,10 +30,17 @@ router.register(r'vendas', VendaViewSet)
 router.register(r'reservas', ReservaProdutoViewSet, basename='reserva')
 router.register(r'qr-codes-reserva', QRCodeReservaViewSet, basename='qr-code-reserva')
 
+# Sob ASGI, os endpoints públicos de leitura usam as versões assíncronas
+if settings.VIEWS_PUBLICAS_ASYNC:
+    reserva_publica_produtos = reserva_publica_produtos_async
+    reservas_por_cpf = reservas_por_cpf_async
+
 urlpatterns = [
     path('', include(router.urls)),
     path('admin-login/', admin_login, name='admin-login'),
     path('movimentacoes-financeiras/', movimentacoes_financeiras, name='movimentacoes-financeiras'),
+    path('eventos/stream/', eventos_stream, name='eventos-stream'),
+    path('alertas-estoque/stream/', alertas_estoque_stream, name='alertas-estoque-stream'),
     # Endpoints públicos para reservas
     path('reservas-publicas/<str:qr_code>/produtos/', reserva_publica_produtos, name='reserva-publica-produtos'),
     path('reservas-publicas/criar/', criar_reserva_publica, name='criar-reserva-publica'),
@@ -4,16 +4,34 @@ from rest_framework.filters import SearchFilter
 from rest_framework.response import Response
 from django.utils.crypto import constant_time_compare
 from django.db.models.functions import Lower
-from django.db.models import Sum
+from django.db.models import F, Max, Prefetch, Q, Sum
 from django.utils import timezone
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.urls import reverse
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
 from decimal import Decimal
-from .models import Caixa, Ficha, Produto, MovimentacaoEstoque, Venda, ReservaProduto, Recarga
+from projetoIntegrador1.roteamento import leitura_relatorios
+from .autenticacao import (
+    CaixaAutenticado,
+    CaixaTokenAuthentication,
+    gerar_token_caixa,
+    revogar_token_caixa,
+    revogar_tokens_caixa,
+)
+from .conversao import converter_reservas_em_vendas
+from .eventos import TOPICO_SALDO, dados_saldo, publicar_apos_commit
+from .impressao import folha_fichas_pdf
+from .models import Caixa, Ficha, Produto, MovimentacaoEstoque, Venda, ReservaProduto, Recarga, com_total_reservas
 from .serializers import (
     CaixaSerializer,
     FichaSerializer,
     RecargaFichaSerializer,
+    RecargaLoteSerializer,
+    EmissaoFichasLoteSerializer,
     ProdutoSerializer,
     MovimentacaoEstoqueSerializer,
     VendaSerializer,
@@ -42,8 +60,7 @@ class CaixaViewSet(viewsets.ModelViewSet):
                 if caixa.senha and not caixa.senha.startswith(('pbkdf2_', 'argon2', 'bcrypt')):
                     caixa.set_senha(senha)
                     caixa.save(update_fields=['senha'])
-                serializer = CaixaSerializer(caixa)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                return Response(self._resposta_sessao(caixa), status=status.HTTP_200_OK)
             else:
                 return Response(
                     {"detail": "Usuário ou senha inválidos."},
@@ -55,6 +72,47 @@ class CaixaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
+    @action(detail=False, methods=['post'], authentication_classes=[CaixaTokenAuthentication])
+    def renovar(self, request):
+        """Troca um token de caixa válido por um novo, sem verificar a senha"""
+        if not isinstance(request.user, CaixaAutenticado):
+            return Response(
+                {"detail": "Token de caixa não fornecido."},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        try:
+            caixa = request.user.caixa
+        except Caixa.DoesNotExist:
+            return Response(
+                {"detail": "Token de caixa inválido."},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        revogar_token_caixa(request.auth)
+        return Response(self._resposta_sessao(caixa), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], authentication_classes=[CaixaTokenAuthentication])
+    def logout(self, request):
+        """Revoga o token de caixa usado na requisição"""
+        if isinstance(request.user, CaixaAutenticado):
+            revogar_token_caixa(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def perform_update(self, serializer):
+        senha_alterada = bool(serializer.validated_data.get('senha'))
+        caixa = serializer.save()
+        if senha_alterada:
+            revogar_tokens_caixa(caixa.pk)
+
+    @staticmethod
+    def _resposta_sessao(caixa):
+        token, expira_em = gerar_token_caixa(caixa)
+        return {
+            **CaixaSerializer(caixa).data,
+            "token": token,
+            "token_expira_em": datetime.fromtimestamp(expira_em, tz=dt_timezone.utc),
+        }
+
 
 @api_view(['POST'])
 def admin_login(request):
@@ -83,14 +141,15 @@ def admin_login(request):
 
 
 @api_view(['GET'])
+@leitura_relatorios
 def movimentacoes_financeiras(request):
     """Retorna o extrato financeiro consolidado de recargas e vendas."""
     recargas = Recarga.objects.select_related('ficha', 'caixa', 'produto').order_by('-data')
     vendas = Venda.objects.select_related(
         'ficha',
-        'movimentacao__caixa',
-        'movimentacao__produto',
-    ).order_by('-movimentacao__data')
+        'caixa',
+        'produto',
+    ).order_by('-data')
 
     movimentos = []
 
@@ -114,14 +173,14 @@ def movimentacoes_financeiras(request):
         movimentos.append({
             'id': f'venda-{venda.id}',
             'tipo': 'venda',
-            'data': venda.movimentacao.data,
+            'data': venda.data,
             'ficha_id': venda.ficha_id,
             'ficha_numero': venda.ficha.numero,
-            'caixa_id': venda.movimentacao.caixa_id,
-            'caixa_nome': venda.movimentacao.caixa.nome,
-            'produto_nome': venda.movimentacao.produto.nome,
-            'descricao': f'Venda de {venda.movimentacao.produto.nome}',
-            'quantidade': venda.movimentacao.quantidade,
+            'caixa_id': venda.caixa_id,
+            'caixa_nome': venda.caixa.nome,
+            'produto_nome': venda.produto.nome,
+            'descricao': f'Venda de {venda.produto.nome}',
+            'quantidade': venda.quantidade,
             'valor': venda.preco_total,
             'direcao': 'saida',
         })
@@ -146,8 +205,49 @@ def movimentacoes_financeiras(request):
         'movimentacoes': movimentos,
     })
 
+# Máximo de fichas por emissão em lote ou folha de impressão
+LIMITE_LOTE_FICHAS = 5000
+# Maior número aceito por Ficha.numero (PositiveSmallIntegerField)
+NUMERO_FICHA_MAXIMO = 32767
+
+
+def _intervalo_fichas(dados, continuar=False):
+    """Lê `inicio` e `fim` (ou `quantidade`) e valida o intervalo de números.
+
+    Com `continuar=True` e sem `inicio`, começa após o maior número existente.
+    """
+    try:
+        inicio = dados.get('inicio')
+        fim = dados.get('fim')
+        quantidade = dados.get('quantidade')
+        inicio = int(inicio) if inicio not in (None, '') else None
+        fim = int(fim) if fim not in (None, '') else None
+        quantidade = int(quantidade) if quantidade not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError("inicio, fim e quantidade devem ser números inteiros.")
+
+    if inicio is None and continuar and quantidade:
+        inicio = (Ficha.objects.aggregate(maior=Max('numero'))['maior'] or 0) + 1
+    if inicio is None:
+        raise ValueError("Informe inicio e fim, ou a quantidade de fichas.")
+    if fim is None:
+        if not quantidade:
+            raise ValueError("Informe fim ou quantidade.")
+        fim = inicio + quantidade - 1
+
+    if inicio < 1 or fim < inicio or fim > NUMERO_FICHA_MAXIMO:
+        raise ValueError(f"Intervalo inválido: use números entre 1 e {NUMERO_FICHA_MAXIMO}.")
+    if fim - inicio + 1 > LIMITE_LOTE_FICHAS:
+        raise ValueError(f"No máximo {LIMITE_LOTE_FICHAS} fichas por vez.")
+    return inicio, fim
+
+
+# Relacionamentos lidos por VendaSerializer (inclui a ficha serializada)
+VENDA_RELACIONADOS = ('movimentacao__produto', 'movimentacao__caixa', 'ficha__deleted_by_caixa')
+
+
 class FichaViewSet(viewsets.ModelViewSet):
-    queryset = Ficha.objects.all().order_by('numero')
+    queryset = Ficha.objects.select_related('deleted_by_caixa').order_by('numero')
     # serializer_class = FichaSerializer
     
     def get_serializer_class(self):
@@ -181,18 +281,20 @@ class FichaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Se houver CPF de reserva, busca reservas pendentes
-        reservas_ids = []
+        # Se houver CPF de reserva, busca (e bloqueia) as reservas pendentes
+        reservas_pendentes = []
         valor_total_reserva = Decimal('0.00')
         
         if cpf_reserva:
-            reservas_pendentes = ReservaProduto.objects.filter(
-                cpf=cpf_reserva,
-                status='pendente',
-                ficha__isnull=True
-            ).select_related('produto')
+            reservas_pendentes = list(
+                ReservaProduto.objects.select_for_update(of=('self',)).filter(
+                    cpf=cpf_reserva,
+                    status='pendente',
+                    ficha__isnull=True
+                ).select_related('produto').order_by('id')
+            )
             
-            if not reservas_pendentes.exists():
+            if not reservas_pendentes:
                 return Response(
                     {"detail": f"Nenhuma reserva pendente encontrada para o CPF {cpf_reserva}."},
                     status=status.HTTP_400_BAD_REQUEST
@@ -200,9 +302,7 @@ class FichaViewSet(viewsets.ModelViewSet):
             
             # Calcula valor total das reservas
             for reserva in reservas_pendentes:
-                preco_total = Decimal(str(reserva.produto.preco)) * reserva.quantidade
-                valor_total_reserva += preco_total
-                reservas_ids.append(reserva.id)
+                valor_total_reserva += Decimal(str(reserva.produto.preco)) * reserva.quantidade
             
             # Valida que o saldo inicial seja >= valor total das reservas
             if saldo_inicial < valor_total_reserva:
@@ -218,46 +318,16 @@ class FichaViewSet(viewsets.ModelViewSet):
         # Cria a ficha
         ficha = Ficha.objects.create(numero=numero, saldo=saldo_inicial)
         
-        # Se houver reservas, processa elas
-        if reservas_ids:
-            reservas_pendentes = ReservaProduto.objects.filter(id__in=reservas_ids)
-            
-            # Processa cada reserva
-            for reserva in reservas_pendentes:
-                # Valida estoque
-                if reserva.produto.estoque < reserva.quantidade:
-                    # Reverte criação da ficha
-                    ficha.delete()
-                    return Response(
-                        {"detail": f"Estoque insuficiente para {reserva.produto.nome}. Disponível: {reserva.produto.estoque}, Necessário: {reserva.quantidade}."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Cria movimentação de estoque (saída)
-                movimentacao = MovimentacaoEstoque.objects.create(
-                    caixa=caixa,
-                    produto=reserva.produto,
-                    quantidade=reserva.quantidade,
-                    tipo='S'
-                )
-                
-                # Cria venda
-                Venda.objects.create(
-                    movimentacao=movimentacao,
-                    ficha=ficha
-                )
-                
-                # Vincula reserva à ficha e atualiza status
-                reserva.ficha = ficha
-                reserva.status = 'finalizada'
-                reserva.data_confirmacao = timezone.now()
-                reserva.save()
-            
-            # Calcula saldo restante após processar reservas
-            saldo_restante = saldo_inicial - valor_total_reserva
-            if saldo_restante > 0:
-                ficha.saldo = saldo_restante
-                ficha.save()
+        # Converte todas as reservas em vendas de uma vez (estoque e saldo
+        # validados antes de qualquer escrita)
+        conversao = None
+        if reservas_pendentes:
+            try:
+                conversao = converter_reservas_em_vendas(reservas_pendentes, ficha=ficha, caixa=caixa)
+            except ValidationError as e:
+                # Desfaz a criação da ficha
+                transaction.set_rollback(True)
+                return Response({"detail": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
             
             # Registra recarga inicial (se houver saldo restante ou se foi recarga maior)
             if saldo_inicial > valor_total_reserva:
@@ -269,8 +339,108 @@ class FichaViewSet(viewsets.ModelViewSet):
                 )
         
         serializer = self.get_serializer(ficha)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        dados = serializer.data
+        if conversao:
+            dados['reservas_convertidas'] = {
+                'reservas': conversao['reservas'],
+                'itens': conversao['itens'],
+                'valor_total': float(conversao['valor_total']),
+                'vendas': conversao['vendas'],
+            }
+        return Response(dados, status=status.HTTP_201_CREATED)
     
+    @action(detail=False, methods=['post'], url_path='emitir-lote')
+    def emitir_lote(self, request):
+        """Emite fichas em lote numa única transação.
+
+        Recebe `inicio` e `fim` (ou `quantidade`; sem `inicio`, continua do
+        maior número existente), `saldo` inicial e `caixa_id`.
+        """
+        try:
+            inicio, fim = _intervalo_fichas(request.data, continuar=True)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = EmissaoFichasLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        saldo_inicial = serializer.validated_data['saldo']
+        caixa = serializer.validated_data['caixa']
+
+        intervalo = Ficha.objects.filter(numero__range=(inicio, fim))
+        existentes = list(intervalo.order_by('numero').values_list('numero', flat=True)[:20])
+        if existentes:
+            return Response(
+                {
+                    "detail": "Já existem fichas com números neste intervalo.",
+                    "numeros_existentes": existentes,
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            with transaction.atomic():
+                Ficha.objects.bulk_create(
+                    [Ficha(numero=numero, saldo=saldo_inicial) for numero in range(inicio, fim + 1)],
+                    batch_size=500,
+                )
+                # Saldo inicial entra no extrato como recarga, como na criação com reservas
+                if saldo_inicial > 0:
+                    Recarga.objects.bulk_create(
+                        [
+                            Recarga(
+                                ficha_id=ficha_id,
+                                caixa=caixa,
+                                valor=saldo_inicial,
+                                observacoes="Saldo inicial (emissão em lote)",
+                            )
+                            for ficha_id in intervalo.values_list('id', flat=True)
+                        ],
+                        batch_size=500,
+                    )
+        except IntegrityError:
+            return Response(
+                {"detail": "Outra emissão usou números deste intervalo. Tente novamente."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        quantidade = fim - inicio + 1
+        return Response(
+            {
+                "quantidade": quantidade,
+                "inicio": inicio,
+                "fim": fim,
+                "saldo_inicial": float(saldo_inicial),
+                "valor_total": float(saldo_inicial * quantidade),
+                "folha_impressao": (
+                    f"{reverse('ficha-folha-impressao')}?inicio={inicio}&fim={fim}"
+                ),
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['get'], url_path='folha-impressao')
+    def folha_impressao(self, request):
+        """PDF com um cartão por ficha ativa no intervalo `inicio`-`fim`"""
+        try:
+            inicio, fim = _intervalo_fichas(request.query_params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        numeros = list(
+            Ficha.objects.filter(numero__range=(inicio, fim), is_active=True)
+            .order_by('numero')
+            .values_list('numero', flat=True)
+        )
+        if not numeros:
+            return Response(
+                {"detail": "Nenhuma ficha ativa neste intervalo."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        pdf = folha_fichas_pdf(numeros, titulo=request.query_params.get('titulo', ''))
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = f'inline; filename="fichas-{inicio}-{fim}.pdf"'
+        return response
+
     def destroy(self, request, *args, **kwargs):
         """Deletar ficha com verificação de senha admin"""
         senha_admin = request.data.get('senha_admin')
@@ -297,11 +467,12 @@ class FichaViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
     
     @action(detail=True, methods=['get'])
+    @leitura_relatorios
     def historico(self, request, pk=None):
         """Retorna histórico completo da ficha"""
         ficha = self.get_object()
-        vendas = Venda.objects.filter(ficha=ficha).order_by('-movimentacao__data')
-        recargas = Recarga.objects.filter(ficha=ficha).order_by('-data')
+        vendas = Venda.objects.filter(ficha=ficha).select_related(*VENDA_RELACIONADOS).order_by('-data')
+        recargas = Recarga.objects.filter(ficha=ficha).select_related('ficha', 'caixa', 'produto').order_by('-data')
         
         serializer = self.get_serializer({
             'ficha': ficha,
@@ -350,16 +521,112 @@ class FichaViewSet(viewsets.ModelViewSet):
 
         serializer = FichaSerializer(ficha)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='recarga-lote')
+    @transaction.atomic
+    def recarga_lote(self, request):
+        """Recarrega várias fichas numa transação.
+
+        Recebe `itens` (`ficha_id` ou `numero`, e `valor`) ou `inicio`, `fim`
+        e `valor` para todas as fichas ativas do intervalo, além de
+        `caixa_id`, `produto_id` (opcional) e `observacoes`.
+        """
+        serializer = RecargaLoteSerializer(data=request.data, context={'limite': LIMITE_LOTE_FICHAS})
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+
+        # Valor a creditar por ficha, chaveado por id ou número
+        fichas = Ficha.objects.filter(is_active=True)
+        if dados.get('itens'):
+            por_id, por_numero = defaultdict(Decimal), defaultdict(Decimal)
+            for item in dados['itens']:
+                if 'ficha_id' in item:
+                    por_id[item['ficha_id']] += item['valor']
+                else:
+                    por_numero[item['numero']] += item['valor']
+            fichas = fichas.filter(Q(id__in=list(por_id)) | Q(numero__in=list(por_numero)))
+        else:
+            fichas = fichas.filter(numero__range=(dados['inicio'], dados['fim']))
+
+        # Bloqueia as fichas sempre na mesma ordem (id) para evitar deadlocks
+        travadas = list(
+            fichas.select_for_update().order_by('id').values_list('id', 'numero', 'saldo')
+        )
+
+        valores = {}
+        if dados.get('itens'):
+            encontrados_id = {ficha_id for ficha_id, _, _ in travadas}
+            encontrados_numero = {numero for _, numero, _ in travadas}
+            faltando = {
+                'ficha_id': sorted(set(por_id) - encontrados_id),
+                'numero': sorted(set(por_numero) - encontrados_numero),
+            }
+            if faltando['ficha_id'] or faltando['numero']:
+                return Response(
+                    {"detail": "Fichas não encontradas ou inativas.", "faltando": faltando},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            for ficha_id, numero, _ in travadas:
+                valores[ficha_id] = por_id.get(ficha_id, Decimal('0')) + por_numero.get(numero, Decimal('0'))
+        else:
+            if not travadas:
+                return Response(
+                    {"detail": "Nenhuma ficha ativa neste intervalo."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            valores = {ficha_id: dados['valor'] for ficha_id, _, _ in travadas}
+
+        # Um UPDATE por valor distinto, e não um save por ficha
+        ids_por_valor = defaultdict(list)
+        for ficha_id, valor in valores.items():
+            ids_por_valor[valor].append(ficha_id)
+        for valor, ids in ids_por_valor.items():
+            Ficha.objects.filter(id__in=ids).update(saldo=F('saldo') + valor)
+
+        Recarga.objects.bulk_create(
+            [
+                Recarga(
+                    ficha_id=ficha_id,
+                    produto=dados.get('produto'),
+                    caixa=dados['caixa'],
+                    valor=valores[ficha_id],
+                    observacoes=dados['observacoes'],
+                )
+                for ficha_id, _, _ in travadas
+            ],
+            batch_size=500,
+        )
+
+        resultado = []
+        for ficha_id, numero, saldo in travadas:
+            novo_saldo = saldo + valores[ficha_id]
+            # update() não passa por Ficha.save(); publica a mudança de saldo aqui
+            publicar_apos_commit(TOPICO_SALDO, dados_saldo(
+                ficha_id=ficha_id,
+                numero=numero,
+                saldo=novo_saldo,
+                saldo_anterior=saldo,
+            ))
+            resultado.append({'id': ficha_id, 'numero': numero, 'saldo': float(novo_saldo)})
+
+        return Response(
+            {
+                "quantidade": len(resultado),
+                "valor_total": float(sum(valores.values())),
+                "fichas": resultado,
+            },
+            status=status.HTTP_200_OK
+        )
     
 class ProdutoViewSet(viewsets.ModelViewSet):
-    queryset = Produto.objects.all().order_by(Lower('nome'))
+    queryset = com_total_reservas(Produto.objects.all()).order_by(Lower('nome'))
     serializer_class = ProdutoSerializer
     filter_backends = [SearchFilter]
     search_fields = ['nome']
     
     def get_queryset(self):
         """Retorna todos os produtos, incluindo os sem estoque"""
-        queryset = Produto.objects.all().order_by(Lower('nome'))
+        queryset = com_total_reservas(Produto.objects.all()).order_by(Lower('nome'))
         return queryset
 
 class MovimentacaoEstoqueViewSet(viewsets.ModelViewSet):
@@ -367,7 +634,7 @@ class MovimentacaoEstoqueViewSet(viewsets.ModelViewSet):
     serializer_class = MovimentacaoEstoqueSerializer
 
 class VendaViewSet(viewsets.ModelViewSet):
-    queryset = Venda.objects.all()
+    queryset = Venda.objects.select_related(*VENDA_RELACIONADOS)
     serializer_class = VendaSerializer
 
 
@@ -376,7 +643,9 @@ class ReservaProdutoViewSet(viewsets.ModelViewSet):
     serializer_class = ReservaProdutoSerializer
     
     def get_queryset(self):
-        queryset = ReservaProduto.objects.all()
+        queryset = ReservaProduto.objects.select_related('ficha__deleted_by_caixa').prefetch_related(
+            Prefetch('produto', queryset=com_total_reservas(Produto.objects.all()))
+        )
         ficha_id = self.request.query_params.get('ficha', None)
         status_filter = self.request.query_params.get('status', None)
         
@@ -438,6 +707,99 @@ class ReservaProdutoViewSet(viewsets.ModelViewSet):
             'quantidade_itens': len(itens)
         }, status=status.HTTP_200_OK)
     
+    @action(detail=False, methods=['post'], url_path='confirmar-lote')
+    @transaction.atomic
+    def confirmar_lote(self, request):
+        """Confirma ou finaliza várias reservas, convertendo-as em vendas.
+
+        Seleciona as reservas por `ids`, por `cpf` ou todas as pendentes de um
+        QR code (`qr_code`). `status` pode ser `confirmada` (padrão) ou
+        `finalizada`; `caixa_id` é opcional (padrão: caixa do produto).
+        Reservas sem estoque, saldo ou ficha são relatadas e não processadas.
+        """
+        ids = request.data.get('ids')
+        cpf = request.data.get('cpf')
+        qr_code = request.data.get('qr_code')
+        if sum(1 for criterio in (ids, cpf, qr_code) if criterio) != 1:
+            return Response(
+                {"detail": "Informe apenas um critério: ids, cpf ou qr_code."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        novo_status = request.data.get('status', 'confirmada')
+        if novo_status not in ('confirmada', 'finalizada'):
+            return Response(
+                {"detail": "status deve ser 'confirmada' ou 'finalizada'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        caixa = None
+        caixa_id = request.data.get('caixa_id')
+        if caixa_id:
+            caixa = Caixa.objects.filter(id=caixa_id).first()
+            if caixa is None:
+                return Response(
+                    {"detail": "Caixa não encontrado."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        reservas = ReservaProduto.objects.all()
+        if ids:
+            try:
+                ids = {int(reserva_id) for reserva_id in ids}
+            except (TypeError, ValueError):
+                return Response(
+                    {"detail": "ids deve ser uma lista de números."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            reservas = reservas.filter(id__in=ids)
+        elif cpf:
+            reservas = reservas.filter(cpf=cpf, status='pendente')
+        else:
+            reservas = reservas.filter(qr_code_reserva__codigo=qr_code, status='pendente')
+
+        # Bloqueia as reservas (em ordem de id) para que não sejam processadas duas vezes
+        reservas = list(
+            reservas.select_for_update(of=('self',)).select_related('produto', 'ficha').order_by('id')
+        )
+        if not reservas:
+            return Response(
+                {"detail": "Nenhuma reserva encontrada."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        itens = []
+        if ids:
+            encontrados = {reserva.id for reserva in reservas}
+            itens.extend(
+                {'reserva_id': reserva_id, 'status': 'rejeitada', 'motivo': 'Reserva não encontrada'}
+                for reserva_id in ids - encontrados
+            )
+        pendentes = []
+        for reserva in reservas:
+            if reserva.status == 'pendente':
+                pendentes.append(reserva)
+            else:
+                itens.append({'reserva_id': reserva.id, 'status': 'rejeitada', 'motivo': 'Reserva já processada'})
+
+        resumo = converter_reservas_em_vendas(pendentes, caixa=caixa, status=novo_status, parcial=True)
+        itens.extend(
+            {'reserva_id': reserva.id, 'status': novo_status, 'venda_id': venda.id}
+            for reserva, venda in resumo['convertidas']
+        )
+        itens.extend(
+            {'reserva_id': reserva.id, 'status': 'rejeitada', 'motivo': motivo}
+            for reserva, motivo in resumo['rejeitadas']
+        )
+        itens.sort(key=lambda item: item['reserva_id'])
+
+        return Response({
+            'processadas': resumo['reservas'],
+            'rejeitadas': len(itens) - resumo['reservas'],
+            'valor_total': float(resumo['valor_total']),
+            'itens': itens,
+        }, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['post'])
     @transaction.atomic
     def confirmar(self, request, pk=None):
@@ -0,0 +1,136 @@
+"""Streams server-sent events dos eventos do broker.
+
+Os streams exigem autenticação e ficam abertos por no máximo
+`EVENTOS_STREAM_DURACAO_SEGUNDOS`; ao fechar, o EventSource do navegador
+reconecta sozinho e retoma pelo `Last-Event-ID`. Cada conexão aberta ocupa uma
+thread sob WSGI, então em produção eles devem ser servidos pelo deploy ASGI.
+"""
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .autenticacao import PREFIXO_AUTORIZACAO, ler_token_caixa
+from .eventos import TOPICO_ALERTA_ESTOQUE, TOPICOS, formatar_sse, get_broker
+
+# Intervalo, em segundos, entre comentários de keep-alive no stream
+HEARTBEAT_SEGUNDOS = 15
+
+
+def _ultimo_id(request, broker):
+    """Id a partir do qual o cliente quer receber eventos.
+
+    Reconexões enviam `Last-Event-ID`; conexões novas recebem só eventos futuros.
+    """
+    valor = request.headers.get('Last-Event-ID') or request.GET.get('ultimo_id')
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return broker.ultimo_id
+
+
+def _autenticado(request):
+    """Sessão do Django ou token de caixa.
+
+    O token vem em `Authorization: Caixa <token>` ou em `?token=`, já que o
+    EventSource do navegador não envia cabeçalhos.
+    """
+    if request.user.is_authenticated:
+        return True
+    partes = request.headers.get('Authorization', '').split()
+    if len(partes) == 2 and partes[0].lower() == PREFIXO_AUTORIZACAO.lower():
+        token = partes[1]
+    else:
+        token = request.GET.get('token')
+    if not token:
+        return False
+    try:
+        ler_token_caixa(token)
+    except (signing.BadSignature, KeyError, TypeError):
+        return False
+    return True
+
+
+def _espera(limite):
+    return min(HEARTBEAT_SEGUNDOS, max(limite - time.monotonic(), 0))
+
+
+def stream_eventos(topicos, ultimo_id, broker=None):
+    broker = broker or get_broker()
+    limite = time.monotonic() + settings.EVENTOS_STREAM_DURACAO_SEGUNDOS
+    yield "retry: 3000\n\n"
+    while time.monotonic() < limite:
+        eventos = broker.aguardar(ultimo_id, topicos, timeout=_espera(limite))
+        if not eventos:
+            yield ": ping\n\n"
+            continue
+        for evento in eventos:
+            ultimo_id = evento.id
+            yield formatar_sse(evento)
+    # Só o id: o navegador guarda como Last-Event-ID e reconecta a partir dele
+    yield f"id: {ultimo_id}\n\n"
+
+
+async def stream_eventos_async(topicos, ultimo_id, broker=None):
+    """Versão assíncrona do stream: não ocupa uma thread por cliente sob ASGI."""
+    broker = broker or get_broker()
+    limite = time.monotonic() + settings.EVENTOS_STREAM_DURACAO_SEGUNDOS
+    yield "retry: 3000\n\n"
+    while time.monotonic() < limite:
+        eventos = await broker.aguardar_async(ultimo_id, topicos, timeout=_espera(limite))
+        if not eventos:
+            yield ": ping\n\n"
+            continue
+        for evento in eventos:
+            ultimo_id = evento.id
+            yield formatar_sse(evento)
+    yield f"id: {ultimo_id}\n\n"
+
+
+def resposta_sse(request, topicos):
+    if not _autenticado(request):
+        response = JsonResponse({"detail": "Autenticação necessária."}, status=401)
+        response['WWW-Authenticate'] = PREFIXO_AUTORIZACAO
+        return response
+
+    broker = get_broker()
+    ultimo_id = _ultimo_id(request, broker)
+    if isinstance(request, ASGIRequest):
+        conteudo = stream_eventos_async(topicos, ultimo_id, broker)
+    else:
+        conteudo = stream_eventos(topicos, ultimo_id, broker)
+
+    response = StreamingHttpResponse(conteudo, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+def eventos_stream(request):
+    """Stream SSE de mudanças (estoque, saldo, reserva, venda, alerta_estoque).
+
+    Os tópicos desejados são informados em `?topicos=estoque,saldo`; sem o
+    parâmetro, todos os tópicos são enviados.
+    """
+    topicos = {
+        topico.strip()
+        for topico in request.GET.get('topicos', '').split(',')
+        if topico.strip()
+    }
+    invalidos = topicos - TOPICOS
+    if invalidos:
+        return JsonResponse(
+            {"detail": f"Tópicos inválidos: {', '.join(sorted(invalidos))}.", "topicos": sorted(TOPICOS)},
+            status=400
+        )
+    return resposta_sse(request, topicos or TOPICOS)
+
+
+@require_GET
+def alertas_estoque_stream(request):
+    """Stream SSE de alertas de ruptura de estoque"""
+    return resposta_sse(request, {TOPICO_ALERTA_ESTOQUE})
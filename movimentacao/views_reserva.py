@@ -2,11 +2,13 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from rest_framework.utils.encoders import JSONEncoder
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 from django.utils.timezone import localtime
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Count, DecimalField, F, Prefetch, Sum
 from django.conf import settings
 from datetime import timedelta
 import uuid
@@ -14,7 +16,10 @@ import qrcode
 import base64
 from io import BytesIO
 
-from .models import QRCodeReserva, ReservaProduto, Produto
+from .disponibilidade import erro_periodo_qr, produtos_publicos_data, reservas_ativas_queryset
+from .impressao import lista_separacao_pdf
+from .models import QRCodeReserva, ReservaProduto, Produto, com_total_reservas
+from .qrcodes import aresolver_qr_code, resolver_qr_code
 from .serializers import (
     QRCodeReservaSerializer,
     ReservaProdutoSerializer,
@@ -28,7 +33,7 @@ class QRCodeReservaViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         return QRCodeReserva.objects.prefetch_related(
-            'produtos_disponiveis'
+            Prefetch('produtos_disponiveis', queryset=com_total_reservas(Produto.objects.all()))
         ).all()
     
     def update(self, request, *args, **kwargs):
@@ -107,6 +112,87 @@ class QRCodeReservaViewSet(viewsets.ModelViewSet):
         
         return Response(resultado, status=status.HTTP_200_OK)
     
+    @action(detail=True, methods=['get'])
+    def separacao(self, request, pk=None):
+        """Lista de separação: totais por produto e itens agrupados por cliente.
+
+        Considera reservas pendentes e confirmadas (ou os status em `status`,
+        separados por vírgula). Com `formato=pdf` retorna a versão impressa.
+        """
+        qr_code = self.get_object()
+        status_validos = dict(ReservaProduto.STATUS_CHOICES)
+        status_filtro = [s for s in request.query_params.get('status', 'pendente,confirmada').split(',') if s]
+        invalidos = [s for s in status_filtro if s not in status_validos]
+        if invalidos or not status_filtro:
+            return Response(
+                {'error': f"Status inválido. Use: {', '.join(status_validos)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        reservas = ReservaProduto.objects.filter(qr_code_reserva=qr_code, status__in=status_filtro)
+        valor_total = Sum(
+            F('quantidade') * F('produto__preco'),
+            output_field=DecimalField(max_digits=12, decimal_places=2)
+        )
+
+        # Agregação feita no banco: uma linha por produto e uma por cliente/produto
+        produtos = [
+            {
+                'produto_id': linha['produto_id'],
+                'produto': linha['produto__nome'],
+                'quantidade': linha['itens'],
+                'reservas': linha['reservas'],
+                'valor_total': float(linha['valor_total']),
+            }
+            for linha in reservas.values('produto_id', 'produto__nome')
+            .annotate(itens=Sum('quantidade'), reservas=Count('id'), valor_total=valor_total)
+            .order_by('produto__nome', 'produto_id')
+        ]
+
+        clientes = []
+        for linha in (
+            reservas.values('cpf', 'nome_completo', 'ficha__numero', 'produto_id', 'produto__nome')
+            .annotate(itens=Sum('quantidade'), valor_total=valor_total)
+            .order_by('nome_completo', 'cpf', 'ficha__numero', 'produto__nome')
+        ):
+            chave = (linha['cpf'], linha['nome_completo'], linha['ficha__numero'])
+            if not clientes or clientes[-1]['_chave'] != chave:
+                clientes.append({
+                    '_chave': chave,
+                    'cpf': linha['cpf'],
+                    'nome_completo': linha['nome_completo'],
+                    'ficha': linha['ficha__numero'],
+                    'itens': [],
+                    'quantidade': 0,
+                    'valor_total': 0.0,
+                })
+            cliente = clientes[-1]
+            cliente['itens'].append({
+                'produto_id': linha['produto_id'],
+                'produto': linha['produto__nome'],
+                'quantidade': linha['itens'],
+            })
+            cliente['quantidade'] += linha['itens']
+            cliente['valor_total'] += float(linha['valor_total'])
+        for cliente in clientes:
+            del cliente['_chave']
+
+        if request.query_params.get('formato') == 'pdf':
+            pdf = lista_separacao_pdf(qr_code.descricao or qr_code.codigo, produtos, clientes)
+            response = HttpResponse(pdf, content_type='application/pdf')
+            response['Content-Disposition'] = f'inline; filename="separacao-{qr_code.codigo}.pdf"'
+            return response
+
+        return Response({
+            'qr_code': qr_code.codigo,
+            'status': status_filtro,
+            'total_reservas': sum(produto['reservas'] for produto in produtos),
+            'total_itens': sum(produto['quantidade'] for produto in produtos),
+            'valor_total': sum(produto['valor_total'] for produto in produtos),
+            'produtos': produtos,
+            'clientes': clientes,
+        })
+
     @action(detail=True, methods=['post'])
     def gerar_pdf(self, request, pk=None):
         """Gera PDF do QR code para impressão"""
@@ -444,70 +530,64 @@ class QRCodeReservaViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+def _produtos_do_qr_queryset(qr):
+    return Produto.objects.filter(
+        id__in=qr.produtos_ids,
+        disponivel_reserva=True
+    ).order_by('id')
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def reserva_publica_produtos(request, qr_code):
     """Retorna produtos disponíveis para reserva via QR code"""
-    try:
-        qr = QRCodeReserva.objects.prefetch_related(
-            'produtos_disponiveis'
-        ).get(codigo=qr_code, ativo=True)
-        
-        agora = timezone.now()
-        
-        # Verifica se ainda não começou
-        if qr.data_inicio and qr.data_inicio > agora:
-            return Response(
-                {'error': 'QR code ainda não está ativo'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Verifica expiração
-        if qr.data_expiracao and qr.data_expiracao < agora:
-            return Response(
-                {'error': 'QR code expirado'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        produtos = list(qr.produtos_disponiveis.filter(disponivel_reserva=True))
-        produto_ids = [produto.id for produto in produtos]
-        reservas_por_produto = {
-            item['produto_id']: item['total'] or 0
-            for item in ReservaProduto.objects.filter(
-                produto_id__in=produto_ids,
-                status__in=['pendente', 'confirmada']
-            ).values('produto_id').annotate(total=Sum('quantidade'))
-        }
-        
-        produtos_data = []
-        for produto in produtos:
-            reservas_ativas = reservas_por_produto.get(produto.id, 0)
-            disponivel = produto.quantidade_reserva_disponivel - reservas_ativas
-            
-            produtos_data.append({
-                'id': produto.id,
-                'nome': produto.nome,
-                'preco': float(produto.preco),
-                'limite_reserva': produto.limite_reserva,
-                'disponivel': max(0, disponivel),
-                'categoria': produto.categoria,
-                'reservado': reservas_ativas,
-                'quantidade_reserva_disponivel': produto.quantidade_reserva_disponivel,
-            })
-        
-        return Response({
-            'qr_code': qr.codigo,
-            'descricao': qr.descricao,
-            'data_inicio': qr.data_inicio,
-            'data_expiracao': qr.data_expiracao,
-            'produtos': produtos_data
-        })
-    except QRCodeReserva.DoesNotExist:
+    qr = resolver_qr_code(qr_code)
+    if qr is None:
         return Response(
             {'error': 'QR code não encontrado ou inativo'},
             status=status.HTTP_404_NOT_FOUND
         )
 
+    erro = erro_periodo_qr(qr, timezone.now())
+    if erro:
+        return Response({'error': erro}, status=status.HTTP_400_BAD_REQUEST)
+    
+    produtos = list(_produtos_do_qr_queryset(qr))
+    reservas_por_produto = {
+        item['produto_id']: item['total'] or 0
+        for item in reservas_ativas_queryset([produto.id for produto in produtos])
+    }
+    
+    return Response(produtos_publicos_data(qr, produtos, reservas_por_produto))
+
+
+async def reserva_publica_produtos_async(request, qr_code):
+    """Versão assíncrona de `reserva_publica_produtos` (ORM assíncrono, para ASGI)"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    qr = await aresolver_qr_code(qr_code)
+    if qr is None:
+        return JsonResponse(
+            {'error': 'QR code não encontrado ou inativo'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    erro = erro_periodo_qr(qr, timezone.now())
+    if erro:
+        return JsonResponse({'error': erro}, status=status.HTTP_400_BAD_REQUEST)
+
+    produtos = [produto async for produto in _produtos_do_qr_queryset(qr)]
+    reservas_por_produto = {
+        item['produto_id']: item['total'] or 0
+        async for item in reservas_ativas_queryset([produto.id for produto in produtos])
+    }
+
+    return JsonResponse(
+        produtos_publicos_data(qr, produtos, reservas_por_produto),
+        encoder=JSONEncoder
+    )
+
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -526,39 +606,20 @@ def criar_reserva_publica(request):
     # Valida QR code se fornecido
     qr_code_obj = None
     if qr_code_str:
-        try:
-            qr_code_obj = QRCodeReserva.objects.prefetch_related(
-                'produtos_disponiveis'
-            ).get(codigo=qr_code_str, ativo=True)
-            agora = timezone.now()
-            
-            # Verifica se ainda não começou
-            if qr_code_obj.data_inicio and qr_code_obj.data_inicio > agora:
-                return Response(
-                    {'error': 'QR code ainda não está ativo'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Verifica expiração
-            if qr_code_obj.data_expiracao and qr_code_obj.data_expiracao < agora:
-                return Response(
-                    {'error': 'QR code expirado'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except QRCodeReserva.DoesNotExist:
+        qr_code_obj = resolver_qr_code(qr_code_str)
+        if qr_code_obj is None:
             return Response(
                 {'error': 'QR code inválido'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+        erro = erro_periodo_qr(qr_code_obj, timezone.now())
+        if erro:
+            return Response({'error': erro}, status=status.HTTP_400_BAD_REQUEST)
     
     produtos_ids = [produto_data['produto_id'] for produto_data in produtos_data]
-    produtos_permitidos_ids = set()
-    if qr_code_obj:
-        produtos_permitidos_ids = set(
-            qr_code_obj.produtos_disponiveis.filter(
-                disponivel_reserva=True
-            ).values_list('id', flat=True)
-        )
+    # disponivel_reserva já é exigido na consulta de produtos abaixo
+    produtos_permitidos_ids = qr_code_obj.produtos_ids if qr_code_obj else set()
 
     produtos = {
         produto.id: produto
@@ -635,7 +696,7 @@ def criar_reserva_publica(request):
             cpf=cpf,
             produto=produto,
             quantidade=quantidade,
-            qr_code_reserva=qr_code_obj,
+            qr_code_reserva_id=qr_code_obj.id if qr_code_obj else None,
             status='pendente'
         )
         
@@ -658,6 +719,15 @@ def criar_reserva_publica(request):
     }, status=status.HTTP_201_CREATED)
 
 
+def _reservas_por_cpf_queryset(cpf):
+    return ReservaProduto.objects.filter(
+        cpf=cpf,
+        status__in=['pendente', 'confirmada']
+    ).select_related('ficha__deleted_by_caixa').prefetch_related(
+        Prefetch('produto', queryset=com_total_reservas(Produto.objects.all()))
+    )
+
+
 @api_view(['GET'])
 def reservas_por_cpf(request):
     """Retorna reservas por CPF (para usuário verificar suas reservas)"""
@@ -668,7 +738,7 @@ def reservas_por_cpf(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    reservas = ReservaProduto.objects.filter(cpf=cpf, status__in=['pendente', 'confirmada'])
+    reservas = _reservas_por_cpf_queryset(cpf)
     serializer = ReservaProdutoSerializer(reservas, many=True)
     
     total = sum(float(r['preco_total']) for r in serializer.data)
@@ -677,3 +747,27 @@ def reservas_por_cpf(request):
         'reservas': serializer.data,
         'total': total
     })
+
+
+async def reservas_por_cpf_async(request):
+    """Versão assíncrona de `reservas_por_cpf` (ORM assíncrono, para ASGI)"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    cpf = request.GET.get('cpf')
+    if not cpf:
+        return JsonResponse(
+            {'error': 'CPF não fornecido'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    reservas = [reserva async for reserva in _reservas_por_cpf_queryset(cpf)]
+    # O serializer roda em thread: acessos a relacionamentos não carregados não quebram a view
+    dados = await sync_to_async(
+        lambda: ReservaProdutoSerializer(reservas, many=True).data
+    )()
+
+    return JsonResponse({
+        'reservas': dados,
+        'total': sum(float(r['preco_total']) for r in dados)
+    }, encoder=JSONEncoder)
@@ -0,0 +1,88 @@
+"""Utilitários para tarefas periódicas que rodam dentro do processo web."""
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem travas entre processos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_PROGRAMAS_GERENCIAMENTO = {'manage.py', 'django-admin', 'django-admin.py'}
+
+# Arquivos das travas obtidas, mantidos abertos enquanto o processo viver
+_travas = {}
+_travas_lock = threading.Lock()
+
+
+def processo_servidor():
+    """Indica se o processo atual serve requisições (e pode rodar agendadores).
+
+    Exclui comandos de gerenciamento (`manage.py`, `django-admin`,
+    `python -m django`), o processo pai do autoreload do `runserver` e
+    execuções sob o pytest.
+    """
+    programa = sys.argv[0] if sys.argv else ''
+    comando = sys.argv[1] if len(sys.argv) > 1 else ''
+    if (
+        os.path.basename(programa) in _PROGRAMAS_GERENCIAMENTO
+        or programa.endswith(os.path.join('django', '__main__.py'))
+    ):
+        if comando != 'runserver':
+            return False
+        return '--noreload' in sys.argv or os.environ.get('RUN_MAIN') == 'true'
+    return 'pytest' not in sys.modules
+
+
+def _caminho_trava(nome):
+    # Um arquivo por projeto, para instalações vizinhas não se bloquearem
+    projeto = hashlib.sha1(str(settings.BASE_DIR).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'{nome}-{projeto}.lock')
+
+
+def obter_trava_processo(nome):
+    """Tenta ficar com a trava `nome`, exclusiva entre os processos da máquina.
+
+    Retorna True se este processo a obteve (ou já a tinha). A trava é liberada
+    pelo sistema quando o processo termina, então outro worker assume a tarefa
+    depois de um reinício. Sem `fcntl` (Windows) sempre retorna True.
+    """
+    if fcntl is None:
+        return True
+    with _travas_lock:
+        if nome in _travas:
+            return True
+        arquivo = open(_caminho_trava(nome), 'a')
+        try:
+            fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo.close()
+            return False
+        _travas[nome] = arquivo
+        return True
+
+
+def iniciar_thread_periodica(nome, tarefa, intervalo):
+    """Executa `tarefa` a cada `intervalo` segundos numa thread daemon."""
+    def loop():
+        while True:
+            try:
+                tarefa()
+            except Exception:
+                logger.exception("Falha na tarefa periódica %s", nome)
+            finally:
+                close_old_connections()
+            time.sleep(intervalo)
+
+    thread = threading.Thread(target=loop, name=nome, daemon=True)
+    thread.start()
+    return thread
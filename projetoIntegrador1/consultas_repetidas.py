@@ -0,0 +1,165 @@
+"""Detector de consultas repetidas (N+1).
+
+Agrupa as consultas SQL pela forma (o SQL com placeholders, com listas de
+`IN (...)` de qualquer tamanho tratadas como iguais; inserções em lote e
+`executemany` ficam de fora) e aponta as formas
+executadas mais de `limite` vezes, com a pilha do código do projeto que fez
+a segunda execução, que costuma ser o acesso de dentro do laço.
+
+- `ConsultasRepetidasMiddleware` (WSGI ou ASGI) verifica cada requisição
+  quando `CONSULTAS_REPETIDAS_LIMITE` > 0: registra um aviso no log ou, com
+  `CONSULTAS_REPETIDAS_ERRO`, levanta `ConsultasRepetidas`.
+- `ExecutorTestes` (o `TEST_RUNNER` do projeto) liga o middleware em modo
+  erro com `CONSULTAS_REPETIDAS_LIMITE_TESTES`, então toda requisição feita
+  pelos testes falha se repetir consultas.
+- `sem_consultas_repetidas()` faz a mesma verificação em volta de qualquer
+  trecho de código.
+"""
+import logging
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from .perfilamento import envolver_consultas, envolver_consultas_async
+
+logger = logging.getLogger(__name__)
+
+_LISTA_IN = re.compile(r'\((?:%s, )+%s\)')
+# INSERT de várias linhas (bulk_create em lotes)
+_VARIAS_LINHAS = re.compile(r'\bVALUES \([^)]*\), \(')
+# Quadros da pilha mostrados no relatório
+QUADROS_NA_PILHA = 8
+
+
+class ConsultasRepetidas(AssertionError):
+    pass
+
+
+def forma_consulta(sql):
+    return _LISTA_IN.sub('(%s, ...)', sql)
+
+
+def _pilha_do_projeto():
+    raiz = str(settings.BASE_DIR)
+    quadros = [
+        quadro for quadro in traceback.extract_stack()[:-2]
+        if quadro.filename.startswith(raiz)
+        and 'site-packages' not in quadro.filename
+        and os.path.basename(quadro.filename) != 'consultas_repetidas.py'
+    ]
+    return ''.join(traceback.format_list(quadros[-QUADROS_NA_PILHA:]))
+
+
+class DetectorConsultas:
+    """`execute_wrapper` que conta as consultas por forma."""
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.contagem = Counter()
+        self.pilhas = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # Operações em lote repetem a mesma forma por lote, não por linha
+        if many or _VARIAS_LINHAS.search(sql):
+            return execute(sql, params, many, context)
+        forma = forma_consulta(sql)
+        self.contagem[forma] += 1
+        if self.contagem[forma] == 2:
+            self.pilhas[forma] = _pilha_do_projeto()
+        return execute(sql, params, many, context)
+
+    def repetidas(self):
+        return [
+            (forma, vezes, self.pilhas.get(forma, ''))
+            for forma, vezes in self.contagem.most_common()
+            if vezes > self.limite
+        ]
+
+    def relatorio(self):
+        partes = [
+            f"{vezes}x (limite {self.limite}): {forma}\n{pilha}"
+            for forma, vezes, pilha in self.repetidas()
+        ]
+        return 'Consultas repetidas (N+1):\n' + '\n'.join(partes)
+
+
+@contextmanager
+def detectar_consultas(limite=None):
+    """Registra as consultas de todos os bancos no `DetectorConsultas` devolvido."""
+    detector = DetectorConsultas(settings.CONSULTAS_REPETIDAS_LIMITE if limite is None else limite)
+    with envolver_consultas(detector):
+        yield detector
+
+
+@contextmanager
+def sem_consultas_repetidas(limite=None):
+    """Levanta `ConsultasRepetidas` se o bloco repetir alguma consulta além do limite."""
+    if limite is None:
+        limite = settings.CONSULTAS_REPETIDAS_LIMITE or settings.CONSULTAS_REPETIDAS_LIMITE_TESTES
+    with detectar_consultas(limite) as detector:
+        yield detector
+    if detector.repetidas():
+        raise ConsultasRepetidas(detector.relatorio())
+
+
+class ConsultasRepetidasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.CONSULTAS_REPETIDAS_LIMITE <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with detectar_consultas() as detector:
+            response = self.get_response(request)
+        self._verificar(request, detector)
+        return response
+
+    async def __acall__(self, request):
+        detector = DetectorConsultas(settings.CONSULTAS_REPETIDAS_LIMITE)
+        async with envolver_consultas_async(detector):
+            response = await self.get_response(request)
+        self._verificar(request, detector)
+        return response
+
+    def _verificar(self, request, detector):
+        if detector.repetidas():
+            mensagem = f"{request.method} {request.get_full_path()}\n{detector.relatorio()}"
+            if settings.CONSULTAS_REPETIDAS_ERRO:
+                raise ConsultasRepetidas(mensagem)
+            logger.warning(mensagem)
+
+
+class ExecutorTestes(DiscoverRunner):
+    """Executor de testes que falha requisições com consultas repetidas."""
+
+    _configuracao = None
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        if settings.CONSULTAS_REPETIDAS_LIMITE_TESTES > 0:
+            self._configuracao = override_settings(
+                CONSULTAS_REPETIDAS_LIMITE=settings.CONSULTAS_REPETIDAS_LIMITE_TESTES,
+                CONSULTAS_REPETIDAS_ERRO=True,
+            )
+            self._configuracao.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        if self._configuracao is not None:
+            self._configuracao.disable()
+            self._configuracao = None
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,221 @@
+"""Métricas no formato texto do Prometheus, sem dependências externas.
+
+Com `METRICAS_ATIVAS`, `MetricasMiddleware` registra a latência e a quantidade
+de consultas SQL de cada requisição por view (nome da rota; nas viewsets do
+DRF ele já inclui a ação, ex. `ficha-recarga-lote`). `medir_secao` mede as
+seções com `select_for_update` dos models, e os eventos publicados alimentam
+os contadores de negócio. Tudo fica exposto em `/metricas/`, protegido por
+`METRICAS_TOKEN` quando definido.
+
+Os valores ficam na memória de cada processo; com vários workers, cada um
+responde pelos próprios números. O middleware atende WSGI e ASGI.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .perfilamento import RegistroConsultas, envolver_consultas, envolver_consultas_async
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_metricas = []
+
+
+def _rotulos(nomes, valores):
+    if not nomes:
+        return ''
+    pares = ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for nome, valor in zip(nomes, valores)
+    )
+    return '{' + pares + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+        _metricas.append(self)
+
+    def incrementar(self, valor=1, **rotulos):
+        chave = tuple(rotulos[nome] for nome in self.rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def amostras(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for chave, valor in valores:
+            yield f'{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}'
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nome, descricao, rotulos=(), buckets=BUCKETS_LATENCIA):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(buckets)
+        # chave -> [contagens por bucket (não cumulativas), soma, total]
+        self._valores = {}
+        self._lock = threading.Lock()
+        _metricas.append(self)
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(rotulos[nome] for nome in self.rotulos)
+        with self._lock:
+            dados = self._valores.get(chave)
+            if dados is None:
+                dados = self._valores[chave] = [[0] * len(self.buckets), 0, 0]
+            for indice, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    dados[0][indice] += 1
+                    break
+            dados[1] += valor
+            dados[2] += 1
+
+    def amostras(self):
+        with self._lock:
+            valores = sorted((chave, [list(dados[0]), dados[1], dados[2]]) for chave, dados in self._valores.items())
+        nomes_bucket = self.rotulos + ('le',)
+        for chave, (contagens, soma, total) in valores:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                rotulos = _rotulos(nomes_bucket, chave + (_numero(limite),))
+                yield f'{self.nome}_bucket{rotulos} {acumulado}'
+            yield f'{self.nome}_bucket{_rotulos(nomes_bucket, chave + ("+Inf",))} {total}'
+            yield f'{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}'
+            yield f'{self.nome}_count{_rotulos(self.rotulos, chave)} {total}'
+
+
+REQUISICOES = Contador(
+    'http_requisicoes_total', 'Requisições atendidas.', ('view', 'metodo', 'status'),
+)
+LATENCIA = Histograma(
+    'http_requisicao_duracao_segundos', 'Duração das requisições.', ('view', 'metodo'),
+)
+CONSULTAS = Histograma(
+    'http_requisicao_consultas_sql', 'Consultas SQL por requisição.', ('view',), BUCKETS_CONSULTAS,
+)
+TEMPO_BANCO = Contador(
+    'http_requisicao_banco_segundos_total', 'Tempo gasto em consultas SQL.', ('view',),
+)
+ESPERA_BLOQUEIO = Histograma(
+    'secao_bloqueio_espera_segundos',
+    'Tempo até obter os bloqueios (início da transação e select_for_update).',
+    ('secao',),
+)
+DURACAO_SECAO = Histograma(
+    'secao_transacao_duracao_segundos', 'Duração das seções bloqueadas, incluindo o commit.', ('secao',),
+)
+EVENTOS = Contador('eventos_publicados_total', 'Eventos publicados no broker.', ('topico',))
+VENDAS = Contador('vendas_total', 'Vendas registradas.')
+VALOR_VENDIDO = Contador('vendas_valor_total', 'Valor vendido, em reais.')
+RESERVAS_CRIADAS = Contador('reservas_criadas_total', 'Reservas criadas.')
+
+
+class _Secao:
+    def __init__(self, nome):
+        self.nome = nome
+        self.inicio = time.perf_counter()
+        self._bloqueado = False
+
+    def bloqueado(self):
+        """Marca o fim da espera pelos bloqueios da seção."""
+        if settings.METRICAS_ATIVAS and not self._bloqueado:
+            self._bloqueado = True
+            ESPERA_BLOQUEIO.observar(time.perf_counter() - self.inicio, secao=self.nome)
+
+
+@contextmanager
+def medir_secao(nome):
+    """Mede uma seção com `select_for_update`; use por fora do `transaction.atomic()`."""
+    secao = _Secao(nome)
+    try:
+        yield secao
+    finally:
+        if settings.METRICAS_ATIVAS:
+            DURACAO_SECAO.observar(time.perf_counter() - secao.inicio, secao=nome)
+
+
+def _nome_view(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return '<nao_resolvida>'
+    return resolver_match.view_name or resolver_match.route
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICAS_ATIVAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with envolver_consultas(registro):
+            response = self.get_response(request)
+        self._registrar(request, response, registro, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        async with envolver_consultas_async(registro):
+            response = await self.get_response(request)
+        self._registrar(request, response, registro, time.perf_counter() - inicio)
+        return response
+
+    def _registrar(self, request, response, registro, duracao):
+        view = _nome_view(request)
+        if view != 'metricas':
+            REQUISICOES.incrementar(view=view, metodo=request.method, status=response.status_code)
+            LATENCIA.observar(duracao, view=view, metodo=request.method)
+            CONSULTAS.observar(len(registro.consultas), view=view)
+            TEMPO_BANCO.incrementar(registro.tempo, view=view)
+
+
+def gerar_texto():
+    linhas = []
+    for metrica in _metricas:
+        linhas.append(f'# HELP {metrica.nome} {metrica.descricao}')
+        linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+        linhas.extend(metrica.amostras())
+    return '\n'.join(linhas) + '\n'
+
+
+def metricas(request):
+    """Exposição no formato texto do Prometheus."""
+    if not settings.METRICAS_ATIVAS:
+        raise Http404
+    if settings.METRICAS_TOKEN and not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {settings.METRICAS_TOKEN}'
+    ):
+        return HttpResponse('Não autorizado.\n', status=401, content_type='text/plain; charset=utf-8')
+    return HttpResponse(gerar_texto(), content_type='text/plain; version=0.0.4; charset=utf-8')
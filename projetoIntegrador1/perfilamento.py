@@ -0,0 +1,156 @@
+"""Perfilamento leve por requisição.
+
+`PerfilamentoMiddleware` mede, para uma fração das requisições
+(`PERFILAMENTO_AMOSTRAGEM`), a quantidade de consultas SQL, o tempo gasto no
+banco, o tempo total e, com `PERFILAMENTO_MEMORIA`, o pico de memória alocada
+(tracemalloc). Os números vão no cabeçalho `Server-Timing`
+(`PERFILAMENTO_SERVER_TIMING`), visível na aba Network do navegador, e
+requisições mais lentas que `PERFILAMENTO_LENTO_MS` são registradas no log
+`projetoIntegrador1.perfilamento` junto com as consultas mais demoradas.
+
+Sem `PERFILAMENTO_ATIVO` o middleware se remove da pilha na inicialização.
+Funciona tanto em WSGI quanto em ASGI: no caminho assíncrono as consultas são
+registradas na thread em que o ORM roda (a do `sync_to_async` da requisição).
+"""
+import logging
+import random
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Consultas mostradas no log de requisições lentas
+CONSULTAS_NO_LOG = 5
+
+
+class RegistroConsultas:
+    """`execute_wrapper` que acumula duração e SQL das consultas da requisição."""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((time.perf_counter() - inicio, context['connection'].alias, sql))
+
+    @property
+    def tempo(self):
+        return sum(duracao for duracao, _, _ in self.consultas)
+
+
+@contextmanager
+def envolver_consultas(wrapper):
+    """Instala o `execute_wrapper` em todas as conexões da thread atual."""
+    with ExitStack() as pilha:
+        for conexao in connections.all():
+            pilha.enter_context(conexao.execute_wrapper(wrapper))
+        yield
+
+
+@asynccontextmanager
+async def envolver_consultas_async(wrapper):
+    """`envolver_consultas` para código assíncrono.
+
+    As conexões são por thread e o ORM roda na thread do `sync_to_async`
+    (uma só por requisição ASGI), então o wrapper é instalado lá.
+    """
+    pilha = ExitStack()
+    await sync_to_async(pilha.enter_context)(envolver_consultas(wrapper))
+    try:
+        yield
+    finally:
+        await sync_to_async(pilha.close)()
+
+
+class PerfilamentoMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERFILAMENTO_ATIVO:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PERFILAMENTO_AMOSTRAGEM:
+            return self.get_response(request)
+
+        registro = RegistroConsultas()
+        inicio = self._iniciar()
+        with envolver_consultas(registro):
+            response = self.get_response(request)
+        return self._concluir(request, response, registro, inicio)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PERFILAMENTO_AMOSTRAGEM:
+            return await self.get_response(request)
+
+        registro = RegistroConsultas()
+        inicio = self._iniciar()
+        async with envolver_consultas_async(registro):
+            response = await self.get_response(request)
+        return self._concluir(request, response, registro, inicio)
+
+    def _iniciar(self):
+        if settings.PERFILAMENTO_MEMORIA:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # O pico é global ao processo: com várias threads é aproximado
+            tracemalloc.reset_peak()
+        return time.perf_counter()
+
+    def _concluir(self, request, response, registro, inicio):
+        total = time.perf_counter() - inicio
+        pico = tracemalloc.get_traced_memory()[1] if settings.PERFILAMENTO_MEMORIA else None
+
+        banco = registro.tempo
+        if settings.PERFILAMENTO_SERVER_TIMING:
+            metricas = [
+                f'db;desc="SQL ({len(registro.consultas)})";dur={banco * 1000:.1f}',
+                f'app;desc="Python";dur={(total - banco) * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ]
+            if pico is not None:
+                metricas.append(f'mem;desc="pico {pico / 1024:.0f} KiB"')
+            response['Server-Timing'] = ', '.join(metricas)
+
+        if total * 1000 >= settings.PERFILAMENTO_LENTO_MS:
+            self._registrar_lenta(request, response, registro, total, pico)
+        return response
+
+    def _registrar_lenta(self, request, response, registro, total, pico):
+        repetidas = Counter(sql for _, _, sql in registro.consultas)
+        linhas = [
+            f"  {duracao * 1000:.1f} ms [{alias}] {sql}"
+            for duracao, alias, sql in sorted(registro.consultas, reverse=True)[:CONSULTAS_NO_LOG]
+        ]
+        linhas += [
+            f"  {vezes}x repetida: {sql}"
+            for sql, vezes in repetidas.most_common()
+            if vezes > 1
+        ][:CONSULTAS_NO_LOG]
+        logger.warning(
+            "Requisição lenta: %s %s -> %s em %.1f ms (SQL: %d consultas, %.1f ms%s)\n%s",
+            request.method,
+            request.get_full_path(),
+            response.status_code,
+            total * 1000,
+            len(registro.consultas),
+            registro.tempo * 1000,
+            f", pico de memória {pico / 1024:.0f} KiB" if pico is not None else '',
+            '\n'.join(linhas),
+        )
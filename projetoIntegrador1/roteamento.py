@@ -0,0 +1,65 @@
+"""Roteamento de leituras de relatórios para um banco separado.
+
+Só as views de relatório (marcadas com `leitura_relatorios`) leem do alias
+`relatorios`, quando ele está configurado em `DATABASES`. Todo o resto,
+incluindo escritas, `select_for_update` e qualquer leitura dentro de um
+bloco atômico, continua no banco `default`.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ALIAS_RELATORIOS = 'relatorios'
+
+_alias_leitura = ContextVar('alias_leitura', default=None)
+
+
+@contextmanager
+def _usar_alias(alias):
+    token = _alias_leitura.set(alias)
+    try:
+        yield
+    finally:
+        _alias_leitura.reset(token)
+
+
+def banco_relatorios():
+    """Contexto em que as leituras vão para o banco de relatórios (se houver)."""
+    alias = ALIAS_RELATORIOS if ALIAS_RELATORIOS in settings.DATABASES else None
+    return _usar_alias(alias)
+
+
+def banco_principal():
+    """Contexto que força as leituras de volta ao banco principal."""
+    return _usar_alias(None)
+
+
+def leitura_relatorios(view):
+    """Decorator para views de relatório somente leitura."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with banco_relatorios():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class RoteadorRelatorios:
+    def db_for_read(self, model, **hints):
+        alias = _alias_leitura.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Os dois aliases contêm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # O banco de relatórios é uma réplica; o esquema vem do principal
+        return db != ALIAS_RELATORIOS
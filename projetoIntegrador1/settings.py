@@ -45,6 +45,90 @@ FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173').rstrip('/')
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123')
 
+# Default window, in days, scanned by the dashboard when no period is given.
+DASHBOARD_JANELA_DIAS = int(os.getenv('DASHBOARD_JANELA_DIAS', '7'))
+
+# Seconds dashboard summaries (e.g. reservation insights) stay cached; 0 disables.
+DASHBOARD_CACHE_SEGUNDOS = int(os.getenv('DASHBOARD_CACHE_SEGUNDOS', '30'))
+
+# Forecast snapshots: age after which a dashboard request triggers a background
+# refresh (the stale snapshot is still served), scheduler refresh interval,
+# number of new sales that forces a refresh, and whether the in-process
+# scheduler thread is started with the app (web processes only, one per
+# machine; `manage.py gerar_previsoes --loop` is the alternative).
+PREVISOES_MAX_IDADE_SEGUNDOS = int(os.getenv('PREVISOES_MAX_IDADE_SEGUNDOS', '60'))
+PREVISOES_INTERVALO_SEGUNDOS = int(os.getenv('PREVISOES_INTERVALO_SEGUNDOS', '60'))
+PREVISOES_NOVAS_VENDAS = int(os.getenv('PREVISOES_NOVAS_VENDAS', '50'))
+PREVISOES_AGENDADOR = os.getenv('PREVISOES_AGENDADOR', 'False').lower() in ('true', '1', 't')
+
+# Days of recent sales used to estimate the sale rate for stock-cover alerts.
+ALERTA_ESTOQUE_JANELA_DIAS = int(os.getenv('ALERTA_ESTOQUE_JANELA_DIAS', '7'))
+
+# Event broker behind the server-sent events streams. The default keeps events
+# in memory per process; set a dotted path to a BrokerBase subclass to share
+# events across workers.
+EVENTOS_BROKER = os.getenv('EVENTOS_BROKER', 'movimentacao.eventos.BrokerLocal')
+
+# Maximum lifetime, in seconds, of one server-sent events connection. The
+# browser's EventSource reconnects on its own and resumes from Last-Event-ID.
+EVENTOS_STREAM_DURACAO_SEGUNDOS = int(os.getenv('EVENTOS_STREAM_DURACAO_SEGUNDOS', '300'))
+
+# Reservation holds: default minutes a pending reservation without a ficha is
+# kept before the sweeper cancels it (0 = never; QR codes can override it),
+# sweep interval, and whether the in-process sweeper thread is started.
+RESERVAS_RETENCAO_MINUTOS = int(os.getenv('RESERVAS_RETENCAO_MINUTOS', '0'))
+RESERVAS_EXPIRACAO_INTERVALO_SEGUNDOS = int(os.getenv('RESERVAS_EXPIRACAO_INTERVALO_SEGUNDOS', '60'))
+RESERVAS_EXPIRACAO_AGENDADOR = os.getenv('RESERVAS_EXPIRACAO_AGENDADOR', 'False').lower() in ('true', '1', 't')
+
+# Seconds the public reservation views keep a resolved QR code (metadata and
+# allowed product ids) in process memory, and how many codes are kept at most
+# (least recently used first out; unknown codes are never cached). Edits clear
+# it immediately locally.
+QR_CODES_CACHE_SEGUNDOS = int(os.getenv('QR_CODES_CACHE_SEGUNDOS', '30'))
+QR_CODES_CACHE_MAXIMO = int(os.getenv('QR_CODES_CACHE_MAXIMO', '256'))
+
+# Static publishing of the public QR availability JSON: when enabled, each
+# available QR code's reservas-publicas/<qr>/produtos/ payload is written to
+# RESERVAS_PUBLICAS_ESTATICAS_DIR/<codigo>.json for the web server to serve
+# at RESERVAS_PUBLICAS_ESTATICAS_URL, refreshed on change and on a timer.
+RESERVAS_PUBLICAS_ESTATICAS = os.getenv('RESERVAS_PUBLICAS_ESTATICAS', 'False').lower() in ('true', '1', 't')
+RESERVAS_PUBLICAS_ESTATICAS_DIR = os.getenv(
+    'RESERVAS_PUBLICAS_ESTATICAS_DIR', os.path.join(BASE_DIR, 'estatico', 'reservas-publicas')
+)
+RESERVAS_PUBLICAS_ESTATICAS_URL = os.getenv('RESERVAS_PUBLICAS_ESTATICAS_URL', '/estatico/reservas-publicas/')
+RESERVAS_PUBLICAS_ESTATICAS_INTERVALO_SEGUNDOS = int(os.getenv('RESERVAS_PUBLICAS_ESTATICAS_INTERVALO_SEGUNDOS', '15'))
+
+# Per-request profiling (projetoIntegrador1/perfilamento.py): fraction of
+# requests sampled, Server-Timing header, slow-request log threshold and
+# tracemalloc peak tracking (adds overhead; keep off in production).
+PERFILAMENTO_ATIVO = os.getenv('PERFILAMENTO_ATIVO', 'False').lower() in ('true', '1', 't')
+PERFILAMENTO_AMOSTRAGEM = float(os.getenv('PERFILAMENTO_AMOSTRAGEM', '1.0'))
+PERFILAMENTO_SERVER_TIMING = os.getenv('PERFILAMENTO_SERVER_TIMING', 'True').lower() in ('true', '1', 't')
+PERFILAMENTO_LENTO_MS = int(os.getenv('PERFILAMENTO_LENTO_MS', '500'))
+PERFILAMENTO_MEMORIA = os.getenv('PERFILAMENTO_MEMORIA', 'False').lower() in ('true', '1', 't')
+
+# Prometheus text-format metrics at /metricas/ (projetoIntegrador1/metricas.py):
+# per-view latency and query counts, lock waits in the stock/sale sections and
+# business counters. Set METRICAS_TOKEN to require "Authorization: Bearer <token>".
+METRICAS_ATIVAS = os.getenv('METRICAS_ATIVAS', 'False').lower() in ('true', '1', 't')
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN', '')
+
+# N+1 detection (projetoIntegrador1/consultas_repetidas.py): requests that run
+# the same query shape more than CONSULTAS_REPETIDAS_LIMITE times are logged
+# (or raise, with CONSULTAS_REPETIDAS_ERRO); 0 disables it. The test runner
+# always raises, using CONSULTAS_REPETIDAS_LIMITE_TESTES.
+CONSULTAS_REPETIDAS_LIMITE = int(os.getenv('CONSULTAS_REPETIDAS_LIMITE', '0'))
+CONSULTAS_REPETIDAS_ERRO = os.getenv('CONSULTAS_REPETIDAS_ERRO', 'False').lower() in ('true', '1', 't')
+CONSULTAS_REPETIDAS_LIMITE_TESTES = int(os.getenv('CONSULTAS_REPETIDAS_LIMITE_TESTES', '3'))
+TEST_RUNNER = 'projetoIntegrador1.consultas_repetidas.ExecutorTestes'
+
+# Lifetime, in seconds, of the signed session tokens issued on caixa login.
+CAIXA_TOKEN_VALIDADE_SEGUNDOS = int(os.getenv('CAIXA_TOKEN_VALIDADE_SEGUNDOS', str(12 * 60 * 60)))
+# Seconds a caixa's token revocations (stored in the database) stay cached.
+# With a shared cache backend revocations apply at once in every worker;
+# with the default per-process cache, other workers see them after this delay.
+CAIXA_REVOGACOES_CACHE_SEGUNDOS = int(os.getenv('CAIXA_REVOGACOES_CACHE_SEGUNDOS', '30'))
+
 # Allow every origin only in local DEBUG mode unless explicitly overridden.
 CORS_ALLOW_ALL_ORIGINS = os.getenv(
     'CORS_ALLOW_ALL_ORIGINS',
@@ -79,10 +163,14 @@ INSTALLED_APPS = [
     'corsheaders',
     'rest_framework',
     'movimentacao',
-    'publico'
+    'publico',
+    'dashboard',
 ]
 
 MIDDLEWARE = [
+    'projetoIntegrador1.metricas.MetricasMiddleware',
+    'projetoIntegrador1.perfilamento.PerfilamentoMiddleware',
+    'projetoIntegrador1.consultas_repetidas.ConsultasRepetidasMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -112,6 +200,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'projetoIntegrador1.wsgi.application'
+ASGI_APPLICATION = 'projetoIntegrador1.asgi.application'
+
+# Serve the read-only public reservation endpoints with async views. Enable it
+# when running under ASGI (see PYTHONANYWHERE_SETUP.md); under WSGI the sync
+# views are cheaper.
+VIEWS_PUBLICAS_ASYNC = os.getenv('VIEWS_PUBLICAS_ASYNC', 'False').lower() in ('true', '1', 't')
 
 
 # Database
@@ -135,7 +229,7 @@ if DATABASE_URL:
         )
     }
 else:
-    # Local SQLite (development)
+    # Local SQLite (development and small single-server deployments)
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -143,6 +237,48 @@ else:
         }
     }
 
+# Optional read-only database for reporting views (dashboard, financial
+# statement, ficha history, exports). DATABASE_RELATORIOS_URL points at a
+# replica; RELATORIOS_SQLITE_SOMENTE_LEITURA=True opens a second, read-only
+# connection to the local SQLite file instead, which WAL lets run alongside
+# cashier writes. Without either, reports read from the default database.
+DATABASE_RELATORIOS_URL = os.getenv('DATABASE_RELATORIOS_URL', None)
+RELATORIOS_SQLITE_SOMENTE_LEITURA = os.getenv(
+    'RELATORIOS_SQLITE_SOMENTE_LEITURA', 'False'
+).lower() in ('true', '1', 't')
+
+if DATABASE_RELATORIOS_URL:
+    DATABASES['relatorios'] = dj_database_url.parse(
+        DATABASE_RELATORIOS_URL,
+        conn_max_age=1800,
+    )
+elif RELATORIOS_SQLITE_SOMENTE_LEITURA and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['relatorios'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{DATABASES['default']['NAME']}?mode=ro",
+    }
+
+if 'relatorios' in DATABASES:
+    # Tests run against a single database
+    DATABASES['relatorios']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['projetoIntegrador1.roteamento.RoteadorRelatorios']
+
+# SQLite profile: WAL, busy_timeout, synchronous=NORMAL, mmap/cache sizes and
+# BEGIN IMMEDIATE for atomic blocks (see projetoIntegrador1/sqlite/base.py).
+# Set SQLITE_PERFIL=False to fall back to Django's stock SQLite backend.
+SQLITE_PERFIL = os.getenv('SQLITE_PERFIL', 'True').lower() in ('true', '1', 't')
+
+for _banco in DATABASES.values():
+    if SQLITE_PERFIL and _banco['ENGINE'] == 'django.db.backends.sqlite3':
+        _banco['ENGINE'] = 'projetoIntegrador1.sqlite'
+        _banco['OPTIONS'] = {
+            **_banco.get('OPTIONS', {}),
+            'pragmas': {
+                'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+            },
+        }
+
 
 
 # Password validation
@@ -194,3 +330,13 @@ if not DEBUG:
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Caixa session tokens (Authorization: Caixa <token>) are accepted alongside
+# DRF's default authentication classes; permissions are unchanged.
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'movimentacao.autenticacao.CaixaTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
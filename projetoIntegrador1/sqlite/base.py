@@ -0,0 +1,65 @@
+"""Backend SQLite com perfil para produção em pequenos deploys.
+
+Igual ao backend `django.db.backends.sqlite3`, mas:
+
+* aplica PRAGMAs de concorrência e desempenho a cada nova conexão
+  (WAL, busy_timeout, synchronous=NORMAL, mmap e cache);
+* abre as transações de `transaction.atomic` com `BEGIN IMMEDIATE`, de modo
+  que o lock de escrita é obtido (ou aguardado via busy_timeout) logo no
+  início, em vez de falhar com "database is locked" na primeira escrita.
+
+Os PRAGMAs podem ser ajustados em `OPTIONS['pragmas']` e o modo de início
+da transação em `OPTIONS['transaction_mode']` (DEFERRED, IMMEDIATE ou
+EXCLUSIVE).
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+
+PRAGMAS_PADRAO = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 128 * 1024 * 1024,
+    # Negativo: tamanho em KiB
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+MODOS_TRANSACAO = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        opcoes = self.settings_dict['OPTIONS']
+        self.pragmas = {**PRAGMAS_PADRAO, **opcoes.get('pragmas', {})}
+        self.transaction_mode = opcoes.get('transaction_mode', 'IMMEDIATE').upper()
+        if self.transaction_mode not in MODOS_TRANSACAO:
+            raise ImproperlyConfigured(
+                f"transaction_mode deve ser um de {', '.join(MODOS_TRANSACAO)}."
+            )
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
+
+
+def aplicar_pragmas(sender, connection, **kwargs):
+    if not isinstance(connection, DatabaseWrapper):
+        return
+    somente_leitura = 'mode=ro' in str(connection.settings_dict['NAME'])
+    with connection.cursor() as cursor:
+        for nome, valor in connection.pragmas.items():
+            if somente_leitura and nome == 'journal_mode':
+                # Conexão somente leitura não pode mudar o journal do arquivo
+                continue
+            cursor.execute(f'PRAGMA {nome} = {valor}')
+
+
+connection_created.connect(aplicar_pragmas, dispatch_uid='projetoIntegrador1.sqlite.aplicar_pragmas')
@@ -19,13 +19,21 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from projetoIntegrador1.metricas import metricas
+
 urlpatterns = [
     path('movimentacao/', include('movimentacao.urls')),
     path('dashboard/', include('dashboard.urls')),
     path('admin/', admin.site.urls),
+    path('metricas/', metricas, name='metricas'),
 ]
 
 # Serve static and media files in development
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    if settings.RESERVAS_PUBLICAS_ESTATICAS:
+        urlpatterns += static(
+            settings.RESERVAS_PUBLICAS_ESTATICAS_URL,
+            document_root=settings.RESERVAS_PUBLICAS_ESTATICAS_DIR,
+        )